@@ -38,6 +38,9 @@ def create_app():
 
     app.config['SQLALCHEMY_DATABASE_URI'] = database_url
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    if database_url.startswith('sqlite'):
+        # Concurrent writers wait for the lock instead of failing at once
+        app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {'connect_args': {'timeout': 30}}
     app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file upload
     app.config['UPLOAD_FOLDER'] = os.path.join(app.root_path, 'static', 'uploads')
     
@@ -49,6 +52,85 @@ def create_app():
     app.config['MAIL_PASSWORD'] = os.getenv('MAIL_PASSWORD')
     app.config['MAIL_DEFAULT_SENDER'] = os.getenv('MAIL_DEFAULT_SENDER')
     app.config['ORDERS_EMAIL'] = os.getenv('ORDERS_EMAIL', 'orders@stycly.com')
+    app.config['MAIL_USE_AUTH'] = os.getenv('MAIL_USE_AUTH', 'True') == 'True'
+    app.config['MAIL_TIMEOUT'] = int(os.getenv('MAIL_TIMEOUT', 30))
+
+    # Internal order notifications: one email per order, or in digest mode one
+    # summary when the threshold is reached or the oldest order waited the window
+    app.config['ORDERS_DIGEST_MODE'] = os.getenv('ORDERS_DIGEST_MODE', 'False') == 'True'
+    app.config['ORDERS_DIGEST_WINDOW_MINUTES'] = int(os.getenv('ORDERS_DIGEST_WINDOW_MINUTES', 15))
+    app.config['ORDERS_DIGEST_THRESHOLD'] = int(os.getenv('ORDERS_DIGEST_THRESHOLD', 20))
+
+    # Email outbox: pooled SMTP connections, retries, background delivery
+    app.config['MAIL_POOL_SIZE'] = int(os.getenv('MAIL_POOL_SIZE', 2))
+    app.config['MAIL_MAX_ATTEMPTS'] = int(os.getenv('MAIL_MAX_ATTEMPTS', 6))
+    app.config['MAIL_RETRY_BASE_SECONDS'] = int(os.getenv('MAIL_RETRY_BASE_SECONDS', 30))
+    app.config['EMAIL_OUTBOX_INTERVAL'] = int(os.getenv('EMAIL_OUTBOX_INTERVAL', 10))
+    app.config['OUTBOX_WORKER_THREAD'] = os.getenv('OUTBOX_WORKER_THREAD', 'True') == 'True'
+
+    # Catalog cache (entries per worker)
+    app.config['CATALOG_CACHE_SIZE'] = int(os.getenv('CATALOG_CACHE_SIZE', 256))
+
+    # Per-session cart summary cache (seconds)
+    app.config['CART_SUMMARY_TTL'] = int(os.getenv('CART_SUMMARY_TTL', 30))
+
+    # Server-side carts: stock hold after the last change, abandoned cart cleanup
+    app.config['CART_HOLD_MINUTES'] = int(os.getenv('CART_HOLD_MINUTES', 15))
+    app.config['CART_RETENTION_DAYS'] = int(os.getenv('CART_RETENTION_DAYS', 7))
+
+    # Password hashing: method with cost (pbkdf2:sha256:600000, scrypt:32768:8:1,
+    # argon2:3:65536:4 with argon2-cffi), hashing threads, waiting callers, wait timeout
+    app.config['PASSWORD_HASH_METHOD'] = os.getenv('PASSWORD_HASH_METHOD', 'scrypt:32768:8:1')
+    app.config['PASSWORD_HASH_WORKERS'] = int(os.getenv('PASSWORD_HASH_WORKERS', 2))
+    app.config['PASSWORD_HASH_QUEUE'] = int(os.getenv('PASSWORD_HASH_QUEUE', 16))
+    app.config['PASSWORD_HASH_TIMEOUT'] = int(os.getenv('PASSWORD_HASH_TIMEOUT', 10))
+
+    # Rate limits of the auth forms per client IP and per submitted email, as
+    # requests/period (s, m, h), in a SQLite file shared by the host's workers
+    app.config['RATE_LIMIT_ENABLED'] = os.getenv('RATE_LIMIT_ENABLED', 'True') == 'True'
+    app.config['RATE_LIMIT_DB'] = os.getenv('RATE_LIMIT_DB')
+    app.config['RATE_LIMITS'] = {
+        'login': {
+            'ip': os.getenv('RATE_LIMIT_LOGIN_IP', '20/5m'),
+            'email': os.getenv('RATE_LIMIT_LOGIN_EMAIL', '10/15m'),
+        },
+        'register': {
+            'ip': os.getenv('RATE_LIMIT_REGISTER_IP', '5/1h'),
+        },
+        'forgot_password': {
+            'ip': os.getenv('RATE_LIMIT_FORGOT_PASSWORD_IP', '10/1h'),
+            'email': os.getenv('RATE_LIMIT_FORGOT_PASSWORD_EMAIL', '3/1h'),
+        },
+    }
+
+    # Password reset links: lifetime, working links per user, and batches of
+    # 500 expired or used tokens deleted per hourly worker run
+    app.config['PASSWORD_RESET_TTL_MINUTES'] = int(os.getenv('PASSWORD_RESET_TTL_MINUTES', 60))
+    app.config['PASSWORD_RESET_MAX_ACTIVE'] = int(os.getenv('PASSWORD_RESET_MAX_ACTIVE', 3))
+    app.config['PASSWORD_RESET_PRUNE_BATCHES'] = int(os.getenv('PASSWORD_RESET_PRUNE_BATCHES', 20))
+
+    # Number of reverse proxies in front of the app (1 on Render), so client
+    # IPs are read from X-Forwarded-For
+    app.config['TRUSTED_PROXIES'] = int(os.getenv('TRUSTED_PROXIES', 0))
+
+    # Session storage: 'database' (application database), 'sqlite' (a file shared
+    # by the workers of one host) or 'cookie' (Flask's signed cookie). Idle
+    # lifetime of non-permanent sessions, and how stale a stored expiry may get
+    app.config['SESSION_BACKEND'] = os.getenv('SESSION_BACKEND', 'database')
+    app.config['SESSION_SQLITE_PATH'] = os.getenv('SESSION_SQLITE_PATH')
+    app.config['SESSION_IDLE_HOURS'] = int(os.getenv('SESSION_IDLE_HOURS', 24))
+    app.config['SESSION_REFRESH_SECONDS'] = int(os.getenv('SESSION_REFRESH_SECONDS', 3600))
+
+    # Logged-in user snapshot reuse across requests (seconds, 0 = once per
+    # request only) and seconds between writes of buffered activity timestamps
+    app.config['USER_CACHE_TTL'] = int(os.getenv('USER_CACHE_TTL', 0))
+    app.config['ACTIVITY_FLUSH_INTERVAL'] = int(os.getenv('ACTIVITY_FLUSH_INTERVAL', 30))
+
+    # Precomputed related products per item, and how often (seconds) and in
+    # batches of how many changed items the worker refreshes them
+    app.config['RELATED_ITEMS_COUNT'] = int(os.getenv('RELATED_ITEMS_COUNT', 8))
+    app.config['RELATED_REFRESH_INTERVAL'] = int(os.getenv('RELATED_REFRESH_INTERVAL', 10))
+    app.config['RELATED_REFRESH_BATCH'] = int(os.getenv('RELATED_REFRESH_BATCH', 50))
     
     # Ensure upload folder exists
     os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
@@ -57,6 +139,16 @@ def create_app():
     db.init_app(app)
     mail.init_app(app)
     
+    # Password hashing pool and auth rate limits
+    from app.passwords import init_passwords
+    from app.ratelimit import init_rate_limiter
+    init_passwords(app)
+    init_rate_limiter(app)
+
+    if app.config['TRUSTED_PROXIES']:
+        from werkzeug.middleware.proxy_fix import ProxyFix
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=app.config['TRUSTED_PROXIES'])
+    
     # Register blueprints
     from app.routes.auth import auth_bp
     from app.routes.main import main_bp
@@ -64,6 +156,7 @@ def create_app():
     from app.routes.shop import shop_bp
     from app.routes.orders import orders_bp
     from app.routes.api import api_bp
+    from app.routes.admin import admin_bp
     
     app.register_blueprint(auth_bp)
     app.register_blueprint(main_bp)
@@ -71,9 +164,45 @@ def create_app():
     app.register_blueprint(shop_bp)
     app.register_blueprint(orders_bp)
     app.register_blueprint(api_bp)
+    app.register_blueprint(admin_bp)
     
     # Create database tables
     with app.app_context():
         db.create_all()
+
+        if db.engine.dialect.name == 'sqlite':
+            # WAL: readers are not blocked while an order is being written
+            with db.engine.connect() as conn:
+                conn.exec_driver_sql('PRAGMA journal_mode=WAL')
+
+    # Bring existing databases up to date
+    from app.migrations import upgrade_schema
+    upgrade_schema(app)
+
+    # Full-text search index
+    from app.search import init_search
+    init_search(app)
+
+    # Catalog snapshot cache
+    from app.cache import init_cache
+    init_cache(app)
+
+    # Email outbox and background worker
+    from app.outbox import init_outbox
+    from app.worker import init_worker
+    init_outbox(app)
+    init_worker(app)
+
+    # Server-side sessions
+    from app.sessions import init_sessions
+    init_sessions(app)
+
+    # Current user loader and buffered activity timestamps
+    from app.users import init_users
+    init_users(app)
+
+    # CLI commands
+    from app.commands import register_commands
+    register_commands(app)
     
     return app
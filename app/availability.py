@@ -0,0 +1,278 @@
+"""
+Rental availability for Stycly
+Keeps per-day occupancy of every item from pending and confirmed orders, so
+availability over a date range is read from item_occupancy instead of
+scanning the orders table
+"""
+
+from collections import defaultdict
+from datetime import datetime, timedelta
+from sqlalchemy import event, select, delete, insert, update, func
+from sqlalchemy.dialects import postgresql, sqlite
+from app import db
+from app.models import WardrobeItem, Order, OrderItem, ItemOccupancy
+from app.cache import bump_occupancy_version
+
+# Order statuses that hold stock
+ACTIVE_STATUSES = ('pending', 'confirmed')
+
+# Longest rental period accepted from the catalog
+MAX_RENTAL_DAYS = 366
+
+_items = WardrobeItem.__table__
+_orders = Order.__table__
+_order_items = OrderItem.__table__
+_occupancy = ItemOccupancy.__table__
+
+# Attributes whose change moves an order's occupancy
+_ORDER_ATTRIBUTES = ('status', 'start_date', 'end_date')
+_ORDER_ITEM_ATTRIBUTES = ('order_id', 'wardrobe_item_id', 'quantity')
+
+
+def parse_period(start_value, end_value):
+    """
+    Rental period from 'YYYY-MM-DD' strings
+
+    Returns:
+        tuple: (start, end) dates, or None if missing or invalid
+    """
+    try:
+        start = datetime.strptime(start_value or '', '%Y-%m-%d').date()
+        end = datetime.strptime(end_value or '', '%Y-%m-%d').date()
+    except ValueError:
+        return None
+
+    if end < start or (end - start).days >= MAX_RENTAL_DAYS:
+        return None
+    return start, end
+
+
+def rental_days(start, end):
+    """Every day from start to end, inclusive"""
+    day = start
+    while day <= end:
+        yield day
+        day += timedelta(days=1)
+
+
+def occupied_units(start, end):
+    """SQL expression: most units of the outer WardrobeItem rented on any day of the period"""
+    return func.coalesce(
+        select(func.max(_occupancy.c.quantity)).where(
+            _occupancy.c.item_id == WardrobeItem.id,
+            _occupancy.c.day.between(start, end)
+        ).scalar_subquery(),
+        0
+    )
+
+
+def available_units_expression(start, end):
+    """SQL expression: units of the outer WardrobeItem free for the whole period"""
+    return func.coalesce(WardrobeItem.stock, 0) - occupied_units(start, end)
+
+
+def available_units(item_ids, start, end):
+    """
+    Units of each item free for the whole period, in one query
+
+    Returns:
+        dict: item id -> available units (missing ids are left out)
+    """
+    if not item_ids:
+        return {}
+
+    rows = db.session.execute(
+        select(WardrobeItem.id, available_units_expression(start, end))
+        .where(WardrobeItem.id.in_(item_ids))
+    )
+    return {item_id: max(available, 0) for item_id, available in rows}
+
+
+def compute_occupancy(conn, item_ids, since):
+    """
+    Per-day rented units of the given items from active orders, from since on
+
+    Returns:
+        dict: (item id, day) -> quantity
+    """
+    rows = conn.execute(
+        select(_order_items.c.wardrobe_item_id, _order_items.c.quantity,
+               _orders.c.start_date, _orders.c.end_date)
+        .join(_orders, _orders.c.id == _order_items.c.order_id)
+        .where(
+            _order_items.c.wardrobe_item_id.in_(item_ids),
+            _orders.c.status.in_(ACTIVE_STATUSES),
+            _orders.c.end_date >= since
+        )
+    )
+
+    occupancy = defaultdict(int)
+    for item_id, quantity, start, end in rows:
+        for day in rental_days(max(start, since), end):
+            occupancy[(item_id, day)] += quantity
+    return occupancy
+
+
+def refresh_occupancy(conn, item_ids):
+    """Recompute the stored occupancy of the given items from their orders"""
+    item_ids = list(set(item_ids))
+    if not item_ids:
+        return 0
+
+    # Past days can no longer be booked, so they are not stored
+    occupancy = compute_occupancy(conn, item_ids, datetime.utcnow().date())
+
+    conn.execute(delete(_occupancy).where(_occupancy.c.item_id.in_(item_ids)))
+    if occupancy:
+        conn.execute(insert(_occupancy), [
+            {'item_id': item_id, 'day': day, 'quantity': quantity}
+            for (item_id, day), quantity in occupancy.items()
+        ])
+    return len(occupancy)
+
+
+def rebuild_occupancy(batch_size=500):
+    """Recompute occupancy of every item with upcoming rentals. Returns the number of items."""
+    with db.engine.begin() as conn:
+        conn.execute(delete(_occupancy))
+        item_ids = conn.execute(
+            select(_order_items.c.wardrobe_item_id)
+            .distinct()
+            .join(_orders, _orders.c.id == _order_items.c.order_id)
+            .where(
+                _orders.c.status.in_(ACTIVE_STATUSES),
+                _orders.c.end_date >= datetime.utcnow().date()
+            )
+        ).scalars().all()
+
+    # Commit in batches to keep transactions short
+    for start in range(0, len(item_ids), batch_size):
+        with db.engine.begin() as conn:
+            refresh_occupancy(conn, item_ids[start:start + batch_size])
+
+    return len(item_ids)
+
+
+def _insert_missing_days(conn, item_id, days):
+    """Create zero rows so that every day of a reservation can be updated"""
+    rows = [{'item_id': item_id, 'day': day, 'quantity': 0} for day in days]
+
+    if conn.dialect.name == 'postgresql':
+        conn.execute(postgresql.insert(_occupancy).on_conflict_do_nothing(), rows)
+    elif conn.dialect.name == 'sqlite':
+        conn.execute(sqlite.insert(_occupancy).on_conflict_do_nothing(), rows)
+    else:
+        existing = set(conn.execute(
+            select(_occupancy.c.day)
+            .where(_occupancy.c.item_id == item_id, _occupancy.c.day.between(days[0], days[-1]))
+        ).scalars())
+        missing = [row for row in rows if row['day'] not in existing]
+        if missing:
+            conn.execute(insert(_occupancy), missing)
+
+
+def reserve_units(session, order_id, quantities, start, end):
+    """
+    Add an order's units to item occupancy, all or nothing
+
+    Items are reserved in ascending id order (row-locked first on
+    PostgreSQL), so concurrent orders always lock in the same order and
+    cannot deadlock. Each day is incremented by one conditional UPDATE
+    that only matches while occupancy stays within stock; the caller must
+    roll back the transaction if anything fails.
+
+    Args:
+        quantities: dict item id -> units
+
+    Returns:
+        list: ids of the items that could not be reserved (empty on success)
+    """
+    days = list(rental_days(max(start, datetime.utcnow().date()), end))
+    item_ids = sorted(quantities)
+    if not days or not item_ids:
+        return []
+
+    conn = session.connection()
+    if conn.dialect.name == 'postgresql':
+        conn.execute(
+            select(_items.c.id).where(_items.c.id.in_(item_ids)).order_by(_items.c.id).with_for_update()
+        )
+
+    failed = []
+    for item_id in item_ids:
+        quantity = quantities[item_id]
+        stock = select(func.coalesce(_items.c.stock, 0)).where(_items.c.id == item_id).scalar_subquery()
+
+        _insert_missing_days(conn, item_id, days)
+        result = conn.execute(
+            update(_occupancy)
+            .where(
+                _occupancy.c.item_id == item_id,
+                _occupancy.c.day.between(days[0], days[-1]),
+                _occupancy.c.quantity + quantity <= stock
+            )
+            .values(quantity=_occupancy.c.quantity + quantity)
+        )
+        if result.rowcount != len(days):
+            failed.append(item_id)
+
+    # Occupancy is already up to date for this order's lines
+    session.info.setdefault('reserved_orders', set()).add(order_id)
+    bump_occupancy_version(session)
+    return failed
+
+
+def _changed_values(obj, name):
+    """Current and previous values of an attribute"""
+    return db.inspect(obj).attrs[name].history.sum()
+
+
+def _sync_occupancy(session, flush_context):
+    """Recompute occupancy of items whose orders were added, changed or removed"""
+    item_ids = set()
+    order_ids = set()
+
+    reserved = session.info.get('reserved_orders', ())
+
+    for obj in list(session.new) + list(session.deleted):
+        if isinstance(obj, OrderItem):
+            if obj in session.new and obj.order_id in reserved:
+                continue
+            item_ids.add(obj.wardrobe_item_id)
+        elif isinstance(obj, Order) and obj in session.deleted:
+            order_ids.add(obj.id)
+
+    for obj in session.dirty:
+        if isinstance(obj, OrderItem):
+            state = db.inspect(obj)
+            if any(state.attrs[name].history.has_changes() for name in _ORDER_ITEM_ATTRIBUTES):
+                item_ids.update(_changed_values(obj, 'wardrobe_item_id'))
+        elif isinstance(obj, Order):
+            state = db.inspect(obj)
+            if any(state.attrs[name].history.has_changes() for name in _ORDER_ATTRIBUTES):
+                order_ids.add(obj.id)
+
+    if not item_ids and not order_ids:
+        return
+
+    conn = session.connection()
+    if order_ids:
+        item_ids.update(conn.execute(
+            select(_order_items.c.wardrobe_item_id).where(_order_items.c.order_id.in_(order_ids))
+        ).scalars())
+
+    item_ids.discard(None)
+    if item_ids:
+        refresh_occupancy(conn, item_ids)
+        # Cached catalog pages filtered by rental dates are now stale
+        bump_occupancy_version(session)
+
+
+def _forget_reservations(session):
+    """Reservations only apply to the transaction that made them"""
+    session.info.pop('reserved_orders', None)
+
+
+event.listen(db.session, 'after_flush', _sync_occupancy)
+event.listen(db.session, 'after_commit', _forget_reservations)
+event.listen(db.session, 'after_rollback', _forget_reservations)
@@ -0,0 +1,81 @@
+"""
+Homepage bootstrap for Stycly
+Everything the homepage shows on load, assembled in one response: filter
+options, the first page of products, the cart and, for logged-in users,
+the account menu data and the wardrobe
+"""
+
+from flask import session
+from app.cache import cached_payload, json_payload
+from app.cart import cart_summary, held_by_others, load_cart
+from app.catalog import DEFAULT_SORT, page_body, parse_filters, parse_page_size, products_page
+from app.facets import facets_payload
+from app.serializers import dumps, serialize_wardrobe, wardrobe_rows
+from app.users import current_user
+
+EMPTY_CART = dumps({'items': [], 'total_items': 0})
+
+
+def format_last_insert(value):
+    """Last item insert time as shown in the account menu, or None"""
+    return value.strftime('%B %d, %Y at %I:%M %p') if value else None
+
+
+def _catalog_parts(args):
+    """Filter options and first products page, from the catalog cache"""
+    filters = parse_filters(args)
+    sort = args.get('sort', DEFAULT_SORT)
+    page_size = parse_page_size(args.get('limit'))
+    filter_key = tuple(sorted(filters.items()))
+
+    period = 'period' in filters
+
+    facets = cached_payload(('filters', filter_key), lambda: json_payload(
+        facets_payload(filters)
+    ), period=period)
+    page = cached_payload(('products', filter_key, sort, None, page_size), lambda: json_payload(
+        products_page(filters, sort, None, page_size)
+    ), period=period)
+
+    cart = load_cart()
+    held = held_by_others([product['id'] for product in page.data['items']])
+    return facets.body, page_body(page, cart, held)
+
+
+def _user_parts(user):
+    """Account menu data and wardrobe of a logged-in user"""
+    account = dumps({'last_insert': format_last_insert(user.last_item_insert_at)})
+    wardrobe = dumps(serialize_wardrobe(wardrobe_rows(user.id)))
+    return account, wardrobe
+
+
+def bootstrap_body(args):
+    """
+    JSON body of /api/bootstrap
+
+    Catalog parts and the cart summary are served from their caches and
+    spliced in as already-encoded bytes. Logged-out visitors get null
+    user and wardrobe parts.
+
+    Args:
+        args: the same query parameters as /shop/products (no cursor)
+
+    Returns:
+        bytes: {"filters", "products", "cart", "user", "wardrobe"}
+    """
+    filters, products = _catalog_parts(args)
+
+    has_cart = session.get('cart_id') or session.get('cart')
+    cart = cart_summary().body if has_cart else EMPTY_CART
+
+    user = current_user()
+    account, wardrobe = _user_parts(user) if user else (b'null', b'null')
+
+    parts = (
+        (b'filters', filters),
+        (b'products', products),
+        (b'cart', cart),
+        (b'user', account),
+        (b'wardrobe', wardrobe),
+    )
+    return b'{' + b','.join(b'"%s":%s' % (name, body) for name, body in parts) + b'}'
@@ -0,0 +1,253 @@
+"""
+Catalog cache for Stycly
+In-process cache of pre-serialized public catalog payloads, keyed by a
+catalog version stored in the database and bumped on every WardrobeItem
+insert, update or delete (so all gunicorn workers see invalidations).
+Payloads filtered by rental dates also carry an occupancy version, bumped
+by orders, so order traffic leaves the rest of the cache alone.
+"""
+
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from datetime import datetime
+from flask import g
+from sqlalchemy import event, select, update
+from sqlalchemy.exc import IntegrityError
+from app import db
+from app.models import CatalogVersion, WardrobeItem, WardrobeImage
+from app.serializers import dumps
+
+CATALOG_VERSION_ID = 1
+OCCUPANCY_VERSION_ID = 2
+
+# Serialized JSON body plus the data it was built from (for overlays)
+CachedPayload = namedtuple('CachedPayload', ['body', 'data'])
+
+
+def json_payload(data):
+    """Build a CachedPayload from JSON-serializable data"""
+    return CachedPayload(dumps(data), data)
+
+
+class CatalogCache:
+    """Thread-safe LRU cache whose entries are only valid for one catalog version"""
+
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._version = None
+        self._lock = threading.Lock()
+
+    def get(self, version, key):
+        """Get a cached value for the given catalog version, or None"""
+        with self._lock:
+            if version != self._version:
+                return None
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+            return value
+
+    def set(self, version, key, value):
+        """Store a value built for the given catalog version"""
+        with self._lock:
+            if self._version is None or version > self._version:
+                # Catalog changed: everything cached so far is stale
+                self._entries.clear()
+                self._version = version
+            elif version < self._version:
+                # Built from an older snapshot than what is cached
+                return
+
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        """Drop all cached entries"""
+        with self._lock:
+            self._entries.clear()
+            self._version = None
+
+
+class TTLCache:
+    """Thread-safe LRU cache whose entries expire after a time-to-live"""
+
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Get an unexpired cached value, or None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl):
+        """Store a value for ttl seconds"""
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def pop(self, key):
+        """Drop a cached value"""
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        """Drop all cached entries"""
+        with self._lock:
+            self._entries.clear()
+
+
+catalog_cache = CatalogCache()
+
+
+def _read_version(name, row_id):
+    """(version, updated_at) of a counter row, read once per request"""
+    if name not in g:
+        row = db.session.execute(
+            select(CatalogVersion.version, CatalogVersion.updated_at)
+            .where(CatalogVersion.id == row_id)
+        ).first()
+        setattr(g, name, (row.version, row.updated_at) if row else (0, None))
+    return getattr(g, name)
+
+
+def current_version():
+    """
+    Current catalog version and its last change time
+
+    Read from the shared counter row once per request.
+
+    Returns:
+        tuple: (version, updated_at)
+    """
+    return _read_version('catalog_version', CATALOG_VERSION_ID)
+
+
+def occupancy_version():
+    """
+    Current rental occupancy version and its last change time
+
+    Returns:
+        tuple: (version, updated_at)
+    """
+    return _read_version('occupancy_version', OCCUPANCY_VERSION_ID)
+
+
+def filters_version(filters):
+    """
+    Version and last change time of responses for the given filters
+
+    With a rental period they also depend on occupancy.
+
+    Returns:
+        tuple: (version, updated_at) where version is an int, or a
+            (catalog, occupancy) pair with a rental period
+    """
+    version, updated_at = current_version()
+    if not filters.get('period'):
+        return version, updated_at
+
+    occupancy, occupancy_updated_at = occupancy_version()
+    if updated_at is None or (occupancy_updated_at and occupancy_updated_at > updated_at):
+        updated_at = occupancy_updated_at
+    return (version, occupancy), updated_at
+
+
+def cached_payload(key, builder, period=False):
+    """
+    Get the payload cached under key for the current catalog version
+
+    Args:
+        key: hashable cache key
+        builder: callable returning a CachedPayload, run on cache miss
+        period: the payload depends on rental occupancy (date filters)
+    """
+    version, _ = current_version()
+    if period:
+        # Entries of older occupancy versions are never hit again and age out
+        key = (key, occupancy_version()[0])
+    payload = catalog_cache.get(version, key)
+    if payload is None:
+        payload = builder()
+        catalog_cache.set(version, key, payload)
+    return payload
+
+
+def _bump(session, row_id, flag):
+    table = CatalogVersion.__table__
+    session.connection().execute(
+        update(table)
+        .where(table.c.id == row_id)
+        .values(version=table.c.version + 1, updated_at=datetime.utcnow())
+    )
+    session.info[flag] = True
+
+
+def bump_catalog_version(session=None):
+    """Increment the shared catalog version (in the current transaction)"""
+    _bump(session or db.session, CATALOG_VERSION_ID, 'catalog_changed')
+
+
+def bump_occupancy_version(session=None):
+    """Increment the shared occupancy version (in the current transaction)"""
+    _bump(session or db.session, OCCUPANCY_VERSION_ID, 'occupancy_changed')
+
+
+def init_cache(app):
+    """Create the version rows and size the in-process cache"""
+    catalog_cache.max_entries = app.config.get('CATALOG_CACHE_SIZE', 256)
+
+    with app.app_context():
+        for row_id in (CATALOG_VERSION_ID, OCCUPANCY_VERSION_ID):
+            if db.session.get(CatalogVersion, row_id) is None:
+                try:
+                    db.session.add(CatalogVersion(id=row_id, version=1))
+                    db.session.commit()
+                except IntegrityError:
+                    # Another worker created it first
+                    db.session.rollback()
+
+
+def _catalog_changed(session, flush_context):
+    """Bump the catalog version when a flush touched any item or item image"""
+    catalog_models = (WardrobeItem, WardrobeImage)
+    changed = any(isinstance(obj, catalog_models) for obj in session.new) \
+        or any(isinstance(obj, catalog_models) for obj in session.deleted) \
+        or any(isinstance(obj, catalog_models) and session.is_modified(obj) for obj in session.dirty)
+
+    if changed:
+        bump_catalog_version(session)
+
+
+def _forget_request_version(session):
+    """After a catalog or occupancy write commits, re-read the version on next access"""
+    if session.info.pop('catalog_changed', False):
+        g.pop('catalog_version', None)
+    if session.info.pop('occupancy_changed', False):
+        g.pop('occupancy_version', None)
+
+
+def _discard_version_change(session):
+    """A rolled back catalog write leaves the versions untouched"""
+    session.info.pop('catalog_changed', None)
+    session.info.pop('occupancy_changed', None)
+
+
+event.listen(db.session, 'after_flush', _catalog_changed)
+event.listen(db.session, 'after_commit', _forget_request_version)
+event.listen(db.session, 'after_rollback', _discard_version_change)
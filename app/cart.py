@@ -0,0 +1,320 @@
+"""
+Cart store for Stycly
+Server-side carts keyed by an opaque id in the session cookie. Cart lines
+hold their units for CART_HOLD_MINUTES after the last change, so other
+shoppers cannot put the same units in their carts meanwhile.
+"""
+
+import secrets
+from datetime import datetime, timedelta
+from flask import current_app, session
+from sqlalchemy import select, update, insert, delete, func, bindparam
+from sqlalchemy.dialects import postgresql, sqlite
+from app import db
+from app.models import CartLine, WardrobeItem
+from app.cache import TTLCache, current_version, json_payload
+from app.availability import available_units_expression
+from app.serializers import cart_rows, serialize_cart
+
+_lines = CartLine.__table__
+
+cart_summary_cache = TTLCache()
+
+# Largest accepted list of operations for one batch request
+MAX_BATCH_OPERATIONS = 50
+
+
+def _cart_id(create=False):
+    """Cart id of the current session, created on demand"""
+    cart_id = session.get('cart_id')
+    if cart_id is None and create:
+        cart_id = session['cart_id'] = secrets.token_urlsafe(16)
+    return cart_id
+
+
+def _hold_expiry(now):
+    """Time until which a changed cart holds its units"""
+    return now + timedelta(minutes=current_app.config.get('CART_HOLD_MINUTES', 15))
+
+
+def load_cart():
+    """
+    Current session cart, in the order items were added
+
+    Returns:
+        dict: {str(item_id): quantity}
+    """
+    # Carts from before the server-side store lived in the cookie
+    legacy_cart = session.pop('cart', None)
+    if legacy_cart:
+        _migrate_legacy_cart(legacy_cart)
+
+    cart_id = _cart_id()
+    if cart_id is None:
+        return {}
+
+    rows = db.session.execute(
+        select(_lines.c.item_id, _lines.c.quantity)
+        .where(_lines.c.cart_id == cart_id)
+        .order_by(_lines.c.created_at, _lines.c.item_id)
+    )
+    return {str(item_id): quantity for item_id, quantity in rows}
+
+
+def _migrate_legacy_cart(legacy_cart):
+    """
+    Move a cookie cart to the cart store, on a connection of its own
+
+    load_cart also runs on GET requests, whose session is never
+    committed. Items deleted since the cart was filled are dropped.
+    """
+    quantities = {}
+    for item_id, quantity in legacy_cart.items():
+        try:
+            quantities[int(item_id)] = int(quantity)
+        except (TypeError, ValueError):
+            continue
+
+    existing = set(db.session.execute(
+        select(WardrobeItem.id).where(WardrobeItem.id.in_(list(quantities)))
+    ).scalars()) if quantities else set()
+    cart = {str(item_id): quantity for item_id, quantity in quantities.items() if item_id in existing}
+
+    if cart:
+        with db.engine.begin() as conn:
+            _write_lines(conn, _cart_id(create=True), cart)
+        invalidate_cart_summary()
+
+
+def _write_lines(conn, cart_id, cart):
+    """Replace the lines of a cart, renewing their holds"""
+    now = datetime.utcnow()
+    lines = [
+        {'c_id': cart_id, 'i_id': int(item_id), 'qty': quantity, 'hold': _hold_expiry(now), 'ts': now}
+        for item_id, quantity in cart.items() if quantity > 0
+    ]
+
+    conn.execute(delete(_lines).where(
+        _lines.c.cart_id == cart_id,
+        _lines.c.item_id.notin_([line['i_id'] for line in lines])
+    ))
+
+    if not lines:
+        return
+
+    rows = [
+        {'cart_id': line['c_id'], 'item_id': line['i_id'], 'quantity': line['qty'],
+         'held_until': line['hold'], 'created_at': now, 'updated_at': now}
+        for line in lines
+    ]
+    if conn.dialect.name in ('postgresql', 'sqlite'):
+        # Concurrent requests of one cart may both add the same line
+        dialect_insert = postgresql.insert if conn.dialect.name == 'postgresql' else sqlite.insert
+        statement = dialect_insert(_lines)
+        conn.execute(statement.on_conflict_do_update(
+            index_elements=[_lines.c.cart_id, _lines.c.item_id],
+            set_={
+                'quantity': statement.excluded.quantity,
+                'held_until': statement.excluded.held_until,
+                'updated_at': statement.excluded.updated_at,
+            }
+        ), rows)
+        return
+
+    existing = set(conn.execute(
+        select(_lines.c.item_id).where(_lines.c.cart_id == cart_id)
+    ).scalars())
+    changed = [line for line in lines if line['i_id'] in existing]
+    added = [row for row in rows if row['item_id'] not in existing]
+
+    if changed:
+        conn.execute(
+            update(_lines)
+            .where(_lines.c.cart_id == bindparam('c_id'), _lines.c.item_id == bindparam('i_id'))
+            .values(quantity=bindparam('qty'), held_until=bindparam('hold'), updated_at=bindparam('ts')),
+            changed
+        )
+    if added:
+        conn.execute(insert(_lines), added)
+
+
+def save_cart(cart):
+    """
+    Store the session cart, renewing its holds, and drop its cached summary
+
+    Runs in the current transaction; the caller commits.
+    """
+    cart_id = _cart_id(create=bool(cart))
+    if cart_id is not None:
+        _write_lines(db.session.connection(), cart_id, cart)
+
+    invalidate_cart_summary()
+
+
+def apply_operations(cart, operations):
+    """
+    Apply batch operations to a copy of a cart, in order
+
+    Operations are dicts: {'op': 'add', 'item_id': id, 'quantity': n (default 1)},
+    {'op': 'update', 'item_id': id, 'quantity': n}, {'op': 'remove', 'item_id': id}
+    or {'op': 'clear'}.
+
+    Returns:
+        dict: the new cart, {str(item_id): quantity}
+
+    Raises:
+        ValueError: if an operation is malformed
+    """
+    cart = dict(cart)
+    for operation in operations:
+        if not isinstance(operation, dict):
+            raise ValueError('Invalid operation')
+        op = operation.get('op')
+
+        if op == 'clear':
+            cart.clear()
+            continue
+        if op not in ('add', 'update', 'remove'):
+            raise ValueError(f'Unknown operation: {op}')
+
+        try:
+            item_id = str(int(operation.get('item_id')))
+            quantity = int(operation.get('quantity', 1 if op == 'add' else 0))
+        except (TypeError, ValueError):
+            raise ValueError('Item ID and quantity must be integers')
+
+        if op == 'add':
+            quantity += cart.get(item_id, 0)
+        elif op == 'remove':
+            quantity = 0
+
+        if quantity > 0:
+            cart[item_id] = quantity
+        else:
+            cart.pop(item_id, None)
+    return cart
+
+
+def unavailable_items(cart, item_ids, period=None):
+    """
+    Check that the cart quantities of some items can be rented
+
+    Stock (or availability over the rental period) of every item is read
+    in one query, holds of other carts in a second one.
+
+    Args:
+        cart: {str(item_id): quantity}
+        item_ids: ids of the items to check
+        period: optional (start, end) rental dates
+
+    Returns:
+        dict: item id -> error message, for the items that cannot be rented
+    """
+    if not item_ids:
+        return {}
+
+    available = available_units_expression(*period) if period else func.coalesce(WardrobeItem.stock, 0)
+    rows = db.session.execute(
+        select(WardrobeItem.id, WardrobeItem.is_public_for_rent, available)
+        .where(WardrobeItem.id.in_(item_ids))
+    )
+    found = {item_id: (public, units) for item_id, public, units in rows}
+    held = held_by_others(list(found))
+
+    errors = {}
+    for item_id in item_ids:
+        if item_id not in found or not found[item_id][0]:
+            errors[item_id] = 'Item not found'
+            continue
+        units = max(found[item_id][1] - held.get(item_id, 0), 0)
+        if cart.get(str(item_id), 0) > units:
+            errors[item_id] = 'Not available for the selected dates' if period else f'Only {units} available'
+    return errors
+
+
+def held_by_others(item_ids):
+    """
+    Units of the given items held by other shoppers' carts
+
+    Returns:
+        dict: item id -> held units (items without holds are left out)
+    """
+    if not item_ids:
+        return {}
+
+    query = select(_lines.c.item_id, func.sum(_lines.c.quantity)).where(
+        _lines.c.item_id.in_(item_ids),
+        _lines.c.held_until > datetime.utcnow()
+    ).group_by(_lines.c.item_id)
+
+    cart_id = _cart_id()
+    if cart_id is not None:
+        query = query.where(_lines.c.cart_id != cart_id)
+
+    return {item_id: held for item_id, held in db.session.execute(query)}
+
+
+def holds_fingerprint():
+    """
+    Summary of other shoppers' active holds, for cache validators
+
+    Changes whenever such a hold is added, changed, removed or lapses,
+    without reading which items the holds are on.
+
+    Returns:
+        tuple: (lines, units, last change), (0, 0, None) without holds
+    """
+    query = select(
+        func.count(), func.coalesce(func.sum(_lines.c.quantity), 0), func.max(_lines.c.updated_at)
+    ).where(_lines.c.held_until > datetime.utcnow())
+    cart_id = _cart_id()
+    if cart_id is not None:
+        query = query.where(_lines.c.cart_id != cart_id)
+    return tuple(db.session.execute(query).one())
+
+
+def sweep_carts(retention_days=None):
+    """
+    Delete carts abandoned for more than retention_days
+
+    Expired holds already stop counting when they lapse; this only
+    removes the lines. Returns the number of deleted lines.
+    """
+    if retention_days is None:
+        retention_days = current_app.config.get('CART_RETENTION_DAYS', 7)
+
+    cutoff = datetime.utcnow() - timedelta(days=retention_days)
+    result = db.session.execute(delete(_lines).where(_lines.c.updated_at < cutoff))
+    db.session.commit()
+    return result.rowcount
+
+
+def invalidate_cart_summary():
+    """Forget the cached summary and give the cart a new cache token"""
+    token = session.get('cart_token')
+    if token:
+        cart_summary_cache.pop(token)
+    session['cart_token'] = secrets.token_hex(8)
+
+
+def cart_summary():
+    """
+    Hydrated session cart as a CachedPayload
+
+    Cached per session until the cart changes, the catalog changes or
+    CART_SUMMARY_TTL seconds pass; a miss costs the cart lookup plus one
+    hydration query.
+    """
+    token = session.get('cart_token')
+    if token is None:
+        token = session['cart_token'] = secrets.token_hex(8)
+
+    version, _ = current_version()
+    cached = cart_summary_cache.get(token)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+
+    cart = load_cart()
+    payload = json_payload(serialize_cart(cart_rows([int(item_id) for item_id in cart]), cart))
+    cart_summary_cache.set(token, (version, payload), current_app.config.get('CART_SUMMARY_TTL', 30))
+    return payload
@@ -0,0 +1,296 @@
+"""
+Catalog queries for Stycly
+Server-side filtering, sorting and keyset pagination of public products
+"""
+
+import base64
+import json
+from datetime import datetime
+from sqlalchemy import and_, or_, select
+from app import db
+from app.models import WardrobeItem
+from app.search import search_subquery
+from app.related import related_products
+from app.availability import available_units_expression, parse_period
+from app.serializers import PRODUCT_COLUMNS, dumps, product_row, serialize_products, serialize_related
+
+# Filters exposed by the catalog UI (query string name -> model column)
+FILTER_FIELDS = {
+    'category': WardrobeItem.category,
+    'destination': WardrobeItem.destination,
+    'size': WardrobeItem.size,
+    'age_range': WardrobeItem.age_range,
+    'color': WardrobeItem.color,
+    'condition': WardrobeItem.condition,
+}
+
+# Sort keys: (column, descending). 'relevance' ranks search matches and
+# falls back to the default sort when there is no search term.
+SORT_KEYS = {
+    'relevance': (None, False),
+    'newest': (WardrobeItem.created_at, True),
+    'oldest': (WardrobeItem.created_at, False),
+    'title': (WardrobeItem.title, False),
+}
+
+# JSON type of the cursor value of each sort key
+CURSOR_VALUE_TYPES = {
+    'relevance': (int, float),
+    'newest': str,
+    'oldest': str,
+    'title': str,
+}
+
+DEFAULT_SORT = 'newest'
+DEFAULT_PAGE_SIZE = 24
+MAX_PAGE_SIZE = 100
+
+
+class InvalidCursor(ValueError):
+    """Raised when a pagination cursor cannot be decoded"""
+
+
+def parse_filters(args):
+    """Extract catalog filters from request args, ignoring empty values"""
+    filters = {}
+    for name in FILTER_FIELDS:
+        value = (args.get(name) or '').strip()
+        if value:
+            filters[name] = value
+
+    search = (args.get('q') or args.get('search') or '').strip()
+    if search:
+        filters['q'] = search
+
+    # Rental period as (start, end) dates; an incomplete period is ignored
+    period = parse_period(args.get('start_date'), args.get('end_date'))
+    if period:
+        filters['period'] = period
+
+    return filters
+
+
+def parse_page_size(value):
+    """Clamp requested page size to the allowed range"""
+    try:
+        size = int(value)
+    except (TypeError, ValueError):
+        return DEFAULT_PAGE_SIZE
+    return max(1, min(size, MAX_PAGE_SIZE))
+
+
+def encode_cursor(sort, value, item_id):
+    """Build an opaque cursor pointing after the given row"""
+    if isinstance(value, datetime):
+        value = value.isoformat()
+    payload = json.dumps([sort, value, item_id], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor, sort):
+    """Decode a cursor produced by encode_cursor for the given sort key"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        cursor_sort, value, item_id = json.loads(base64.urlsafe_b64decode(padded))
+        item_id = int(item_id)
+    except (ValueError, TypeError):
+        raise InvalidCursor('Invalid cursor')
+
+    if cursor_sort != sort:
+        raise InvalidCursor('Cursor does not match sort order')
+
+    # null, lists and objects cannot be compared with the sort column
+    if isinstance(value, bool) or not isinstance(value, CURSOR_VALUE_TYPES[sort]):
+        raise InvalidCursor('Invalid cursor')
+
+    if SORT_KEYS[sort][0] is WardrobeItem.created_at:
+        try:
+            value = datetime.fromisoformat(value)
+        except ValueError:
+            raise InvalidCursor('Invalid cursor')
+
+    return value, item_id
+
+
+def filter_conditions(filters=None, exclude=None):
+    """
+    Build SQL conditions for public items matching the given filters
+
+    Args:
+        filters: dict as returned by parse_filters
+        exclude: optional filter name to leave out (used for facet counts)
+    """
+    conditions = [WardrobeItem.is_public_for_rent == True]
+
+    for name, value in (filters or {}).items():
+        if name in FILTER_FIELDS and name != exclude:
+            conditions.append(FILTER_FIELDS[name] == value)
+
+    search = (filters or {}).get('q')
+    if search and exclude != 'q':
+        matches = search_subquery(search)
+        conditions.append(WardrobeItem.id.in_(select(matches.c.item_id)))
+
+    period = (filters or {}).get('period')
+    if period and exclude != 'period':
+        conditions.append(available_units_expression(*period) > 0)
+
+    return conditions
+
+
+def public_items_query(filters=None):
+    """
+    Column-projected query of public items matching the given filters
+
+    Rows hold PRODUCT_COLUMNS followed by the sort columns, so pages are
+    serialized without hydrating WardrobeItem objects. With a rental
+    period, stock is the number of units free for the whole period.
+
+    Returns:
+        tuple: (query, rank) where rank is the search relevance column
+               (lower is better), or None without a search term
+    """
+    filters = filters or {}
+    columns = PRODUCT_COLUMNS
+    if filters.get('period'):
+        available = available_units_expression(*filters['period']).label('stock')
+        columns = [available if column is WardrobeItem.stock else column for column in columns]
+
+    query = db.session.query(*columns, WardrobeItem.created_at).filter(
+        *filter_conditions(filters, exclude='q')
+    )
+
+    if not filters.get('q'):
+        return query, None
+
+    matches = search_subquery(filters['q'])
+    query = query.join(matches, matches.c.item_id == WardrobeItem.id)
+    return query.add_columns(matches.c.rank), matches.c.rank
+
+
+def fetch_page(query, sort=DEFAULT_SORT, cursor=None, page_size=DEFAULT_PAGE_SIZE, rank=None):
+    """
+    Fetch one page of a catalog query using keyset pagination
+
+    Args:
+        rank: relevance column from public_items_query, used by the
+              'relevance' sort
+
+    Returns:
+        tuple: (rows, next_cursor) where next_cursor is None on the last page
+    """
+    if sort not in SORT_KEYS or (sort == 'relevance' and rank is None):
+        sort = DEFAULT_SORT
+    column, descending = SORT_KEYS[sort]
+
+    if sort == 'relevance':
+        column = rank
+
+    if cursor:
+        value, last_id = decode_cursor(cursor, sort)
+        if descending:
+            query = query.filter(or_(
+                column < value,
+                and_(column == value, WardrobeItem.id < last_id)
+            ))
+        else:
+            query = query.filter(or_(
+                column > value,
+                and_(column == value, WardrobeItem.id > last_id)
+            ))
+
+    if descending:
+        query = query.order_by(column.desc(), WardrobeItem.id.desc())
+    else:
+        query = query.order_by(column.asc(), WardrobeItem.id.asc())
+
+    # Fetch one extra row to know whether another page exists
+    rows = query.limit(page_size + 1).all()
+    has_more = len(rows) > page_size
+    rows = rows[:page_size]
+
+    next_cursor = None
+    if has_more:
+        last = rows[-1]
+        next_cursor = encode_cursor(sort, getattr(last, column.key), last.id)
+
+    return rows, next_cursor
+
+
+def products_page(filters, sort, cursor, page_size):
+    """
+    Build one cart-independent page of in-stock public products
+
+    Returns:
+        dict: {'items': [...], 'next_cursor': str or None}
+    """
+    query, rank = public_items_query(filters)
+    query = query.filter(WardrobeItem.stock > 0)
+    rows, next_cursor = fetch_page(query, sort, cursor, page_size, rank)
+
+    return {
+        'items': serialize_products(rows),
+        'next_cursor': next_cursor
+    }
+
+
+def apply_cart(products, cart, held=None):
+    """
+    Overlay a cart and other shoppers' holds on serialized products
+
+    Stock becomes available stock (total stock - quantity in cart - units
+    held by other carts) and items with nothing left are dropped.
+    """
+    held = held or {}
+    result = []
+    for product in products:
+        unavailable = cart.get(str(product['id']), 0) + held.get(product['id'], 0)
+        if not unavailable:
+            result.append(product)
+            continue
+
+        available_stock = product['stock'] - unavailable
+        if available_stock > 0:
+            result.append(dict(product, stock=available_stock))
+    return result
+
+
+def page_body(page, cart, held=None):
+    """
+    JSON body of a cached products page as seen by one shopper
+
+    Args:
+        page: CachedPayload of products_page
+        cart, held: as for apply_cart
+
+    Returns:
+        bytes: the cached bytes as-is when nothing in the page is in a
+            cart, else the page re-encoded with available stock
+    """
+    held = held or {}
+    if not held and not any(str(product['id']) in cart for product in page.data['items']):
+        return page.body
+
+    # Items fully in carts are dropped, so such a page may be slightly
+    # shorter than the page size
+    return dumps({
+        'items': apply_cart(page.data['items'], cart, held),
+        'next_cursor': page.data['next_cursor']
+    })
+
+
+def product_detail(product_id, related_limit=4):
+    """
+    Serialized public item with its precomputed related products
+
+    Returns:
+        dict or None: None if the item does not exist or is not public
+    """
+    row = product_row(product_id)
+    if not row:
+        return None
+
+    product = serialize_products([row])[0]
+    product['related'] = serialize_related(related_products(product_id, related_limit))
+
+    return product
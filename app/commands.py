@@ -0,0 +1,174 @@
+"""
+CLI commands for Stycly
+Maintenance tasks run with `flask <command>`
+"""
+
+import click
+from flask.cli import with_appcontext
+
+
+@click.command('search-rebuild')
+@with_appcontext
+def search_rebuild_command():
+    """Rebuild the full-text search index from all wardrobe items"""
+    from app.search import get_backend, rebuild_index
+
+    backend = get_backend()
+    if backend == 'like':
+        click.echo('Full-text search is not available on this database; nothing to rebuild.')
+        return
+
+    count = rebuild_index()
+    click.echo(f'Indexed {count} wardrobe items ({backend}).')
+
+
+@click.command('related-rebuild')
+@with_appcontext
+def related_rebuild_command():
+    """Recompute the related-products lists of every public item"""
+    from app.related import rebuild_related
+
+    count = rebuild_related()
+    click.echo(f'Computed related items for {count} public items.')
+
+
+@click.command('availability-rebuild')
+@with_appcontext
+def availability_rebuild_command():
+    """Recompute per-day item occupancy from pending and confirmed orders"""
+    from app.availability import rebuild_occupancy
+
+    count = rebuild_occupancy()
+    click.echo(f'Computed occupancy for {count} items with upcoming rentals.')
+
+
+@click.command('stats-rebuild')
+@with_appcontext
+def stats_rebuild_command():
+    """Recompute the order summary tables behind the admin statistics"""
+    from app.reports import rebuild_order_stats
+
+    count = rebuild_order_stats()
+    click.echo(f'Counted {count} orders.')
+
+
+@click.command('cart-sweep')
+@click.option('--days', type=int, default=None, help='Keep carts changed in the last N days')
+@with_appcontext
+def cart_sweep_command(days):
+    """Delete abandoned server-side carts"""
+    from app.cart import sweep_carts
+
+    count = sweep_carts(days)
+    click.echo(f'Deleted {count} abandoned cart lines.')
+
+
+@click.command('reset-tokens-prune')
+@click.option('--batch-size', type=int, default=500, show_default=True, help='Tokens deleted per transaction')
+@click.option('--compact', is_flag=True, help='Reclaim the freed space (VACUUM; rewrites the whole file on SQLite)')
+@with_appcontext
+def reset_tokens_prune_command(batch_size, compact):
+    """Delete expired and used password reset tokens"""
+    from app.reset_tokens import compact_table, prune_reset_tokens, table_size
+
+    def describe(size):
+        rows, size_bytes = size
+        return f'{rows} rows' + (f', {size_bytes / 1024:.1f} KB' if size_bytes is not None else '')
+
+    before = table_size()
+    count = prune_reset_tokens(batch_size)
+    if compact:
+        compact_table()
+    after = table_size()
+
+    click.echo(f'Deleted {count} tokens.')
+    click.echo(f'password_reset_tokens: {describe(before)} before, {describe(after)} after.')
+
+
+@click.command('outbox-drain')
+@click.option('--batch-size', type=int, default=50, help='Emails to deliver in this run')
+@with_appcontext
+def outbox_drain_command(batch_size):
+    """Deliver due emails from the outbox once"""
+    from app.outbox import drain_outbox
+
+    sent, failed = drain_outbox(batch_size)
+    click.echo(f'Sent {sent} emails, {failed} given up after the last retry.')
+
+
+@click.command('order-digest')
+@click.option('--force', is_flag=True, help='Send even if the window or threshold is not reached')
+@with_appcontext
+def order_digest_command(force):
+    """Queue the digest of orders waiting for the internal notification"""
+    from app.notifications import send_order_digest
+
+    count = send_order_digest(force=force)
+    click.echo(f'Queued a digest of {count} orders.' if count else 'No digest due.')
+
+
+@click.command('worker')
+@with_appcontext
+def worker_command():
+    """Run the background worker (email outbox, cart cleanup) in the foreground"""
+    from flask import current_app
+    from app.worker import run_worker
+
+    click.echo('Worker started; press Ctrl+C to stop.')
+    try:
+        run_worker(current_app._get_current_object())
+    except KeyboardInterrupt:
+        pass
+
+
+@click.command('export')
+@click.argument('name', type=click.Choice(['orders', 'order-items', 'wardrobe-items']))
+@click.option('--format', 'fmt', type=click.Choice(['csv', 'ndjson']), default='csv', show_default=True)
+@click.option('--output', '-o', type=click.File('wb'), default='-', help='Output file (default: stdout)')
+@click.option('--batch-size', type=int, default=1000, show_default=True, help='Rows fetched per batch')
+@click.option('--status', default=None, help='Only orders with this status')
+@click.option('--start', default=None, help='Only orders created on or after this date (YYYY-MM-DD)')
+@click.option('--end', default=None, help='Only orders created on or before this date (YYYY-MM-DD)')
+@with_appcontext
+def export_command(name, fmt, output, batch_size, status, start, end):
+    """Stream a table as CSV or NDJSON (orders can be filtered)"""
+    from app.export import stream_export
+    from app.reports import parse_report_filters
+
+    # Same filters as the admin download
+    try:
+        filters = parse_report_filters({'status': status, 'from': start, 'to': end})
+    except ValueError as e:
+        raise click.UsageError(str(e))
+    if filters and name != 'orders':
+        raise click.UsageError('--status, --start and --end only apply to the orders export')
+
+    for chunk in stream_export(name, fmt, filters, batch_size=batch_size):
+        output.write(chunk)
+
+
+@click.command('db-upgrade')
+@with_appcontext
+def db_upgrade_command():
+    """Run schema and data migrations"""
+    from flask import current_app
+    from app.migrations import upgrade_schema
+
+    for step, result in upgrade_schema(current_app).items():
+        status = 'failed' if result is None else result
+        click.echo(f'{step}: {status}')
+
+
+def register_commands(app):
+    """Register CLI commands on the app"""
+    app.cli.add_command(search_rebuild_command)
+    app.cli.add_command(db_upgrade_command)
+    app.cli.add_command(related_rebuild_command)
+    app.cli.add_command(availability_rebuild_command)
+    app.cli.add_command(stats_rebuild_command)
+    app.cli.add_command(cart_sweep_command)
+    app.cli.add_command(reset_tokens_prune_command)
+    app.cli.add_command(outbox_drain_command)
+    app.cli.add_command(order_digest_command)
+    app.cli.add_command(worker_command)
+    app.cli.add_command(export_command)
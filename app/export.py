@@ -0,0 +1,102 @@
+"""
+Bulk export for Stycly
+Streams orders, order items and wardrobe items as CSV or NDJSON from a
+server-side cursor, one batch of rows at a time, so memory use does not
+grow with the size of the table
+"""
+
+import csv
+import io
+from datetime import date, datetime, timedelta
+from sqlalchemy import select
+from app import db
+from app.models import Order, OrderItem, WardrobeItem
+from app.serializers import dumps
+
+# Exportable tables: name -> columns, in output order (the first is the key)
+EXPORTS = {
+    'orders': (
+        Order.id, Order.user_id, Order.name, Order.email, Order.phone,
+        Order.start_date, Order.end_date, Order.status, Order.item_count,
+        Order.notes, Order.created_at,
+    ),
+    'order-items': (
+        OrderItem.id, OrderItem.order_id, OrderItem.wardrobe_item_id, OrderItem.quantity,
+    ),
+    'wardrobe-items': (
+        WardrobeItem.id, WardrobeItem.user_id, WardrobeItem.title, WardrobeItem.description,
+        WardrobeItem.destination, WardrobeItem.category, WardrobeItem.size, WardrobeItem.age_range,
+        WardrobeItem.color, WardrobeItem.condition, WardrobeItem.stock,
+        WardrobeItem.is_public_for_rent, WardrobeItem.created_at, WardrobeItem.updated_at,
+    ),
+}
+
+FORMATS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+}
+
+DEFAULT_BATCH_SIZE = 1000
+
+
+def export_statement(name, filters=None):
+    """
+    Select statement of an export, in key order
+
+    Args:
+        filters: for orders, the status/from/to filters of
+            app.reports.parse_report_filters (ignored by other exports)
+    """
+    columns = EXPORTS[name]
+    query = select(*columns).order_by(columns[0])
+
+    filters = filters or {}
+    if name == 'orders':
+        if 'status' in filters:
+            query = query.where(Order.status == filters['status'])
+        if 'from' in filters:
+            query = query.where(Order.created_at >= filters['from'])
+        if 'to' in filters:
+            query = query.where(Order.created_at < filters['to'] + timedelta(days=1))
+    return query
+
+
+def _plain(value):
+    """Dates as ISO strings; other values unchanged"""
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return value
+
+
+def _csv_chunk(rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerows([[_plain(value) for value in row] for row in rows])
+    return buffer.getvalue().encode('utf-8')
+
+
+def _ndjson_chunk(keys, rows):
+    return b''.join(dumps({key: _plain(value) for key, value in zip(keys, row)}) + b'\n' for row in rows)
+
+
+def stream_export(name, fmt='csv', filters=None, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Encoded export, one chunk of bytes per batch of rows
+
+    Rows are read through their own connection with yield_per (a
+    server-side cursor on PostgreSQL), so the generator can outlive the
+    request's session. Needs an app context while it is consumed.
+    """
+    keys = [column.key for column in EXPORTS[name]]
+    if fmt == 'csv':
+        yield _csv_chunk([keys])
+
+    with db.engine.connect() as conn:
+        result = conn.execution_options(yield_per=batch_size).execute(export_statement(name, filters))
+        for rows in result.partitions():
+            yield _csv_chunk(rows) if fmt == 'csv' else _ndjson_chunk(keys, rows)
+
+
+def export_filename(name, fmt):
+    """Download file name, e.g. stycly-orders-20250101.csv"""
+    return f'stycly-{name}-{datetime.utcnow():%Y%m%d}.{fmt}'
@@ -0,0 +1,60 @@
+"""
+Facet counts for the Stycly catalog
+Distinct filter values with item counts, computed with grouped SQL
+"""
+
+from sqlalchemy import select, literal, func, union_all, String
+from app import db
+from app.catalog import FILTER_FIELDS, filter_conditions
+from app.models import WardrobeItem
+
+# Response key -> filter name, as expected by products.js
+FACET_KEYS = {
+    'categories': 'category',
+    'destinations': 'destination',
+    'sizes': 'size',
+    'age_ranges': 'age_range',
+    'colors': 'color',
+    'conditions': 'condition',
+}
+
+
+def facet_counts(filters=None):
+    """
+    Count in-stock public items per value of every facet
+
+    Each facet is conditioned on all selected filters except its own, so
+    the UI can show how many items each alternative value would return
+    (e.g. how many Bambina items exist in the selected size).
+    All facets are computed in a single UNION ALL round trip.
+
+    Returns:
+        dict: filter name -> {value: count}
+    """
+    selects = []
+    for name, column in FILTER_FIELDS.items():
+        selects.append(
+            select(
+                literal(name, String).label('facet'),
+                column.label('value'),
+                func.count(WardrobeItem.id).label('count')
+            )
+            .where(*filter_conditions(filters, exclude=name))
+            .where(WardrobeItem.stock > 0, column.isnot(None), column != '')
+            .group_by(column)
+        )
+
+    counts = {name: {} for name in FILTER_FIELDS}
+    for facet, value, count in db.session.execute(union_all(*selects)):
+        counts[facet][value] = count
+
+    return counts
+
+
+def facets_payload(filters=None):
+    """Build the /shop/filters response: sorted values per facet plus counts"""
+    counts = facet_counts(filters)
+
+    payload = {key: sorted(counts[name]) for key, name in FACET_KEYS.items()}
+    payload['counts'] = counts
+    return payload
@@ -0,0 +1,149 @@
+"""
+Image storage helpers for Stycly
+Saves uploaded item images and records them as WardrobeImage rows
+"""
+
+import os
+import struct
+from datetime import datetime
+from flask import current_app
+from werkzeug.utils import secure_filename
+from app.utils import allowed_file
+
+ORIGINAL = 'original'
+THUMBNAIL = 'thumb'
+THUMBNAIL_SIZE = (400, 400)
+
+try:
+    from PIL import Image as PILImage
+except ImportError:  # Pillow is optional: without it no thumbnails are made
+    PILImage = None
+
+
+def read_dimensions(filepath):
+    """
+    Read (width, height) from a PNG, GIF, JPEG or WebP file header
+
+    Returns:
+        tuple: (width, height), or (None, None) if the format is unknown
+    """
+    try:
+        with open(filepath, 'rb') as f:
+            head = f.read(32)
+
+            if head.startswith(b'\x89PNG\r\n\x1a\n'):
+                return struct.unpack('>II', head[16:24])
+
+            if head[:6] in (b'GIF87a', b'GIF89a'):
+                return struct.unpack('<HH', head[6:10])
+
+            if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+                chunk = head[12:16]
+                if chunk == b'VP8 ':
+                    width, height = struct.unpack('<HH', head[26:30])
+                    return width & 0x3FFF, height & 0x3FFF
+                if chunk == b'VP8L':
+                    bits = struct.unpack('<I', head[21:25])[0]
+                    return (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+                if chunk == b'VP8X':
+                    width = int.from_bytes(head[24:27], 'little') + 1
+                    height = int.from_bytes(head[27:30], 'little') + 1
+                    return width, height
+
+            if head[:2] == b'\xff\xd8':
+                return _jpeg_dimensions(f)
+    except (OSError, struct.error):
+        pass
+
+    return None, None
+
+
+def _jpeg_dimensions(f):
+    """Walk JPEG markers up to the first start-of-frame segment"""
+    f.seek(2)
+    while True:
+        marker = f.read(2)
+        if len(marker) < 2 or marker[0] != 0xFF:
+            return None, None
+        code = marker[1]
+        if code == 0xFF:
+            # Fill byte: step back one and keep scanning
+            f.seek(-1, os.SEEK_CUR)
+            continue
+        length = struct.unpack('>H', f.read(2))[0]
+        if 0xC0 <= code <= 0xCF and code not in (0xC4, 0xC8, 0xCC):
+            height, width = struct.unpack('>xHH', f.read(5))
+            return width, height
+        f.seek(length - 2, os.SEEK_CUR)
+
+
+def build_image(relative_path, position, variant=ORIGINAL):
+    """WardrobeImage for a file under the static folder, with size metadata"""
+    from app.models import WardrobeImage
+
+    filepath = os.path.join(current_app.static_folder, relative_path)
+    width, height = read_dimensions(filepath)
+    try:
+        byte_size = os.path.getsize(filepath)
+    except OSError:
+        byte_size = None
+
+    return WardrobeImage(
+        path=relative_path,
+        position=position,
+        variant=variant,
+        width=width,
+        height=height,
+        byte_size=byte_size
+    )
+
+
+def make_thumbnail(relative_path, position):
+    """Create a thumbnail rendition next to the original (needs Pillow)"""
+    if PILImage is None:
+        return None
+
+    directory, filename = os.path.split(relative_path)
+    thumb_path = f'{directory}/thumb_{filename}' if directory else f'thumb_{filename}'
+
+    try:
+        with PILImage.open(os.path.join(current_app.static_folder, relative_path)) as img:
+            img.thumbnail(THUMBNAIL_SIZE)
+            img.save(os.path.join(current_app.static_folder, thumb_path))
+    except Exception as e:
+        current_app.logger.warning(f'Could not create thumbnail for {relative_path}: {str(e)}')
+        return None
+
+    return build_image(thumb_path, position, THUMBNAIL)
+
+
+def save_uploaded_images(uploaded_files):
+    """
+    Save uploaded files to the upload folder
+
+    Returns:
+        list: WardrobeImage rows (originals plus thumbnail renditions)
+    """
+    images = []
+    position = 0
+
+    for file in uploaded_files:
+        if file and file.filename and allowed_file(file.filename):
+            filename = secure_filename(file.filename)
+            # Add timestamp to avoid collisions
+            timestamp = datetime.utcnow().strftime('%Y%m%d_%H%M%S_%f')
+            filename = f"{timestamp}_{filename}"
+
+            filepath = os.path.join(current_app.config['UPLOAD_FOLDER'], filename)
+            file.save(filepath)
+
+            relative_path = f'uploads/{filename}'
+            images.append(build_image(relative_path, position))
+
+            thumbnail = make_thumbnail(relative_path, position)
+            if thumbnail:
+                images.append(thumbnail)
+
+            position += 1
+
+    return images
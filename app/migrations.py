@@ -0,0 +1,219 @@
+"""
+Schema and data migrations for Stycly
+Idempotent upgrade steps run after db.create_all() on startup and by
+`flask db-upgrade`. Each step checks whether it still has work to do.
+"""
+
+import json
+from app import db
+
+
+def migrate_image_paths(batch_size=500):
+    """
+    Convert legacy WardrobeItem.image_paths JSON arrays to WardrobeImage rows
+
+    Only items without images are converted, so reruns skip them.
+    image_paths is left as it is, so the previous release still finds its
+    images after a rollback. Values that are not a JSON array are skipped.
+
+    Returns:
+        int: number of migrated items
+    """
+    from app.models import WardrobeItem
+    from app.images import build_image
+
+    migrated = 0
+    last_id = 0
+    while True:
+        items = WardrobeItem.query.filter(
+            WardrobeItem.id > last_id,
+            WardrobeItem.image_paths.isnot(None),
+            ~WardrobeItem.images.any()
+        ).order_by(WardrobeItem.id).limit(batch_size).all()
+        if not items:
+            break
+
+        for item in items:
+            last_id = item.id
+            try:
+                paths = json.loads(item.image_paths)
+            except ValueError:
+                continue
+            if not isinstance(paths, list):
+                continue
+
+            paths = [path for path in paths if isinstance(path, str) and path]
+            if paths:
+                item.images = [build_image(path, position) for position, path in enumerate(paths)]
+                migrated += 1
+
+        db.session.commit()
+
+    return migrated
+
+
+def add_missing_columns():
+    """
+    Add columns declared on the models that an existing table lacks
+
+    db.create_all() never alters existing tables. Columns are added as
+    nullable without a server default: new columns must treat NULL as
+    their initial value.
+
+    Returns:
+        int: number of added columns
+    """
+    from sqlalchemy import inspect
+
+    inspector = inspect(db.engine)
+    existing_tables = set(inspector.get_table_names())
+    preparer = db.engine.dialect.identifier_preparer
+    added = 0
+
+    for table in db.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        existing = {column['name'] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            column_type = column.type.compile(dialect=db.engine.dialect)
+            with db.engine.begin() as conn:
+                conn.exec_driver_sql(
+                    f'ALTER TABLE {preparer.format_table(table)} '
+                    f'ADD COLUMN {preparer.format_column(column)} {column_type}'
+                )
+            added += 1
+
+    return added
+
+
+def create_missing_indexes():
+    """
+    Create indexes declared on the models that an existing database lacks
+
+    db.create_all() only creates indexes together with new tables.
+
+    Returns:
+        int: number of created indexes
+    """
+    from sqlalchemy import inspect
+
+    inspector = inspect(db.engine)
+    existing_tables = set(inspector.get_table_names())
+    created = 0
+
+    for table in db.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        existing = {index['name'] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing:
+                index.create(bind=db.engine, checkfirst=True)
+                created += 1
+
+    return created
+
+
+def populate_item_occupancy():
+    """
+    Fill item_occupancy from existing orders when it is still empty
+
+    Returns:
+        int: number of items with upcoming rentals
+    """
+    from app.models import ItemOccupancy
+    from app.availability import rebuild_occupancy
+
+    if db.session.query(ItemOccupancy.item_id).first():
+        return 0
+    return rebuild_occupancy()
+
+
+def backfill_order_item_counts():
+    """
+    Set Order.item_count on orders created before the column existed
+
+    Returns:
+        int: number of updated orders
+    """
+    from sqlalchemy import func, select, update
+    from app.models import Order, OrderItem
+
+    orders = Order.__table__
+    order_items = OrderItem.__table__
+    units = (
+        select(func.coalesce(func.sum(order_items.c.quantity), 0))
+        .where(order_items.c.order_id == orders.c.id)
+        .scalar_subquery()
+    )
+    result = db.session.execute(
+        update(orders).where(orders.c.item_count.is_(None)).values(item_count=units)
+    )
+    db.session.commit()
+    return result.rowcount
+
+
+def populate_order_stats():
+    """
+    Fill the order summary tables from existing orders when they are empty
+
+    Returns:
+        int: number of counted orders
+    """
+    from app.models import Order, OrderDailyStat
+    from app.reports import rebuild_order_stats
+
+    if db.session.query(OrderDailyStat.day).first() or not db.session.query(Order.id).first():
+        return 0
+    return rebuild_order_stats()
+
+
+def hash_plain_reset_tokens():
+    """
+    Replace reset tokens stored in the clear by their SHA-256 digest
+
+    Tokens from before hashed storage are the 43-character values of the
+    emailed links; digests are 64 characters, so reruns skip them.
+
+    Returns:
+        int: number of hashed tokens
+    """
+    from sqlalchemy import func, select, update
+    from app.models import PasswordResetToken
+    from app.reset_tokens import hash_token
+
+    tokens = PasswordResetToken.__table__
+    rows = db.session.execute(
+        select(tokens.c.id, tokens.c.token).where(func.length(tokens.c.token) != 64)
+    ).all()
+    for token_id, token in rows:
+        db.session.execute(update(tokens).where(tokens.c.id == token_id).values(token=hash_token(token)))
+    db.session.commit()
+    return len(rows)
+
+
+# Upgrade steps, in order
+UPGRADE_STEPS = [
+    add_missing_columns,
+    create_missing_indexes,
+    migrate_image_paths,
+    populate_item_occupancy,
+    backfill_order_item_counts,
+    populate_order_stats,
+    hash_plain_reset_tokens,
+]
+
+
+def upgrade_schema(app):
+    """Run every upgrade step; failures are logged and retried on next start"""
+    results = {}
+    with app.app_context():
+        for step in UPGRADE_STEPS:
+            try:
+                results[step.__name__] = step()
+            except Exception as e:
+                db.session.rollback()
+                app.logger.error(f'Migration step {step.__name__} failed: {str(e)}')
+                results[step.__name__] = None
+    return results
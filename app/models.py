@@ -3,8 +3,8 @@ Database models for Stycly
 """
 
 from datetime import datetime
-from werkzeug.security import generate_password_hash, check_password_hash
 from app import db
+from app import passwords
 
 class User(db.Model):
     """User account model"""
@@ -25,12 +25,27 @@ class User(db.Model):
     orders = db.relationship('Order', backref='user', lazy='dynamic', cascade='all, delete-orphan')
     
     def set_password(self, password):
-        """Hash and set password"""
-        self.password_hash = generate_password_hash(password, method='pbkdf2:sha256')
+        """Hash and set password (PASSWORD_HASH_METHOD)"""
+        self.password_hash = passwords.password_hasher.hash(password)
     
     def check_password(self, password):
-        """Verify password"""
-        return check_password_hash(self.password_hash, password)
+        """
+        Verify password
+
+        A correct password stored with other hash settings than the
+        configured ones is rehashed; the caller commits the new hash.
+        The rehash is skipped when the hashing pool is busy.
+        """
+        hasher = passwords.password_hasher
+        if not hasher.verify(self.password_hash, password):
+            return False
+        if hasher.needs_rehash(self.password_hash):
+            try:
+                self.password_hash = hasher.hash(password)
+            except passwords.HashingBusy:
+                # Upgraded on a later login instead
+                pass
+        return True
     
     def __repr__(self):
         return f'<User {self.email}>'
@@ -39,6 +54,21 @@ class User(db.Model):
 class WardrobeItem(db.Model):
     """Wardrobe item model - clothes available for rent"""
     __tablename__ = 'wardrobe_items'
+    __table_args__ = (
+        # Public catalog listing (shop.products): partial indexes over
+        # public items only, one per sort order and per category
+        db.Index('ix_wardrobe_items_public_created', 'created_at', 'id',
+                 postgresql_where=db.text('is_public_for_rent'),
+                 sqlite_where=db.text('is_public_for_rent = 1')),
+        db.Index('ix_wardrobe_items_public_title', 'title', 'id',
+                 postgresql_where=db.text('is_public_for_rent'),
+                 sqlite_where=db.text('is_public_for_rent = 1')),
+        db.Index('ix_wardrobe_items_public_category', 'category', 'created_at', 'id',
+                 postgresql_where=db.text('is_public_for_rent'),
+                 sqlite_where=db.text('is_public_for_rent = 1')),
+        # User's wardrobe, newest first (wardrobe.index)
+        db.Index('ix_wardrobe_items_user_created', 'user_id', 'created_at'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
@@ -50,7 +80,7 @@ class WardrobeItem(db.Model):
     age_range = db.Column(db.String(50))  # 0-6m, 6-12m, 1-2y, etc.
     color = db.Column(db.String(50))
     condition = db.Column(db.String(50))  # New, Like New, Very Good, Good, Acceptable, Vintage
-    image_paths = db.Column(db.Text)  # JSON array of image paths for multiple images
+    image_paths = db.Column(db.Text)  # Legacy JSON array of image paths, migrated to WardrobeImage rows
     stock = db.Column(db.Integer, default=1)
     is_public_for_rent = db.Column(db.Boolean, default=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
@@ -58,35 +88,75 @@ class WardrobeItem(db.Model):
 
     # Relationships
     order_items = db.relationship('OrderItem', backref='item', lazy='dynamic')
+    images = db.relationship('WardrobeImage', backref='wardrobe_item', cascade='all, delete-orphan',
+                             order_by='WardrobeImage.position')
+
+    def get_image_paths(self, variant='original'):
+        """Ordered image paths of one rendition variant"""
+        return [image.path for image in self.images if image.variant == variant]
 
     def __repr__(self):
         return f'<WardrobeItem {self.title}>'
 
 
+class WardrobeImage(db.Model):
+    """Image of a wardrobe item - one row per position and rendition"""
+    __tablename__ = 'wardrobe_images'
+
+    id = db.Column(db.Integer, primary_key=True)
+    item_id = db.Column(db.Integer, db.ForeignKey('wardrobe_items.id'), nullable=False, index=True)
+    position = db.Column(db.Integer, nullable=False, default=0)  # 0 = cover image
+    variant = db.Column(db.String(20), nullable=False, default='original')  # original, thumb
+    path = db.Column(db.String(255), nullable=False)  # Relative to the static folder
+    width = db.Column(db.Integer)
+    height = db.Column(db.Integer)
+    byte_size = db.Column(db.Integer)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<WardrobeImage {self.path}>'
+
+
 class PasswordResetToken(db.Model):
-    """Password reset tokens"""
+    """Password reset tokens (see app/reset_tokens.py)"""
     __tablename__ = 'password_reset_tokens'
     
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
-    token = db.Column(db.String(100), unique=True, nullable=False, index=True)
+    # SHA-256 hex digest of the token sent by email, never the token itself
+    token_hash = db.Column('token', db.String(64), unique=True, nullable=False, index=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     expires_at = db.Column(db.DateTime, nullable=False)
     used = db.Column(db.Boolean, default=False)
     
     user = db.relationship('User', backref='reset_tokens')
+
+    __table_args__ = (
+        # Active tokens of a user (per-user cap) and expired tokens (pruning)
+        db.Index('ix_password_reset_tokens_user_created', 'user_id', 'created_at'),
+        db.Index('ix_password_reset_tokens_expires', 'expires_at'),
+    )
     
     def is_valid(self):
         """Check if token is still valid"""
         return not self.used and datetime.utcnow() < self.expires_at
     
     def __repr__(self):
-        return f'<PasswordResetToken {self.token}>'
+        return f'<PasswordResetToken {self.id}>'
 
 
 class Order(db.Model):
     """Rental order/request"""
     __tablename__ = 'orders'
+    __table_args__ = (
+        # Admin order listing, newest first, optionally by status
+        db.Index('ix_orders_created', 'created_at', 'id'),
+        db.Index('ix_orders_status_created', 'status', 'created_at', 'id'),
+        # Orders waiting for the next internal digest email
+        db.Index('ix_orders_notification_pending', 'created_at',
+                 postgresql_where=db.text('notification_pending'),
+                 sqlite_where=db.text('notification_pending = 1')),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True)  # Nullable for guest orders
@@ -98,20 +168,36 @@ class Order(db.Model):
     notes = db.Column(db.Text)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     status = db.Column(db.String(20), default='pending')  # pending, confirmed, completed, cancelled
-    
+    notification_pending = db.Column(db.Boolean, default=False)  # Awaiting the ORDERS_EMAIL digest
+    item_count = db.Column(db.Integer)  # Total units, set when the order is created
+
     # Relationships
-    items = db.relationship('OrderItem', backref='order', lazy='dynamic', cascade='all, delete-orphan')
-    
+    items = db.relationship('OrderItem', backref='order', cascade='all, delete-orphan',
+                            order_by='OrderItem.id')
+
+    @classmethod
+    def get_with_items(cls, order_id):
+        """
+        Load an order with its items and their wardrobe items in one query
+
+        Returns:
+            Order: the order, or None if it does not exist
+        """
+        return db.session.execute(
+            db.select(cls)
+            .options(db.joinedload(cls.items).joinedload(OrderItem.item))
+            .where(cls.id == order_id)
+        ).unique().scalar_one_or_none()
+
     def get_total_days(self):
         """Calculate total rental days"""
         return (self.end_date - self.start_date).days + 1
     
     def get_item_count(self):
         """Get total number of items in order"""
-        total = 0
-        for item in self.items:
-            total += item.quantity
-        return total
+        if self.item_count is not None:
+            return self.item_count
+        return sum(item.quantity for item in self.items)
     
     def __repr__(self):
         return f'<Order {self.id} - {self.email}>'
@@ -122,9 +208,145 @@ class OrderItem(db.Model):
     __tablename__ = 'order_items'
 
     id = db.Column(db.Integer, primary_key=True)
-    order_id = db.Column(db.Integer, db.ForeignKey('orders.id'), nullable=False)
-    wardrobe_item_id = db.Column(db.Integer, db.ForeignKey('wardrobe_items.id'), nullable=False)
+    order_id = db.Column(db.Integer, db.ForeignKey('orders.id'), nullable=False, index=True)
+    wardrobe_item_id = db.Column(db.Integer, db.ForeignKey('wardrobe_items.id'), nullable=False, index=True)
     quantity = db.Column(db.Integer, nullable=False, default=1)
 
     def __repr__(self):
         return f'<OrderItem {self.id}>'
+
+
+class CatalogVersion(db.Model):
+    """
+    Shared version counters: the catalog (id 1), bumped on every
+    WardrobeItem write, and rental occupancy (id 2), bumped by orders
+    """
+    __tablename__ = 'catalog_version'
+
+    id = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<CatalogVersion {self.version}>'
+
+
+class RelatedItem(db.Model):
+    """Precomputed top-N similar public items for each public item"""
+    __tablename__ = 'related_items'
+
+    item_id = db.Column(db.Integer, db.ForeignKey('wardrobe_items.id', ondelete='CASCADE'), primary_key=True)
+    related_id = db.Column(db.Integer, db.ForeignKey('wardrobe_items.id', ondelete='CASCADE'), primary_key=True)
+    score = db.Column(db.Integer, nullable=False)
+
+    related = db.relationship('WardrobeItem', foreign_keys=[related_id])
+
+    def __repr__(self):
+        return f'<RelatedItem {self.item_id} -> {self.related_id}>'
+
+
+class RelatedRefresh(db.Model):
+    """Item whose related lists wait for a refresh by the worker"""
+    __tablename__ = 'related_refresh_queue'
+
+    # No foreign key: deleted items are queued too, to leave other lists
+    item_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    queued_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<RelatedRefresh {self.item_id}>'
+
+
+class ItemOccupancy(db.Model):
+    """Units of an item rented out on one day by pending or confirmed orders"""
+    __tablename__ = 'item_occupancy'
+
+    item_id = db.Column(db.Integer, db.ForeignKey('wardrobe_items.id', ondelete='CASCADE'), primary_key=True)
+    day = db.Column(db.Date, primary_key=True)
+    quantity = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<ItemOccupancy {self.item_id} {self.day}: {self.quantity}>'
+
+
+class CartLine(db.Model):
+    """Item quantity in a server-side cart, holding stock until held_until"""
+    __tablename__ = 'cart_lines'
+    __table_args__ = (
+        # Active holds of an item (availability checks)
+        db.Index('ix_cart_lines_item_held', 'item_id', 'held_until'),
+    )
+
+    cart_id = db.Column(db.String(32), primary_key=True)  # Opaque id stored in the session cookie
+    item_id = db.Column(db.Integer, db.ForeignKey('wardrobe_items.id', ondelete='CASCADE'), primary_key=True)
+    quantity = db.Column(db.Integer, nullable=False, default=1)
+    held_until = db.Column(db.DateTime, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+
+    def __repr__(self):
+        return f'<CartLine {self.cart_id} {self.item_id} x{self.quantity}>'
+
+
+class EmailOutbox(db.Model):
+    """Email queued in the sender's transaction and delivered by the worker"""
+    __tablename__ = 'email_outbox'
+    __table_args__ = (
+        # Due pending emails (worker polling)
+        db.Index('ix_email_outbox_status_next_attempt', 'status', 'next_attempt_at'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(30), nullable=False)  # order_confirmation, order_notification, password_reset, contact
+    to_email = db.Column(db.String(120), nullable=False)
+    subject = db.Column(db.String(255), nullable=False)
+    html_body = db.Column(db.Text, nullable=False)
+    plain_body = db.Column(db.Text)
+    status = db.Column(db.String(20), nullable=False, default='pending')  # pending, sent, failed
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    next_attempt_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    last_error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    sent_at = db.Column(db.DateTime)
+
+    def __repr__(self):
+        return f'<EmailOutbox {self.id} {self.kind} -> {self.to_email} ({self.status})>'
+
+
+class OrderDailyStat(db.Model):
+    """Orders and units per creation day and status, maintained incrementally"""
+    __tablename__ = 'order_daily_stats'
+
+    day = db.Column(db.Date, primary_key=True)
+    status = db.Column(db.String(20), primary_key=True)
+    orders = db.Column(db.Integer, nullable=False, default=0)
+    units = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<OrderDailyStat {self.day} {self.status}: {self.orders}>'
+
+
+class ItemRentalStat(db.Model):
+    """Order lines and units per item and order status, maintained incrementally"""
+    __tablename__ = 'item_rental_stats'
+
+    item_id = db.Column(db.Integer, db.ForeignKey('wardrobe_items.id', ondelete='CASCADE'), primary_key=True)
+    status = db.Column(db.String(20), primary_key=True)
+    orders = db.Column(db.Integer, nullable=False, default=0)
+    units = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<ItemRentalStat {self.item_id} {self.status}: {self.units}>'
+
+
+class ServerSession(db.Model):
+    """Server-side session data (SESSION_BACKEND=database, see app/sessions.py)"""
+    __tablename__ = 'server_sessions'
+
+    # SHA-256 hex digest of the id in the session cookie
+    id = db.Column(db.String(64), primary_key=True)
+    data = db.Column(db.LargeBinary, nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+
+    def __repr__(self):
+        return f'<ServerSession {self.id[:8]}>'
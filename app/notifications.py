@@ -0,0 +1,99 @@
+"""
+Order notifications for Stycly
+Internal ORDERS_EMAIL notifications, sent for every order or, in digest
+mode, grouped into one summary email per time window or batch of orders
+"""
+
+from datetime import datetime, timedelta
+from itertools import groupby
+from flask import current_app
+from sqlalchemy import select, update
+from app import db
+from app.models import Order, OrderItem, WardrobeItem
+from app.utils import send_order_notification_email, send_order_digest_email
+
+_orders = Order.__table__
+
+DIGEST_ORDER_FIELDS = ('id', 'name', 'email', 'phone', 'start_date', 'end_date', 'notes', 'created_at')
+
+
+def notify_new_order(order):
+    """Queue the internal notification of a new order, or mark it for the digest"""
+    if current_app.config.get('ORDERS_DIGEST_MODE'):
+        order.notification_pending = True
+    else:
+        send_order_notification_email(order)
+
+
+def pending_notifications():
+    """
+    Orders waiting for the digest, with their items, in one query
+
+    Returns:
+        list: dicts with the DIGEST_ORDER_FIELDS and an 'items' list,
+            oldest order first
+    """
+    order_columns = [getattr(Order, field) for field in DIGEST_ORDER_FIELDS]
+    rows = db.session.execute(
+        select(*order_columns, OrderItem.wardrobe_item_id, OrderItem.quantity,
+               WardrobeItem.title, WardrobeItem.size, WardrobeItem.age_range)
+        .outerjoin(OrderItem, OrderItem.order_id == Order.id)
+        .outerjoin(WardrobeItem, WardrobeItem.id == OrderItem.wardrobe_item_id)
+        .where(Order.notification_pending.is_(True))
+        .order_by(Order.created_at, Order.id, OrderItem.id)
+    )
+
+    orders = []
+    width = len(DIGEST_ORDER_FIELDS)
+    for _, lines in groupby(rows, key=lambda row: row.id):
+        lines = list(lines)
+        order = dict(zip(DIGEST_ORDER_FIELDS, lines[0][:width]))
+        order['items'] = [
+            {'wardrobe_item_id': line.wardrobe_item_id, 'quantity': line.quantity,
+             'title': line.title, 'size': line.size, 'age_range': line.age_range}
+            for line in lines if line.wardrobe_item_id is not None
+        ]
+        orders.append(order)
+    return orders
+
+
+def send_order_digest(force=False):
+    """
+    Send the digest of pending orders if it is due
+
+    Due when ORDERS_DIGEST_THRESHOLD orders are waiting or the oldest has
+    waited ORDERS_DIGEST_WINDOW_MINUTES; always due outside digest mode, so
+    orders left over after switching it off are still notified.
+
+    Returns:
+        int: number of orders in the sent digest (0 if none was sent)
+    """
+    config = current_app.config
+    orders = pending_notifications()
+    if not orders:
+        return 0
+
+    window = timedelta(minutes=config.get('ORDERS_DIGEST_WINDOW_MINUTES', 15))
+    due = (
+        force
+        or not config.get('ORDERS_DIGEST_MODE')
+        or len(orders) >= config.get('ORDERS_DIGEST_THRESHOLD', 20)
+        or orders[0]['created_at'] <= datetime.utcnow() - window
+    )
+    if not due:
+        return 0
+
+    # Claim the orders; if another worker took some, it sends them instead
+    ids = [order['id'] for order in orders]
+    result = db.session.execute(
+        update(_orders)
+        .where(_orders.c.id.in_(ids), _orders.c.notification_pending.is_(True))
+        .values(notification_pending=False)
+    )
+    if result.rowcount != len(ids):
+        db.session.rollback()
+        return 0
+
+    send_order_digest_email(orders)
+    db.session.commit()
+    return len(orders)
@@ -0,0 +1,236 @@
+"""
+Email outbox for Stycly
+Emails are queued in the email_outbox table inside the caller's transaction
+and delivered by the background worker over pooled SMTP connections, with
+retries and exponential backoff
+"""
+
+import smtplib
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from email.mime.text import MIMEText
+from email.mime.multipart import MIMEMultipart
+from flask import current_app
+from sqlalchemy import event, update
+from app import db
+from app.models import EmailOutbox
+
+# How long a claimed email is reserved for the worker that claimed it
+CLAIM_LEASE = timedelta(minutes=5)
+
+# Pooled connections idle for longer are checked with NOOP before reuse
+NOOP_AFTER_IDLE = 5
+
+
+class SMTPPool:
+    """Reusable logged-in SMTP connections shared by sender threads"""
+
+    def __init__(self, size=2, max_idle=60):
+        self.size = size
+        self.max_idle = max_idle
+        self._idle = []
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(size)
+
+    def _connect(self, config):
+        """Open a connection: EHLO, STARTTLS and login once"""
+        server = smtplib.SMTP(config['MAIL_SERVER'], config['MAIL_PORT'],
+                              timeout=config.get('MAIL_TIMEOUT', 30))
+        if config.get('MAIL_USE_TLS'):
+            server.starttls()
+        if config.get('MAIL_USE_AUTH', True):
+            server.login(config['MAIL_USERNAME'], config['MAIL_PASSWORD'])
+        return server
+
+    def _checkout(self):
+        """An idle connection that is still alive, or None"""
+        while True:
+            with self._lock:
+                if not self._idle:
+                    return None
+                server, last_used = self._idle.pop()
+
+            idle = time.monotonic() - last_used
+            if idle < self.max_idle:
+                try:
+                    if idle < NOOP_AFTER_IDLE or server.noop()[0] == 250:
+                        return server
+                except smtplib.SMTPException:
+                    pass
+            self._close(server)
+
+    def _checkin(self, server):
+        with self._lock:
+            self._idle.append((server, time.monotonic()))
+
+    @staticmethod
+    def _close(server):
+        try:
+            server.quit()
+        except (smtplib.SMTPException, OSError):
+            server.close()
+
+    @contextmanager
+    def connection(self, config):
+        """Borrow a connection; it is discarded if the block fails"""
+        with self._slots:
+            server = self._checkout() or self._connect(config)
+            try:
+                yield server
+            except Exception:
+                self._close(server)
+                raise
+            self._checkin(server)
+
+    def close_all(self):
+        """Close every idle connection"""
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for server, _ in idle:
+            self._close(server)
+
+
+smtp_pool = SMTPPool()
+
+
+def init_outbox(app):
+    """Size the SMTP connection pool"""
+    smtp_pool.size = app.config.get('MAIL_POOL_SIZE', 2)
+    smtp_pool._slots = threading.BoundedSemaphore(smtp_pool.size)
+
+
+def queue_email(kind, to_email, subject, html_body, plain_body=None):
+    """
+    Add an email to the outbox in the current transaction
+
+    It is delivered by the worker once the transaction commits; nothing
+    is sent if it rolls back.
+    """
+    entry = EmailOutbox(
+        kind=kind,
+        to_email=to_email,
+        subject=subject,
+        html_body=html_body,
+        plain_body=plain_body
+    )
+    db.session.add(entry)
+    db.session.info['outbox_queued'] = True
+    return entry
+
+
+def mail_configured(config):
+    """True if SMTP settings allow sending"""
+    if not config.get('MAIL_SERVER'):
+        return False
+    if config.get('MAIL_USE_AUTH', True):
+        return bool(config.get('MAIL_USERNAME') and config.get('MAIL_PASSWORD'))
+    return True
+
+
+def build_message(entry, sender):
+    """MIME message for an outbox entry"""
+    msg = MIMEMultipart('alternative')
+    msg['Subject'] = entry.subject
+    msg['From'] = sender
+    msg['To'] = entry.to_email
+
+    # Attach plain text and HTML versions
+    if entry.plain_body:
+        msg.attach(MIMEText(entry.plain_body, 'plain'))
+    msg.attach(MIMEText(entry.html_body, 'html'))
+    return msg
+
+
+def deliver(entry):
+    """Send one outbox entry over a pooled connection"""
+    config = current_app.config
+    if not mail_configured(config):
+        current_app.logger.warning('Email not configured. Email would be sent to: ' + entry.to_email)
+        current_app.logger.info(f'Subject: {entry.subject}')
+        current_app.logger.info(f'Body: {entry.html_body}')
+        return
+
+    msg = build_message(entry, config.get('MAIL_DEFAULT_SENDER'))
+    try:
+        with smtp_pool.connection(config) as server:
+            server.send_message(msg)
+    except smtplib.SMTPServerDisconnected:
+        # A pooled connection dropped by the server: retry once on a new one
+        with smtp_pool.connection(config) as server:
+            server.send_message(msg)
+
+
+def retry_delay(attempts):
+    """Exponential backoff before the next delivery attempt"""
+    base = current_app.config.get('MAIL_RETRY_BASE_SECONDS', 30)
+    return timedelta(seconds=min(base * 2 ** max(attempts - 1, 0), 3600))
+
+
+def _claim(entry_id, now):
+    """Reserve a due entry for this worker; False if another one got it"""
+    table = EmailOutbox.__table__
+    result = db.session.execute(
+        update(table)
+        .where(table.c.id == entry_id, table.c.status == 'pending', table.c.next_attempt_at <= now)
+        .values(attempts=table.c.attempts + 1, next_attempt_at=now + CLAIM_LEASE)
+    )
+    db.session.commit()
+    return result.rowcount == 1
+
+
+def drain_outbox(batch_size=50):
+    """
+    Deliver due outbox emails
+
+    Returns:
+        tuple: (sent, failed) counts; failed entries will not be retried
+    """
+    now = datetime.utcnow()
+    due_ids = db.session.scalars(
+        db.select(EmailOutbox.id)
+        .where(EmailOutbox.status == 'pending', EmailOutbox.next_attempt_at <= now)
+        .order_by(EmailOutbox.id)
+        .limit(batch_size)
+    ).all()
+
+    max_attempts = current_app.config.get('MAIL_MAX_ATTEMPTS', 6)
+    sent = failed = 0
+    for entry_id in due_ids:
+        if not _claim(entry_id, now):
+            continue
+
+        entry = db.session.get(EmailOutbox, entry_id)
+        try:
+            deliver(entry)
+            entry.status = 'sent'
+            entry.sent_at = datetime.utcnow()
+            entry.last_error = None
+            sent += 1
+        except Exception as e:
+            current_app.logger.error(f'Error sending email {entry.id}: {str(e)}')
+            entry.last_error = str(e)[:1000]
+            if entry.attempts >= max_attempts:
+                entry.status = 'failed'
+                failed += 1
+            else:
+                entry.next_attempt_at = datetime.utcnow() + retry_delay(entry.attempts)
+        db.session.commit()
+
+    return sent, failed
+
+
+def _wake_worker(session):
+    """Deliver newly committed emails without waiting for the next poll"""
+    if session.info.pop('outbox_queued', False):
+        from app.worker import wake
+        wake()
+
+
+def _discard_queued(session):
+    session.info.pop('outbox_queued', None)
+
+
+event.listen(db.session, 'after_commit', _wake_worker)
+event.listen(db.session, 'after_rollback', _discard_queued)
@@ -0,0 +1,169 @@
+"""
+Password hashing for Stycly
+Selectable hash algorithm and cost (PASSWORD_HASH_METHOD), hashing and
+verification on a small bounded thread pool instead of the request
+thread, and detection of hashes made with older settings so they can be
+upgraded on the next successful login
+"""
+
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from werkzeug.security import DEFAULT_PBKDF2_ITERATIONS, check_password_hash, generate_password_hash
+
+try:
+    import argon2
+except ImportError:  # argon2 hashes need the optional argon2-cffi package
+    argon2 = None
+
+DEFAULT_METHOD = 'scrypt:32768:8:1'
+
+# Default cost parameters when a method names fewer of them
+SCRYPT_DEFAULTS = (32768, 8, 1)  # n, r, p
+ARGON2_DEFAULTS = (3, 65536, 4)  # time cost, memory cost (KiB), parallelism
+
+
+class HashingBusy(Exception):
+    """All hashing slots stayed taken for longer than the wait timeout"""
+
+
+def normalize_method(method):
+    """
+    Method string with every cost parameter spelled out
+
+    Args:
+        method: 'pbkdf2[:hash[:iterations]]', 'scrypt[:n[:r[:p]]]' or
+            'argon2[:time_cost[:memory_cost[:parallelism]]]'
+
+    Returns:
+        str: e.g. 'pbkdf2:sha256:600000', as found at the start of hashes
+
+    Raises:
+        ValueError: unknown method, or argon2 without argon2-cffi
+    """
+    name, *params = method.strip().split(':')
+    if name == 'pbkdf2':
+        hash_name = params[0] if params else 'sha256'
+        iterations = int(params[1]) if len(params) > 1 else DEFAULT_PBKDF2_ITERATIONS
+        return f'pbkdf2:{hash_name}:{iterations}'
+    if name in ('scrypt', 'argon2'):
+        if name == 'argon2' and argon2 is None:
+            raise ValueError('argon2 password hashing needs the argon2-cffi package')
+        defaults = SCRYPT_DEFAULTS if name == 'scrypt' else ARGON2_DEFAULTS
+        values = [int(value) for value in params] + list(defaults[len(params):])
+        return ':'.join([name] + [str(value) for value in values[:3]])
+    raise ValueError(f'Unknown password hash method: {method}')
+
+
+def hash_method(password_hash):
+    """Normalized method of a stored hash, or None if unrecognized"""
+    if password_hash.startswith('$argon2'):
+        # $argon2id$v=19$m=65536,t=3,p=4$salt$hash
+        try:
+            params = dict(pair.split('=') for pair in password_hash.split('$')[3].split(','))
+            return f"argon2:{params['t']}:{params['m']}:{params['p']}"
+        except (IndexError, KeyError, ValueError):
+            return None
+    if '$' not in password_hash:
+        return None
+    return password_hash.split('$', 1)[0]
+
+
+def _argon2_hasher(method):
+    time_cost, memory_cost, parallelism = (int(value) for value in method.split(':')[1:])
+    return argon2.PasswordHasher(time_cost=time_cost, memory_cost=memory_cost, parallelism=parallelism)
+
+
+def _hash(method, password):
+    if method.startswith('argon2:'):
+        return _argon2_hasher(method).hash(password)
+    return generate_password_hash(password, method=method)
+
+
+def _verify(password_hash, password):
+    if password_hash.startswith('$argon2'):
+        if argon2 is None:
+            return False
+        try:
+            # Cost parameters are read from the hash itself
+            return argon2.PasswordHasher().verify(password_hash, password)
+        except (argon2.exceptions.VerificationError, argon2.exceptions.InvalidHashError):
+            return False
+    return check_password_hash(password_hash, password)
+
+
+class PasswordHasher:
+    """
+    Hashes and verifies passwords on a bounded thread pool
+
+    At most `workers` hashes run at once per process and at most
+    `queue_size` more wait for a thread; further callers wait up to
+    `timeout` seconds for a slot and then get HashingBusy. The hash
+    functions release the GIL, so threads serving other requests keep
+    running meanwhile. With workers=0 hashing runs on the caller's thread.
+    """
+
+    def __init__(self, method=DEFAULT_METHOD, workers=2, queue_size=16, timeout=10):
+        self._executor = None
+        self._executor_pid = None
+        self._lock = threading.Lock()
+        self.configure(method, workers, queue_size, timeout)
+
+    def configure(self, method, workers, queue_size, timeout):
+        """Set the hash method and pool limits (before first use)"""
+        self.method = normalize_method(method)
+        self.workers = workers
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(workers + queue_size)
+
+    def _pool(self):
+        """Thread pool of this process (forked web workers create their own)"""
+        if self._executor_pid != os.getpid():
+            with self._lock:
+                if self._executor_pid != os.getpid():
+                    self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix='stycly-hash')
+                    self._executor_pid = os.getpid()
+        return self._executor
+
+    def _run(self, func, *args):
+        if not self.workers:
+            return func(*args)
+
+        slots = self._slots
+        if not slots.acquire(timeout=self.timeout):
+            raise HashingBusy()
+        try:
+            future = self._pool().submit(func, *args)
+        except BaseException:
+            slots.release()
+            raise
+        # The slot is freed when the hash finishes, even if the caller is gone
+        future.add_done_callback(lambda _: slots.release())
+        return future.result()
+
+    def hash(self, password):
+        """Hash a password with the configured method"""
+        return self._run(_hash, self.method, password)
+
+    def verify(self, password_hash, password):
+        """Check a password against a stored hash of any supported method"""
+        if not password_hash:
+            return False
+        return self._run(_verify, password_hash, password)
+
+    def needs_rehash(self, password_hash):
+        """Whether a stored hash was made with other settings than the configured ones"""
+        return hash_method(password_hash) != self.method
+
+
+password_hasher = PasswordHasher()
+
+
+def init_passwords(app):
+    """Configure the hash method and size the hashing pool"""
+    password_hasher.configure(
+        app.config.get('PASSWORD_HASH_METHOD', DEFAULT_METHOD),
+        app.config.get('PASSWORD_HASH_WORKERS', 2),
+        app.config.get('PASSWORD_HASH_QUEUE', 16),
+        app.config.get('PASSWORD_HASH_TIMEOUT', 10)
+    )
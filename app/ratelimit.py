@@ -0,0 +1,177 @@
+"""
+Rate limiting for Stycly
+Token buckets keyed by client IP and by submitted email, stored in a small
+SQLite file shared by every worker process on the host. Limited requests
+get a 429 before any password hashing or database work.
+"""
+
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+from functools import wraps
+from flask import current_app, flash, render_template, request
+
+# Largest token debt: a client retrying while limited waits at most two
+# tokens' worth of time after it stops
+MAX_DEBT = 1
+
+_UNITS = {'s': 1, 'm': 60, 'h': 3600}
+_RATE = re.compile(r'^\s*(\d+)\s*/\s*(\d*)\s*([smh])\s*$')
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS buckets (
+    key TEXT PRIMARY KEY,
+    tokens REAL NOT NULL,
+    updated_at REAL NOT NULL
+)
+'''
+
+# Refill, then take one token; a negative result means limited
+_TAKE = '''
+INSERT INTO buckets (key, tokens, updated_at) VALUES (:key, :capacity - 1, :now)
+ON CONFLICT (key) DO UPDATE SET
+    tokens = MAX(MIN(:capacity, tokens + MAX(:now - updated_at, 0) * :rate) - 1, -:max_debt),
+    updated_at = :now
+RETURNING tokens
+'''
+
+
+def parse_rate(value):
+    """
+    Parse a limit such as '10/15m': 10 requests per 15 minutes
+
+    Returns:
+        tuple: (capacity, tokens per second)
+
+    Raises:
+        ValueError: malformed limit
+    """
+    match = _RATE.match(value)
+    if not match:
+        raise ValueError(f'Invalid rate limit: {value!r} (expected e.g. 10/15m)')
+    count, amount, unit = (int(match.group(1)), int(match.group(2) or 1), match.group(3))
+    if count < 1 or amount < 1:
+        raise ValueError(f'Invalid rate limit: {value!r} (must allow at least 1 request)')
+    return count, count / (amount * _UNITS[unit])
+
+
+class RateLimiter:
+    """Token buckets in a SQLite file, one connection per thread and process"""
+
+    def __init__(self, path=None, timeout=2):
+        self.path = path
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute(_SCHEMA)
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    def take(self, key, capacity, rate):
+        """
+        Take one token from a bucket
+
+        Returns:
+            float: 0 if allowed, else seconds until a token is available
+        """
+        tokens = self._connection().execute(_TAKE, {
+            'key': key, 'capacity': capacity, 'rate': rate, 'now': time.time(), 'max_debt': MAX_DEBT
+        }).fetchone()[0]
+        return 0 if tokens >= 0 else (1 - tokens) / rate
+
+    def prune(self, max_age):
+        """Delete buckets untouched for max_age seconds (full again by then)"""
+        cursor = self._connection().execute(
+            'DELETE FROM buckets WHERE updated_at < ?', (time.time() - max_age,)
+        )
+        return cursor.rowcount
+
+
+rate_limiter = RateLimiter()
+
+# Endpoint -> {'ip' or 'email': (capacity, tokens per second)}
+_limits = {}
+
+
+def init_rate_limiter(app):
+    """Parse the configured limits and place the bucket file"""
+    path = app.config.get('RATE_LIMIT_DB') or os.path.join(app.instance_path, 'ratelimit.db')
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    rate_limiter.path = path
+
+    _limits.clear()
+    for endpoint, limits in app.config.get('RATE_LIMITS', {}).items():
+        _limits[endpoint] = {scope: parse_rate(value) for scope, value in limits.items() if value}
+
+
+def prune_buckets():
+    """Delete idle buckets; run periodically by the worker"""
+    # A bucket refills within its period, the longest being capacity / rate
+    periods = [capacity / rate for limits in _limits.values() for capacity, rate in limits.values()]
+    return rate_limiter.prune(max(periods, default=3600))
+
+
+def _bucket_keys(endpoint):
+    """(scope, bucket key) pairs of the current request"""
+    keys = [('ip', f'{endpoint}:ip:{request.remote_addr}')]
+    email = request.form.get('email', '').strip().lower()
+    if email:
+        # Addresses are not stored in the clear
+        digest = hashlib.sha256(email.encode('utf-8')).hexdigest()[:32]
+        keys.append(('email', f'{endpoint}:email:{digest}'))
+    return keys
+
+
+def check_limits(endpoint):
+    """
+    Take a token from each bucket of the current request
+
+    Returns:
+        float: 0 if allowed, else seconds until the request may be retried
+    """
+    limits = _limits.get(endpoint, {})
+    for scope, key in _bucket_keys(endpoint):
+        if scope not in limits:
+            continue
+        try:
+            retry_after = rate_limiter.take(key, *limits[scope])
+        except sqlite3.Error as e:
+            # Never lock everyone out because the bucket file is unavailable
+            current_app.logger.warning(f'Rate limiter unavailable: {str(e)}')
+            return 0
+        if retry_after:
+            return retry_after
+    return 0
+
+
+def rate_limited(endpoint, template):
+    """
+    Limit POST requests to a view by client IP and submitted email
+
+    Args:
+        endpoint: key of the limits in RATE_LIMITS
+        template: page re-rendered with an error when limited
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            if request.method == 'POST' and current_app.config.get('RATE_LIMIT_ENABLED', True):
+                retry_after = check_limits(endpoint)
+                if retry_after:
+                    minutes = max(1, round(retry_after / 60))
+                    flash(f'Troppi tentativi. Riprova tra {minutes} minut{"o" if minutes == 1 else "i"}.', 'danger')
+                    response = current_app.make_response((render_template(template), 429))
+                    response.headers['Retry-After'] = str(int(retry_after) + 1)
+                    return response
+            return f(*args, **kwargs)
+        return decorated_function
+    return decorator
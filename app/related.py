@@ -0,0 +1,275 @@
+"""
+Related products for Stycly
+Precomputes the most similar public items for every public item and keeps
+the lists up to date incrementally: changed items are queued with the
+change and their lists are refreshed by the worker, off the request
+"""
+
+from datetime import datetime
+from flask import current_app
+from sqlalchemy import event, select, delete, insert, case, or_, func, literal
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
+from app import db
+from app.models import WardrobeItem, RelatedItem, RelatedRefresh
+from app.serializers import RELATED_COLUMNS
+
+# Similarity weight of each matching attribute
+SIMILARITY_WEIGHTS = {
+    'category': 5,
+    'destination': 3,
+    'size': 2,
+    'age_range': 2,
+    'color': 1,
+    'condition': 1,
+}
+
+# Attributes whose change can alter similarity scores
+_RELEVANT_ATTRIBUTES = tuple(SIMILARITY_WEIGHTS) + ('is_public_for_rent',)
+
+_items = WardrobeItem.__table__
+_related = RelatedItem.__table__
+_queue = RelatedRefresh.__table__
+
+
+def related_count():
+    """Number of neighbours stored per item"""
+    return current_app.config.get('RELATED_ITEMS_COUNT', 8)
+
+
+def _attributes(conn, item_id):
+    """Similarity attributes of a public item, or None if missing/private"""
+    columns = [_items.c[name] for name in SIMILARITY_WEIGHTS]
+    row = conn.execute(
+        select(*columns).where(_items.c.id == item_id, _items.c.is_public_for_rent == True)
+    ).first()
+    return dict(row._mapping) if row else None
+
+
+def _score_expression(attributes):
+    """SQL expression scoring an item's similarity to the given attributes"""
+    terms = [
+        case((_items.c[name] == attributes[name], weight), else_=0)
+        for name, weight in SIMILARITY_WEIGHTS.items()
+        if attributes.get(name)
+    ]
+    return sum(terms, literal(0))
+
+
+def _candidate_condition(attributes):
+    """Only items sharing the category or destination are worth scoring"""
+    shared = [_items.c[name] == attributes[name] for name in ('category', 'destination') if attributes.get(name)]
+    return or_(*shared) if shared else literal(False)
+
+
+def compute_neighbours(conn, item_id, attributes=None):
+    """
+    Top-N most similar public items of an item
+
+    Returns:
+        list: (related_id, score) tuples, best first
+    """
+    attributes = attributes or _attributes(conn, item_id)
+    if not attributes:
+        return []
+
+    score = _score_expression(attributes)
+    rows = conn.execute(
+        select(_items.c.id, score.label('score'))
+        .where(
+            _items.c.is_public_for_rent == True,
+            _items.c.id != item_id,
+            _candidate_condition(attributes)
+        )
+        .order_by(score.desc(), _items.c.id)
+        .limit(related_count())
+    ).all()
+    return [(row.id, row.score) for row in rows if row.score > 0]
+
+
+def store_neighbours(conn, item_id):
+    """Recompute and replace the stored neighbour list of one item"""
+    conn.execute(delete(_related).where(_related.c.item_id == item_id))
+    neighbours = compute_neighbours(conn, item_id)
+    if neighbours:
+        conn.execute(insert(_related), [
+            {'item_id': item_id, 'related_id': related_id, 'score': score}
+            for related_id, score in neighbours
+        ])
+    return neighbours
+
+
+def refresh_related(conn, item_ids):
+    """
+    Incrementally update neighbour lists after the given items changed
+
+    For each changed item: rebuild its own list, rebuild the lists that
+    contained it, and rebuild the lists it now qualifies for (its score
+    beats their weakest neighbour, or they are not full yet).
+    """
+    limit = related_count()
+    to_rebuild = set()
+
+    for item_id in set(item_ids):
+        to_rebuild.add(item_id)
+
+        # Lists that currently include the item
+        to_rebuild.update(conn.execute(
+            select(_related.c.item_id).where(_related.c.related_id == item_id)
+        ).scalars())
+
+        attributes = _attributes(conn, item_id)
+        if not attributes:
+            # Deleted or no longer public: it only has to disappear
+            conn.execute(delete(_related).where(_related.c.related_id == item_id))
+            continue
+
+        # Lists the item may now enter (similarity is symmetric). Items
+        # without a stored list are skipped: they are filled on first view.
+        size = select(func.count()).where(_related.c.item_id == _items.c.id).scalar_subquery()
+        weakest = select(func.min(_related.c.score)).where(_related.c.item_id == _items.c.id).scalar_subquery()
+        score = _score_expression(attributes)
+        to_rebuild.update(conn.execute(
+            select(_items.c.id)
+            .where(
+                _items.c.is_public_for_rent == True,
+                _items.c.id != item_id,
+                _candidate_condition(attributes),
+                size > 0,
+                or_(size < limit, score > weakest)
+            )
+        ).scalars())
+
+    for item_id in to_rebuild:
+        store_neighbours(conn, item_id)
+
+    return len(to_rebuild)
+
+
+def related_products(item_id, limit=4):
+    """
+    Related public items of an item as RELATED_COLUMNS rows, best first
+
+    Lists are filled lazily the first time an item is viewed, on a
+    connection of their own so the request's session is left alone.
+    """
+    query = select(*RELATED_COLUMNS).join(
+        RelatedItem, RelatedItem.related_id == WardrobeItem.id
+    ).where(
+        RelatedItem.item_id == item_id,
+        WardrobeItem.is_public_for_rent == True
+    ).order_by(RelatedItem.score.desc(), RelatedItem.related_id).limit(limit)
+
+    rows = db.session.execute(query).all()
+    if not rows and not RelatedItem.query.filter_by(item_id=item_id).first():
+        try:
+            with db.engine.begin() as conn:
+                filled = store_neighbours(conn, item_id)
+        except IntegrityError:
+            # Filled by a concurrent request
+            filled = True
+        if filled:
+            rows = db.session.execute(query).all()
+
+    return rows
+
+
+def rebuild_related(batch_size=500):
+    """Recompute every public item's list. Returns the number of items."""
+    count = 0
+    with db.engine.begin() as conn:
+        conn.execute(delete(_related))
+        item_ids = conn.execute(
+            select(_items.c.id).where(_items.c.is_public_for_rent == True).order_by(_items.c.id)
+        ).scalars().all()
+
+    # Commit in batches to keep transactions short
+    for start in range(0, len(item_ids), batch_size):
+        with db.engine.begin() as conn:
+            for item_id in item_ids[start:start + batch_size]:
+                store_neighbours(conn, item_id)
+                count += 1
+
+    return count
+
+
+def mark_changed(item_ids, session=None):
+    """Queue items for a related-list refresh (in the current transaction)"""
+    session = session or db.session
+    rows = [{'item_id': item_id, 'queued_at': datetime.utcnow()} for item_id in set(item_ids)]
+    if not rows:
+        return
+
+    conn = session.connection()
+    if conn.dialect.name == 'postgresql':
+        conn.execute(postgresql.insert(_queue).on_conflict_do_nothing(), rows)
+    elif conn.dialect.name == 'sqlite':
+        conn.execute(sqlite.insert(_queue).on_conflict_do_nothing(), rows)
+    else:
+        queued = set(conn.execute(
+            select(_queue.c.item_id).where(_queue.c.item_id.in_([row['item_id'] for row in rows]))
+        ).scalars())
+        missing = [row for row in rows if row['item_id'] not in queued]
+        if missing:
+            conn.execute(insert(_queue), missing)
+    session.info['related_queued'] = True
+
+
+def refresh_queued(batch_size=None):
+    """
+    Refresh the related lists of queued items, one transaction per batch
+
+    A batch is taken off the queue in the transaction that refreshes it,
+    so items queued again meanwhile stay queued for the next run.
+
+    Returns:
+        int: number of refreshed items
+    """
+    batch_size = batch_size or current_app.config.get('RELATED_REFRESH_BATCH', 50)
+    refreshed = 0
+    while True:
+        with db.engine.begin() as conn:
+            query = select(_queue.c.item_id).order_by(_queue.c.queued_at).limit(batch_size)
+            if conn.dialect.name == 'postgresql':
+                # Other workers take the next batch instead of waiting
+                query = query.with_for_update(skip_locked=True)
+            item_ids = conn.execute(query).scalars().all()
+            if item_ids:
+                conn.execute(delete(_queue).where(_queue.c.item_id.in_(item_ids)))
+                refresh_related(conn, item_ids)
+        refreshed += len(item_ids)
+        if len(item_ids) < batch_size:
+            return refreshed
+
+
+def _collect_changes(session, flush_context):
+    """Queue flushed items whose similarity attributes changed"""
+    changed = set()
+    for obj in list(session.new) + list(session.deleted):
+        if isinstance(obj, WardrobeItem):
+            changed.add(obj.id)
+
+    for obj in session.dirty:
+        if isinstance(obj, WardrobeItem):
+            state = db.inspect(obj)
+            if any(state.attrs[name].history.has_changes() for name in _RELEVANT_ATTRIBUTES):
+                changed.add(obj.id)
+
+    if changed:
+        mark_changed(changed, session)
+
+
+def _wake_worker(session):
+    """Refresh newly queued items without waiting for the next poll"""
+    if session.info.pop('related_queued', False):
+        from app.worker import wake
+        wake()
+
+
+def _discard_queued(session):
+    session.info.pop('related_queued', None)
+
+
+event.listen(db.session, 'after_flush', _collect_changes)
+event.listen(db.session, 'after_commit', _wake_worker)
+event.listen(db.session, 'after_rollback', _discard_queued)
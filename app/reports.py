@@ -0,0 +1,413 @@
+"""
+Order reports for Stycly
+Admin order listing with keyset pagination, and order statistics read from
+summary tables that are updated as orders are created, change status or are
+deleted, so reports cost O(days) or O(items) instead of O(orders)
+"""
+
+import base64
+import json
+from collections import defaultdict
+from datetime import datetime, timedelta
+from sqlalchemy import event, select, insert, update, delete, func, and_, or_, bindparam
+from sqlalchemy.dialects import postgresql, sqlite
+from app import db
+from app.models import Order, OrderItem, WardrobeItem, OrderDailyStat, ItemRentalStat
+from app.catalog import InvalidCursor
+
+ORDER_STATUSES = ('pending', 'confirmed', 'completed', 'cancelled')
+
+# Statuses counted as rented in category and top item statistics
+RENTED_STATUSES = ('pending', 'confirmed', 'completed')
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+_orders = Order.__table__
+_order_items = OrderItem.__table__
+_daily = OrderDailyStat.__table__
+_item_stats = ItemRentalStat.__table__
+
+# Columns of an order in the admin listing, in serialization order
+ORDER_LIST_COLUMNS = (
+    Order.id,
+    Order.created_at,
+    Order.name,
+    Order.email,
+    Order.phone,
+    Order.start_date,
+    Order.end_date,
+    Order.status,
+    Order.item_count,
+)
+
+
+def parse_report_filters(args):
+    """
+    Status and creation date filters from request args
+
+    Raises:
+        ValueError: with a message for the client if a filter is invalid
+    """
+    filters = {}
+
+    status = (args.get('status') or '').strip()
+    if status:
+        if status not in ORDER_STATUSES:
+            raise ValueError('Invalid status')
+        filters['status'] = status
+
+    for name in ('from', 'to'):
+        value = (args.get(name) or '').strip()
+        if value:
+            try:
+                filters[name] = datetime.strptime(value, '%Y-%m-%d').date()
+            except ValueError:
+                raise ValueError(f'Invalid {name} date')
+
+    return filters
+
+
+def parse_page_size(value):
+    """Clamp requested page size to the allowed range"""
+    try:
+        size = int(value)
+    except (TypeError, ValueError):
+        return DEFAULT_PAGE_SIZE
+    return max(1, min(size, MAX_PAGE_SIZE))
+
+
+def encode_order_cursor(created_at, order_id):
+    """Opaque cursor pointing after the given order"""
+    payload = json.dumps([created_at.isoformat(), order_id], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_order_cursor(cursor):
+    """Decode a cursor produced by encode_order_cursor"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        created_at, order_id = json.loads(base64.urlsafe_b64decode(padded))
+        return datetime.fromisoformat(created_at), int(order_id)
+    except (ValueError, TypeError):
+        raise InvalidCursor('Invalid cursor')
+
+
+def serialize_order(row):
+    """JSON-ready dict of an ORDER_LIST_COLUMNS row"""
+    return {
+        'id': row.id,
+        'created_at': row.created_at.isoformat(' ', 'minutes') if row.created_at else None,
+        'name': row.name,
+        'email': row.email,
+        'phone': row.phone,
+        'start_date': row.start_date.isoformat(),
+        'end_date': row.end_date.isoformat(),
+        'status': row.status,
+        'item_count': row.item_count,
+    }
+
+
+def orders_page(filters, cursor=None, page_size=DEFAULT_PAGE_SIZE):
+    """
+    One page of orders, newest first
+
+    Returns:
+        dict: {'orders': [...], 'next_cursor': str or None}
+    """
+    query = select(*ORDER_LIST_COLUMNS)
+    if 'status' in filters:
+        query = query.where(Order.status == filters['status'])
+    if 'from' in filters:
+        query = query.where(Order.created_at >= filters['from'])
+    if 'to' in filters:
+        query = query.where(Order.created_at < filters['to'] + timedelta(days=1))
+
+    if cursor:
+        created_at, last_id = decode_order_cursor(cursor)
+        query = query.where(or_(
+            Order.created_at < created_at,
+            and_(Order.created_at == created_at, Order.id < last_id)
+        ))
+
+    # Fetch one extra row to know whether another page exists
+    rows = db.session.execute(
+        query.order_by(Order.created_at.desc(), Order.id.desc()).limit(page_size + 1)
+    ).all()
+    next_cursor = None
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        next_cursor = encode_order_cursor(rows[-1].created_at, rows[-1].id)
+
+    return {'orders': [serialize_order(row) for row in rows], 'next_cursor': next_cursor}
+
+
+def order_stats(filters, top_limit=10):
+    """
+    Order statistics from the summary tables
+
+    Daily figures honour every filter; categories and top items cover all
+    time, for the given status or every rented status.
+
+    Returns:
+        dict: {'totals', 'daily', 'categories', 'top_items'}
+    """
+    daily_query = select(_daily.c.day, _daily.c.status, _daily.c.orders, _daily.c.units)
+    if 'status' in filters:
+        daily_query = daily_query.where(_daily.c.status == filters['status'])
+    if 'from' in filters:
+        daily_query = daily_query.where(_daily.c.day >= filters['from'])
+    if 'to' in filters:
+        daily_query = daily_query.where(_daily.c.day <= filters['to'])
+
+    daily = []
+    totals = {'orders': 0, 'units': 0}
+    for day, status, orders, units in db.session.execute(daily_query.order_by(_daily.c.day, _daily.c.status)):
+        if not orders and not units:
+            continue
+        daily.append({'day': day.isoformat(), 'status': status, 'orders': orders, 'units': units})
+        totals['orders'] += orders
+        totals['units'] += units
+
+    statuses = [filters['status']] if 'status' in filters else list(RENTED_STATUSES)
+    units = func.sum(_item_stats.c.units).label('units')
+    lines = func.sum(_item_stats.c.orders).label('orders')
+
+    categories = db.session.execute(
+        select(WardrobeItem.category, lines, units)
+        .join(WardrobeItem, WardrobeItem.id == _item_stats.c.item_id)
+        .where(_item_stats.c.status.in_(statuses))
+        .group_by(WardrobeItem.category)
+        .having(func.sum(_item_stats.c.units) > 0)
+        .order_by(units.desc())
+    )
+    top_items = db.session.execute(
+        select(WardrobeItem.id, WardrobeItem.title, WardrobeItem.category, lines, units)
+        .join(WardrobeItem, WardrobeItem.id == _item_stats.c.item_id)
+        .where(_item_stats.c.status.in_(statuses))
+        .group_by(WardrobeItem.id, WardrobeItem.title, WardrobeItem.category)
+        .having(func.sum(_item_stats.c.units) > 0)
+        .order_by(units.desc(), WardrobeItem.id)
+        .limit(top_limit)
+    )
+
+    return {
+        'totals': totals,
+        'daily': daily,
+        'categories': [
+            {'category': category, 'orders': orders, 'units': units}
+            for category, orders, units in categories
+        ],
+        'top_items': [
+            {'id': item_id, 'title': title, 'category': category, 'orders': orders, 'units': units}
+            for item_id, title, category, orders, units in top_items
+        ],
+    }
+
+
+def _insert_missing(conn, table, rows):
+    """Create zero rows so that every summary key can be incremented"""
+    if conn.dialect.name == 'postgresql':
+        conn.execute(postgresql.insert(table).on_conflict_do_nothing(), rows)
+    elif conn.dialect.name == 'sqlite':
+        conn.execute(sqlite.insert(table).on_conflict_do_nothing(), rows)
+    else:
+        keys = [column.name for column in table.primary_key.columns]
+        for row in rows:
+            exists = conn.execute(
+                select(table.c[keys[0]]).where(*[table.c[key] == row[key] for key in keys])
+            ).first()
+            if not exists:
+                conn.execute(insert(table), [row])
+
+
+def _increment(conn, table, deltas):
+    """
+    Add (orders, units) deltas to summary rows with atomic increments
+
+    Keys are the table's primary key values; rows are updated in key order
+    so concurrent transactions lock them in the same order. Rows brought
+    back to zero are deleted, as rebuild_order_stats would not create them.
+    """
+    keys = [column.name for column in table.primary_key.columns]
+    deltas = {key: delta for key, delta in sorted(deltas.items()) if any(delta)}
+    if not deltas:
+        return
+
+    key_match = [table.c[key] == bindparam(f'k_{key}') for key in keys]
+    _insert_missing(conn, table, [dict(zip(keys, key), orders=0, units=0) for key in deltas])
+    conn.execute(
+        update(table)
+        .where(*key_match)
+        .values(orders=table.c.orders + bindparam('d_orders'), units=table.c.units + bindparam('d_units')),
+        [
+            {**{f'k_{name}': value for name, value in zip(keys, key)}, 'd_orders': orders, 'd_units': units}
+            for key, (orders, units) in deltas.items()
+        ]
+    )
+    conn.execute(
+        delete(table).where(*key_match, table.c.orders == 0, table.c.units == 0),
+        [{f'k_{name}': value for name, value in zip(keys, key)} for key in deltas]
+    )
+
+
+def _previous(obj, name):
+    """Value of an attribute before the current flush"""
+    history = db.inspect(obj).attrs[name].history
+    if history.deleted:
+        return history.deleted[0]
+    if history.unchanged:
+        return history.unchanged[0]
+    return getattr(obj, name)
+
+
+def _keep_previous(target, value, oldvalue, initiator):
+    """No-op listener; registering it makes SQLAlchemy keep previous values"""
+
+
+def _load_deleted(session, flush_context, instances):
+    """Load deleted orders and lines while their rows still exist"""
+    for obj in session.deleted:
+        if isinstance(obj, Order):
+            obj.created_at, obj.status
+        elif isinstance(obj, OrderItem):
+            obj.order_id, obj.wardrobe_item_id, obj.quantity
+
+
+def _sync_order_stats(session, flush_context):
+    """Apply the flushed order changes to the summary tables"""
+    orders = {}  # order id -> (day, status before, status after)
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if not isinstance(obj, Order) or obj.created_at is None:
+            continue
+        if obj in session.new:
+            orders[obj.id] = (obj.created_at.date(), None, obj.status)
+        elif obj in session.deleted:
+            orders[obj.id] = (obj.created_at.date(), _previous(obj, 'status'), None)
+        else:
+            orders[obj.id] = (obj.created_at.date(), _previous(obj, 'status'), obj.status)
+
+    lines = [obj for obj in list(session.new) + list(session.dirty) + list(session.deleted)
+             if isinstance(obj, OrderItem)]
+    if not orders and not lines:
+        return
+
+    conn = session.connection()
+    missing = {_previous(line, 'order_id') for line in lines} | {line.order_id for line in lines}
+    missing -= set(orders)
+    missing.discard(None)
+    if missing:
+        for order_id, created_at, status in conn.execute(
+            select(_orders.c.id, _orders.c.created_at, _orders.c.status).where(_orders.c.id.in_(missing))
+        ):
+            if created_at is not None:
+                orders[order_id] = (created_at.date(), status, status)
+
+    daily = defaultdict(lambda: [0, 0])
+    items = defaultdict(lambda: [0, 0])
+
+    def add_line(order_id, item_id, quantity, sign, after):
+        """Count a line under its order's status before or after the flush"""
+        if order_id not in orders or item_id is None:
+            return
+        day, before_status, after_status = orders[order_id]
+        status = (after_status if after else before_status) or after_status
+        if status is None:
+            return
+        daily[(day, status)][1] += sign * (quantity or 0)
+        items[(item_id, status)][0] += sign
+        items[(item_id, status)][1] += sign * (quantity or 0)
+
+    new_lines = set()
+    for line in lines:
+        if line in session.new:
+            new_lines.add(line.id)
+            add_line(line.order_id, line.wardrobe_item_id, line.quantity, 1, after=True)
+        elif line in session.deleted:
+            add_line(_previous(line, 'order_id'), _previous(line, 'wardrobe_item_id'),
+                     _previous(line, 'quantity'), -1, after=False)
+        else:
+            add_line(_previous(line, 'order_id'), _previous(line, 'wardrobe_item_id'),
+                     _previous(line, 'quantity'), -1, after=False)
+            add_line(line.order_id, line.wardrobe_item_id, line.quantity, 1, after=False)
+
+    # Orders that were created, deleted or moved to another status
+    moved = []
+    for order_id, (day, before_status, after_status) in orders.items():
+        if before_status == after_status:
+            continue
+        if before_status is not None:
+            daily[(day, before_status)][0] -= 1
+        if after_status is not None:
+            daily[(day, after_status)][0] += 1
+        if before_status is not None and after_status is not None:
+            moved.append(order_id)
+
+    # Lines already stored under the previous status follow their order
+    if moved:
+        for line_id, order_id, item_id, quantity in conn.execute(
+            select(_order_items.c.id, _order_items.c.order_id, _order_items.c.wardrobe_item_id,
+                   _order_items.c.quantity)
+            .where(_order_items.c.order_id.in_(moved))
+        ):
+            if line_id in new_lines:
+                continue
+            add_line(order_id, item_id, quantity, -1, after=False)
+            add_line(order_id, item_id, quantity, 1, after=True)
+
+    _increment(conn, _daily, daily)
+    _increment(conn, _item_stats, items)
+
+
+def rebuild_order_stats(batch_size=1000):
+    """
+    Recompute both summary tables from the orders
+
+    Returns:
+        int: number of counted orders
+    """
+    daily = defaultdict(lambda: [0, 0])
+    units = (
+        select(_order_items.c.order_id, func.sum(_order_items.c.quantity).label('units'))
+        .group_by(_order_items.c.order_id)
+        .subquery()
+    )
+    rows = db.session.execute(
+        select(_orders.c.created_at, _orders.c.status, func.coalesce(units.c.units, 0))
+        .outerjoin(units, units.c.order_id == _orders.c.id)
+        .where(_orders.c.created_at.isnot(None), _orders.c.status.isnot(None))
+        .execution_options(yield_per=batch_size)
+    )
+    count = 0
+    for created_at, status, order_units in rows:
+        daily[(created_at.date(), status)][0] += 1
+        daily[(created_at.date(), status)][1] += order_units
+        count += 1
+
+    with db.engine.begin() as conn:
+        conn.execute(delete(_daily))
+        conn.execute(delete(_item_stats))
+        if daily:
+            conn.execute(insert(_daily), [
+                {'day': day, 'status': status, 'orders': orders, 'units': order_units}
+                for (day, status), (orders, order_units) in daily.items()
+            ])
+        conn.execute(insert(_item_stats).from_select(
+            ['item_id', 'status', 'orders', 'units'],
+            select(_order_items.c.wardrobe_item_id, _orders.c.status,
+                   func.count(), func.sum(_order_items.c.quantity))
+            .join(_orders, _orders.c.id == _order_items.c.order_id)
+            .where(_orders.c.status.isnot(None))
+            .group_by(_order_items.c.wardrobe_item_id, _orders.c.status)
+        ))
+
+    return count
+
+
+# Moving counts needs the values before a change, even when the attribute
+# was expired (e.g. after a commit) when it was set
+for _attribute in (Order.status, OrderItem.order_id, OrderItem.wardrobe_item_id, OrderItem.quantity):
+    event.listen(_attribute, 'set', _keep_previous, active_history=True)
+
+event.listen(db.session, 'before_flush', _load_deleted)
+event.listen(db.session, 'after_flush', _sync_order_stats)
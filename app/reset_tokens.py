@@ -0,0 +1,148 @@
+"""
+Password reset tokens for Stycly
+Tokens are sent by email and only their SHA-256 digest is stored, so the
+lookup key has a fixed width and a leaked table cannot be used to reset
+passwords. Each user keeps a few active tokens at most; expired and used
+tokens are deleted in bounded batches by the worker.
+"""
+
+import hashlib
+import secrets
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import delete, or_, select, text
+from app import db
+from app.models import PasswordResetToken
+
+_tokens = PasswordResetToken.__table__
+
+
+def hash_token(token):
+    """Stored form of a token: its SHA-256 hex digest (64 characters)"""
+    return hashlib.sha256(token.encode('utf-8')).hexdigest()
+
+
+def issue_reset_token(user):
+    """
+    Create a reset token for a user (in the current transaction)
+
+    The oldest active tokens beyond PASSWORD_RESET_MAX_ACTIVE - 1 are
+    deleted first, so at most PASSWORD_RESET_MAX_ACTIVE links work at once.
+
+    Returns:
+        str: the token to put in the reset link (not stored)
+    """
+    max_active = current_app.config.get('PASSWORD_RESET_MAX_ACTIVE', 3)
+    now = datetime.utcnow()
+
+    active = db.session.execute(
+        select(_tokens.c.id)
+        .where(_tokens.c.user_id == user.id, _tokens.c.used.is_not(True), _tokens.c.expires_at > now)
+        .order_by(_tokens.c.created_at.desc(), _tokens.c.id.desc())
+    ).scalars().all()
+    stale = active[max(max_active - 1, 0):]
+    if stale:
+        db.session.execute(delete(_tokens).where(_tokens.c.id.in_(stale)))
+
+    token = secrets.token_urlsafe(32)
+    db.session.add(PasswordResetToken(
+        user_id=user.id,
+        token_hash=hash_token(token),
+        created_at=now,
+        expires_at=now + timedelta(minutes=current_app.config.get('PASSWORD_RESET_TTL_MINUTES', 60))
+    ))
+    return token
+
+
+def find_reset_token(token):
+    """Stored token matching a reset link token, or None"""
+    return PasswordResetToken.query.filter_by(token_hash=hash_token(token)).first()
+
+
+def consume_reset_token(reset_token):
+    """Mark a token used and delete the user's other tokens (in the current transaction)"""
+    reset_token.used = True
+    db.session.execute(
+        delete(_tokens).where(_tokens.c.user_id == reset_token.user_id, _tokens.c.id != reset_token.id)
+    )
+
+
+def prune_reset_tokens(batch_size=500, max_batches=None):
+    """
+    Delete expired and used tokens, one committed batch at a time
+
+    Args:
+        batch_size: rows deleted per transaction
+        max_batches: stop after this many batches (None: until done)
+
+    Returns:
+        int: number of deleted tokens
+    """
+    deleted = 0
+    batches = 0
+    while max_batches is None or batches < max_batches:
+        ids = db.session.execute(
+            select(_tokens.c.id)
+            .where(or_(_tokens.c.expires_at <= datetime.utcnow(), _tokens.c.used.is_(True)))
+            .limit(batch_size)
+        ).scalars().all()
+        if not ids:
+            break
+
+        db.session.execute(delete(_tokens).where(_tokens.c.id.in_(ids)))
+        db.session.commit()
+        deleted += len(ids)
+        batches += 1
+        if len(ids) < batch_size:
+            break
+    return deleted
+
+
+def prune_reset_tokens_task():
+    """Bounded pruning run by the worker"""
+    return prune_reset_tokens(max_batches=current_app.config.get('PASSWORD_RESET_PRUNE_BATCHES', 20))
+
+
+def table_size():
+    """
+    Rows of the token table and its on-disk size with indexes
+
+    Returns:
+        tuple: (rows, bytes); bytes is None where the database cannot
+            report it (SQLite built without the dbstat table)
+    """
+    rows = db.session.execute(select(db.func.count()).select_from(_tokens)).scalar()
+
+    dialect = db.engine.dialect.name
+    try:
+        if dialect == 'postgresql':
+            size = db.session.execute(
+                text('SELECT pg_total_relation_size(:table)'), {'table': _tokens.name}
+            ).scalar()
+        elif dialect == 'sqlite':
+            size = db.session.execute(
+                text('SELECT SUM(pgsize) FROM dbstat WHERE name = :table OR name IN '
+                     '(SELECT name FROM sqlite_master WHERE type = \'index\' AND tbl_name = :table)'),
+                {'table': _tokens.name}
+            ).scalar()
+        else:
+            size = None
+    except Exception:
+        db.session.rollback()
+        size = None
+    return rows, size
+
+
+def compact_table():
+    """
+    Give the space of deleted rows back to the database
+
+    PostgreSQL vacuums the table only; SQLite has no per-table vacuum and
+    rewrites the whole database file.
+    """
+    with db.engine.connect() as conn:
+        conn = conn.execution_options(isolation_level='AUTOCOMMIT')
+        if db.engine.dialect.name == 'postgresql':
+            conn.exec_driver_sql(f'VACUUM ANALYZE {_tokens.name}')
+        elif db.engine.dialect.name == 'sqlite':
+            conn.exec_driver_sql('VACUUM')
@@ -0,0 +1,133 @@
+"""
+Admin routes for Stycly
+JSON API for managing rental orders and reading order statistics, and
+streaming data exports
+"""
+
+from flask import Blueprint, Response, jsonify, request, stream_with_context
+from app import db
+from app.models import Order
+from app.availability import ACTIVE_STATUSES, reserve_units
+from app.catalog import InvalidCursor
+from app.export import EXPORTS, FORMATS, export_filename, stream_export
+from app.reports import ORDER_STATUSES, order_stats, orders_page, parse_page_size, parse_report_filters
+from app.serializers import json_response
+from app.utils import admin_required
+
+admin_bp = Blueprint('admin', __name__, url_prefix='/api/admin')
+
+
+def _order_detail(order):
+    """JSON-ready dict of an order loaded with Order.get_with_items"""
+    return {
+        'id': order.id,
+        'created_at': order.created_at.isoformat(' ', 'minutes') if order.created_at else None,
+        'name': order.name,
+        'email': order.email,
+        'phone': order.phone,
+        'start_date': order.start_date.isoformat(),
+        'end_date': order.end_date.isoformat(),
+        'total_days': order.get_total_days(),
+        'notes': order.notes,
+        'status': order.status,
+        'item_count': order.get_item_count(),
+        'items': [
+            {
+                'wardrobe_item_id': line.wardrobe_item_id,
+                'title': line.item.title if line.item else None,
+                'size': line.item.size if line.item else None,
+                'quantity': line.quantity,
+            }
+            for line in order.items
+        ],
+    }
+
+
+@admin_bp.route('/orders')
+@admin_required
+def orders():
+    """Orders, newest first, filtered by status and creation date (keyset pagination)"""
+    try:
+        filters = parse_report_filters(request.args)
+        page = orders_page(filters, request.args.get('cursor'), parse_page_size(request.args.get('limit')))
+    except (ValueError, InvalidCursor) as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+
+    return json_response(page)
+
+
+@admin_bp.route('/orders/<int:order_id>')
+@admin_required
+def order_detail(order_id):
+    """One order with its items"""
+    order = Order.get_with_items(order_id)
+    if order is None:
+        return jsonify({'success': False, 'message': 'Order not found'}), 404
+
+    return json_response(_order_detail(order))
+
+
+@admin_bp.route('/orders/<int:order_id>/status', methods=['POST'])
+@admin_required
+def update_order_status(order_id):
+    """Change the status of an order"""
+    data = request.get_json(silent=True) or {}
+    status = data.get('status')
+    if status not in ORDER_STATUSES:
+        return jsonify({'success': False, 'message': 'Invalid status'}), 400
+
+    order = Order.get_with_items(order_id)
+    if order is None:
+        return jsonify({'success': False, 'message': 'Order not found'}), 404
+
+    # Reactivating an order takes its units again, if they are still free
+    if status in ACTIVE_STATUSES and order.status not in ACTIVE_STATUSES:
+        quantities = {}
+        for line in order.items:
+            quantities[line.wardrobe_item_id] = quantities.get(line.wardrobe_item_id, 0) + line.quantity
+        unavailable = reserve_units(db.session, order.id, quantities, order.start_date, order.end_date)
+        if unavailable:
+            db.session.rollback()
+            return jsonify({
+                'success': False,
+                'message': 'Items no longer available for these dates',
+                'item_ids': unavailable
+            }), 409
+
+    # Occupancy and order statistics follow the status change on flush
+    order.status = status
+    db.session.commit()
+
+    return json_response({'success': True, 'order': _order_detail(Order.get_with_items(order_id))})
+
+
+@admin_bp.route('/stats')
+@admin_required
+def stats():
+    """Orders per day and status, units per category and top items"""
+    try:
+        filters = parse_report_filters(request.args)
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+
+    top_limit = max(1, min(request.args.get('top', 10, type=int), 100))
+    return json_response(order_stats(filters, top_limit))
+
+
+@admin_bp.route('/export/<name>.<fmt>')
+@admin_required
+def export(name, fmt):
+    """Stream orders, order items or wardrobe items as CSV or NDJSON"""
+    if name not in EXPORTS or fmt not in FORMATS:
+        return jsonify({'success': False, 'message': 'Unknown export'}), 404
+    try:
+        filters = parse_report_filters(request.args)
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+
+    # No Content-Length: the body is sent chunked as rows are read
+    return Response(
+        stream_with_context(stream_export(name, fmt, filters)),
+        mimetype=FORMATS[fmt],
+        headers={'Content-Disposition': f'attachment; filename={export_filename(name, fmt)}'}
+    )
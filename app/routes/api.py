@@ -3,10 +3,9 @@ API routes for Stycly
 AJAX endpoints for frontend functionality
 """
 
-from flask import Blueprint, jsonify, session
-from datetime import datetime
-from app import db
-from app.models import User
+from flask import Blueprint, Response, jsonify, request
+from app.bootstrap import bootstrap_body, format_last_insert
+from app.users import current_user
 from app.utils import login_required
 
 api_bp = Blueprint('api', __name__, url_prefix='/api')
@@ -16,12 +15,22 @@ api_bp = Blueprint('api', __name__, url_prefix='/api')
 @login_required
 def get_last_insert():
     """Get user's last item insert time"""
-    user_id = session.get('user_id')
-    user = User.query.get(user_id)
-    
-    if user and user.last_item_insert_at:
-        last_insert = user.last_item_insert_at.strftime('%B %d, %Y at %I:%M %p')
-    else:
-        last_insert = None
-    
+    user = current_user()
+    last_insert = format_last_insert(user.last_item_insert_at) if user else None
+
     return jsonify({'last_insert': last_insert})
+
+
+@api_bp.route('/bootstrap')
+def bootstrap():
+    """
+    Initial data of the homepage in one response
+
+    Accepts the same filters as /shop/products. Returns filter options, the
+    first products page, the cart and, for logged-in users, the last insert
+    time and the wardrobe (null otherwise).
+    """
+    response = Response(bootstrap_body(request.args), mimetype='application/json')
+    # Depends on the session: never reuse a stored copy
+    response.headers['Cache-Control'] = 'private, no-store'
+    return response
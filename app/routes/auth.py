@@ -4,16 +4,23 @@ Handles login, registration, logout, and password reset
 """
 
 from flask import Blueprint, render_template, request, redirect, url_for, flash, session
-from datetime import datetime, timedelta
 from app import db
-from app.models import User, PasswordResetToken
+from app.models import User
+from app.passwords import HashingBusy
+from app.ratelimit import rate_limited
+from app.reset_tokens import consume_reset_token, find_reset_token, issue_reset_token
+from app.sessions import regenerate_session
+from app.users import record_activity
 from app.utils import send_password_reset_email
-import secrets
 
 auth_bp = Blueprint('auth', __name__, url_prefix='/auth')
 
+# Shown when every password hashing slot is taken
+BUSY_MESSAGE = 'Il servizio è momentaneamente sovraccarico. Riprova tra qualche secondo.'
+
 
 @auth_bp.route('/register', methods=['GET', 'POST'])
+@rate_limited('register', 'register.html')
 def register():
     """User registration"""
     if request.method == 'POST':
@@ -48,7 +55,11 @@ def register():
         
         # Create new user
         user = User(name=name, email=email)
-        user.set_password(password)
+        try:
+            user.set_password(password)
+        except HashingBusy:
+            flash(BUSY_MESSAGE, 'danger')
+            return render_template('register.html', name=name, email=email), 503
         
         try:
             db.session.add(user)
@@ -66,6 +77,7 @@ def register():
 
 
 @auth_bp.route('/login', methods=['GET', 'POST'])
+@rate_limited('login', 'login.html')
 def login():
     """User login"""
     if request.method == 'POST':
@@ -74,15 +86,22 @@ def login():
         remember = request.form.get('remember') == 'on'
         
         user = User.query.filter_by(email=email).first()
-        
-        if user and user.check_password(password) and user.is_active:
-            # Set session
+
+        try:
+            authenticated = user is not None and user.check_password(password)
+        except HashingBusy:
+            flash(BUSY_MESSAGE, 'danger')
+            return render_template('login.html'), 503
+
+        if authenticated and user.is_active:
+            # Set session, under a new id so a planted one cannot be reused
+            regenerate_session(session)
             session['user_id'] = user.id
             session['user_name'] = user.name
             session['user_email'] = user.email
             
-            # Update last login
-            user.last_login_at = datetime.utcnow()
+            # Last login is buffered; commit an upgraded password hash now
+            record_activity(user.id, 'last_login_at')
             db.session.commit()
             
             # Set session to permanent if remember me is checked
@@ -107,11 +126,13 @@ def login():
 def logout():
     """User logout"""
     session.clear()
+    regenerate_session(session)
     flash('Logout effettuato con successo.', 'info')
     return redirect(url_for('main.index'))
 
 
 @auth_bp.route('/forgot-password', methods=['GET', 'POST'])
+@rate_limited('forgot_password', 'forgot_password.html')
 def forgot_password():
     """Request password reset"""
     if request.method == 'POST':
@@ -119,22 +140,13 @@ def forgot_password():
         user = User.query.filter_by(email=email).first()
         
         if user:
-            # Generate secure token
-            token = secrets.token_urlsafe(32)
-            
-            # Create reset token record
-            reset_token = PasswordResetToken(
-                user_id=user.id,
-                token=token,
-                expires_at=datetime.utcnow() + timedelta(hours=1)
-            )
-            
-            db.session.add(reset_token)
-            db.session.commit()
-            
-            # Send reset email
+            # Generate secure token (only its digest is stored)
+            token = issue_reset_token(user)
+
+            # Queue the reset email with the token
             reset_url = url_for('auth.reset_password', token=token, _external=True)
             send_password_reset_email(user, reset_url)
+            db.session.commit()
         
         # Always show success message (don't reveal if email exists)
         flash('Se questa email è registrata, riceverai a breve un link per reimpostare la password.', 'info')
@@ -146,7 +158,7 @@ def forgot_password():
 @auth_bp.route('/reset-password/<token>', methods=['GET', 'POST'])
 def reset_password(token):
     """Reset password with token"""
-    reset_token = PasswordResetToken.query.filter_by(token=token).first()
+    reset_token = find_reset_token(token)
     
     if not reset_token or not reset_token.is_valid():
         flash('Link di reimpostazione password non valido o scaduto.', 'danger')
@@ -166,10 +178,14 @@ def reset_password(token):
         
         # Update password
         user = reset_token.user
-        user.set_password(password)
+        try:
+            user.set_password(password)
+        except HashingBusy:
+            flash(BUSY_MESSAGE, 'danger')
+            return render_template('reset_password.html', token=token), 503
         
-        # Mark token as used
-        reset_token.used = True
+        # Mark token as used, and invalidate the user's other links
+        consume_reset_token(reset_token)
         
         db.session.commit()
 
@@ -4,6 +4,7 @@ Handles homepage and static content sections
 """
 
 from flask import Blueprint, render_template, request, flash
+from app import db
 from app.utils import send_email
 from flask import current_app
 
@@ -27,7 +28,7 @@ def contact():
         flash('Compila tutti i campi.', 'danger')
         return render_template('index.html')
     
-    # Send contact email
+    # Queue contact email
     subject = f'Stycly Contact Form - {name}'
     html_body = f"""
     <!DOCTYPE html>
@@ -51,7 +52,8 @@ def contact():
     """
     
     orders_email = current_app.config.get('ORDERS_EMAIL')
-    send_email(orders_email, subject, html_body)
+    send_email(orders_email, subject, html_body, kind='contact')
+    db.session.commit()
     
     flash('Grazie per il tuo messaggio! Ti risponderemo presto.', 'success')
     return render_template('index.html')
@@ -3,11 +3,14 @@ Order routes for Stycly
 Handles rental requests and order processing
 """
 
-from flask import Blueprint, render_template, request, redirect, url_for, flash, session
+from flask import Blueprint, abort, current_app, render_template, request, redirect, url_for, flash, session
 from datetime import datetime
 from app import db
 from app.models import Order, OrderItem, WardrobeItem
-from app.utils import send_order_confirmation_email, send_order_notification_email
+from app.utils import send_order_confirmation_email
+from app.notifications import notify_new_order
+from app.availability import available_units, reserve_units
+from app.cart import held_by_others, load_cart, save_cart
 
 orders_bp = Blueprint('orders', __name__, url_prefix='/orders')
 
@@ -17,7 +20,7 @@ def submit_order():
     """Submit rental request"""
     
     # Get cart
-    cart = session.get('cart', {})
+    cart = load_cart()
     
     if not cart:
         flash('Il tuo carrello è vuoto.', 'warning')
@@ -60,6 +63,24 @@ def submit_order():
         start_date = None
         end_date = None
     
+    # Check availability over the rental dates (items no longer in the
+    # catalog are skipped)
+    quantities = {}
+    if start_date and end_date and not errors:
+        item_ids = [int(item_id_str) for item_id_str in cart]
+        available = available_units(item_ids, start_date, end_date)
+        held = held_by_others(item_ids)
+        quantities = {
+            int(item_id_str): quantity for item_id_str, quantity in cart.items()
+            if int(item_id_str) in available
+        }
+        unavailable = [
+            item_id for item_id, quantity in quantities.items()
+            if quantity > available[item_id] - held.get(item_id, 0)
+        ]
+        if unavailable:
+            errors.append(_unavailable_message(unavailable))
+
     if errors:
         for error in errors:
             flash(error, 'danger')
@@ -78,47 +99,65 @@ def submit_order():
             start_date=start_date,
             end_date=end_date,
             notes=notes,
-            status='pending'
+            status='pending',
+            item_count=sum(quantities.values())
         )
         
         db.session.add(order)
         db.session.flush()  # Get order ID
+
+        # Reserve every item for the whole period in this transaction: if a
+        # concurrent order took the units first, nothing is saved
+        unavailable = reserve_units(db.session, order.id, quantities, start_date, end_date)
+        if unavailable:
+            db.session.rollback()
+            flash(_unavailable_message(unavailable), 'danger')
+            return redirect(url_for('main.index') + '#rental-request')
         
         # Add order items
-        for item_id_str, quantity in cart.items():
-            item = WardrobeItem.query.get(int(item_id_str))
-            if item:
-                order_item = OrderItem(
-                    order_id=order.id,
-                    wardrobe_item_id=item.id,
-                    quantity=quantity,
-                    daily_price=item.daily_price
-                )
-                db.session.add(order_item)
-        
-        db.session.commit()
-        
-        # Send emails
+        for item_id, quantity in sorted(quantities.items()):
+            order_item = OrderItem(
+                order_id=order.id,
+                wardrobe_item_id=item_id,
+                quantity=quantity
+            )
+            db.session.add(order_item)
+        db.session.flush()
+
+        # Emails are queued in the same transaction and sent by the worker;
+        # items and wardrobe items are loaded once for both
+        order = Order.get_with_items(order.id)
         send_order_confirmation_email(order)
-        send_order_notification_email(order)
-        
-        # Clear cart
-        session['cart'] = {}
-        session.modified = True
-        
-        flash('Grazie! La tua richiesta di noleggio è stata inviata. Ti contatteremo presto con un preventivo.', 'success')
-        return redirect(url_for('orders.confirmation', order_id=order.id))
+        notify_new_order(order)
+
+        # The cart is emptied together with the order
+        save_cart({})
+        db.session.commit()
 
     except Exception as e:
         db.session.rollback()
+        current_app.logger.error(f'Error submitting order: {str(e)}')
         flash('Si è verificato un errore durante l\'elaborazione della richiesta. Riprova.', 'danger')
         return redirect(url_for('main.index') + '#rental-request')
 
+    flash('Grazie! La tua richiesta di noleggio è stata inviata. Ti contatteremo presto con un preventivo.', 'success')
+    return redirect(url_for('orders.confirmation', order_id=order.id))
+
+
+def _unavailable_message(item_ids):
+    """Flash message listing items not available for the requested dates"""
+    titles = db.session.scalars(
+        db.select(WardrobeItem.title).where(WardrobeItem.id.in_(item_ids)).order_by(WardrobeItem.title)
+    )
+    return 'Alcuni articoli non sono disponibili per le date selezionate: ' + ', '.join(titles) + '.'
+
 
 @orders_bp.route('/confirmation/<int:order_id>')
 def confirmation(order_id):
     """Order confirmation page"""
-    order = Order.query.get_or_404(order_id)
+    order = Order.get_with_items(order_id)
+    if order is None:
+        abort(404)
     
     # Check if user has access to this order
     user_id = session.get('user_id')
@@ -3,55 +3,73 @@ Shop routes for Stycly
 Handles product catalog, search, and cart operations
 """
 
-from flask import Blueprint, render_template, request, jsonify, session
+from flask import Blueprint, Response, abort, render_template, request, jsonify, session
 from app.models import WardrobeItem
 from app import db
+from app.cache import cached_payload, filters_version, json_payload
+from app.serializers import json_response
+from app.cart import (
+    MAX_BATCH_OPERATIONS, apply_operations, cart_summary, held_by_others, holds_fingerprint, load_cart,
+    save_cart, unavailable_items
+)
+from app.utils import add_cache_validators, make_etag, not_modified
+from app.facets import facets_payload
+from app.availability import available_units, parse_period
+from app.catalog import (
+    DEFAULT_SORT, InvalidCursor, page_body, parse_filters, parse_page_size, products_page,
+    product_detail as catalog_product_detail
+)
 
 shop_bp = Blueprint('shop', __name__, url_prefix='/shop')
 
 
 @shop_bp.route('/products')
 def products():
-    """Get all public products (for AJAX loading)"""
-    import json
-    items = WardrobeItem.query.filter_by(is_public_for_rent=True).all()
+    """
+    Get a page of public products (for AJAX loading)
+
+    Query params:
+        category, destination, size, age_range, color, condition: exact filters
+        q: full-text search term over title and description
+        start_date, end_date: rental period (YYYY-MM-DD); only items with
+            units free for the whole period, with stock = free units
+        sort: relevance, newest (default), oldest or title
+        cursor: opaque cursor returned as next_cursor by the previous page
+        limit: page size (default 24, max 100)
+    """
+    filters = parse_filters(request.args)
+    sort = request.args.get('sort', DEFAULT_SORT)
+    cursor = request.args.get('cursor')
+    page_size = parse_page_size(request.args.get('limit'))
 
     # Get current cart to calculate available stock
-    cart = session.get('cart', {})
-
-    products_data = []
-    for item in items:
-        # Calculate available stock (total stock - quantity in cart)
-        quantity_in_cart = cart.get(str(item.id), 0)
-        available_stock = (item.stock or 0) - quantity_in_cart
-
-        # Only show items with available stock > 0
-        if available_stock <= 0:
-            continue
-
-        # Parse image_paths JSON array
-        image_paths = []
-        if item.image_paths:
-            try:
-                image_paths = json.loads(item.image_paths)
-            except:
-                pass
-
-        products_data.append({
-            'id': item.id,
-            'title': item.title,
-            'description': item.description,
-            'destination': item.destination,
-            'category': item.category,
-            'size': item.size,
-            'age_range': item.age_range,
-            'color': item.color,
-            'condition': item.condition,
-            'image_paths': image_paths,
-            'stock': available_stock  # Send available stock, not total stock
-        })
-
-    return jsonify(products_data)
+    cart = load_cart()
+
+    # The response depends on the catalog, the query, the cart and other
+    # shoppers' holds, all known before the page is built. Last-Modified
+    # only tracks the catalog, so it is omitted with a cart or holds.
+    holds = holds_fingerprint()
+    version, updated_at = filters_version(filters)
+    etag = make_etag('products', version, request.query_string, sorted(cart.items()), holds)
+    last_modified = None if cart or holds[0] else updated_at
+    response = not_modified(etag, last_modified)
+    if response:
+        return response
+
+    key = ('products', tuple(sorted(filters.items())), sort, cursor, page_size)
+    try:
+        page = cached_payload(key, lambda: json_payload(
+            products_page(filters, sort, cursor, page_size)
+        ), period='period' in filters)
+    except InvalidCursor as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+
+    # Units held in other shoppers' carts are not available either
+    held = held_by_others([product['id'] for product in page.data['items']])
+
+    # Send available stock, not total stock
+    response = Response(page_body(page, cart, held), mimetype='application/json')
+    return add_cache_validators(response, etag, last_modified)
 
 
 @shop_bp.route('/cart/add', methods=['POST'])
@@ -68,22 +86,28 @@ def add_to_cart():
     if not item or not item.is_public_for_rent:
         return jsonify({'success': False, 'message': 'Item not found'}), 404
     
-    # Initialize cart in session if not exists
-    if 'cart' not in session:
-        session['cart'] = {}
-    
-    cart = session['cart']
+    cart = load_cart()
     item_id_str = str(item_id)
     
-    # Check stock
+    # Check stock, or availability over the rental dates when given
     current_quantity = cart.get(item_id_str, 0)
-    if current_quantity >= item.stock:
+    period = parse_period(data.get('start_date'), data.get('end_date'))
+    if period:
+        available = available_units([item.id], *period).get(item.id, 0)
+    else:
+        available = item.stock or 0
+
+    # Units held in other shoppers' carts are not available
+    available -= held_by_others([item.id]).get(item.id, 0)
+    if current_quantity >= available:
+        if period:
+            return jsonify({'success': False, 'message': 'Not available for the selected dates'}), 400
         return jsonify({'success': False, 'message': 'Maximum stock reached'}), 400
     
     # Add to cart
     cart[item_id_str] = current_quantity + 1
-    session['cart'] = cart  # Trigger session modification
-    session.modified = True
+    save_cart(cart)
+    db.session.commit()
     
     return jsonify({
         'success': True,
@@ -114,14 +138,12 @@ def update_cart():
     if not item:
         return jsonify({'success': False, 'message': 'Item not found'}), 404
     
-    if quantity > item.stock:
-        return jsonify({'success': False, 'message': f'Only {item.stock} available'}), 400
+    available = (item.stock or 0) - held_by_others([item.id]).get(item.id, 0)
+    if quantity > available:
+        return jsonify({'success': False, 'message': f'Only {max(available, 0)} available'}), 400
     
     # Update cart
-    if 'cart' not in session:
-        session['cart'] = {}
-    
-    cart = session['cart']
+    cart = load_cart()
     item_id_str = str(item_id)
     
     if quantity == 0:
@@ -131,8 +153,8 @@ def update_cart():
     else:
         cart[item_id_str] = quantity
     
-    session['cart'] = cart
-    session.modified = True
+    save_cart(cart)
+    db.session.commit()
     
     return jsonify({
         'success': True,
@@ -150,16 +172,13 @@ def remove_from_cart():
     if not item_id:
         return jsonify({'success': False, 'message': 'Item ID required'}), 400
     
-    if 'cart' not in session:
-        session['cart'] = {}
-    
-    cart = session['cart']
+    cart = load_cart()
     item_id_str = str(item_id)
     
     if item_id_str in cart:
         del cart[item_id_str]
-        session['cart'] = cart
-        session.modified = True
+        save_cart(cart)
+        db.session.commit()
     
     return jsonify({
         'success': True,
@@ -168,113 +187,86 @@ def remove_from_cart():
     })
 
 
+@shop_bp.route('/cart/batch', methods=['POST'])
+def batch_cart():
+    """Apply several cart operations at once and return the updated cart"""
+    data = request.get_json(silent=True) or {}
+    operations = data.get('operations')
+
+    if not isinstance(operations, list) or not operations:
+        return jsonify({'success': False, 'message': 'Operations required'}), 400
+    if len(operations) > MAX_BATCH_OPERATIONS:
+        return jsonify({'success': False, 'message': f'At most {MAX_BATCH_OPERATIONS} operations'}), 400
+
+    cart = load_cart()
+    try:
+        new_cart = apply_operations(cart, operations)
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+
+    # Only items whose quantity grows need free units; all or nothing
+    grown = [int(item_id) for item_id, quantity in new_cart.items() if quantity > cart.get(item_id, 0)]
+    period = parse_period(data.get('start_date'), data.get('end_date'))
+    errors = unavailable_items(new_cart, grown, period)
+    if errors:
+        return jsonify({
+            'success': False,
+            'message': next(iter(errors.values())),
+            'errors': [{'item_id': item_id, 'message': message} for item_id, message in errors.items()]
+        }), 400
+
+    if new_cart != cart:
+        save_cart(new_cart)
+        db.session.commit()
+
+    summary = cart_summary().data
+    return json_response({
+        'success': True,
+        'message': 'Cart updated',
+        'cart_count': summary['total_items'],
+        'cart': summary
+    })
+
+
 @shop_bp.route('/cart/get')
 def get_cart():
     """Get cart contents with item details"""
-    import json
-    from flask import url_for
-    cart = session.get('cart', {})
-
-    if not cart:
+    if not session.get('cart_id') and not session.get('cart'):
         return jsonify({'items': [], 'total_items': 0})
 
-    cart_items = []
-    total_items = 0
-
-    for item_id_str, quantity in cart.items():
-        item = WardrobeItem.query.get(int(item_id_str))
-        if item:
-            # Get first image from image_paths JSON array
-            image_path = 'https://via.placeholder.com/100x100?text=No+Image'
-            if item.image_paths:
-                try:
-                    image_paths = json.loads(item.image_paths)
-                    if image_paths and len(image_paths) > 0:
-                        # Convert relative path to full URL
-                        image_path = url_for('static', filename=image_paths[0])
-                except:
-                    pass
-
-            cart_items.append({
-                'id': item.id,
-                'title': item.title,
-                'size': item.size,
-                'age_range': item.age_range,
-                'image_path': image_path,
-                'quantity': quantity,
-                'stock': item.stock
-            })
-            total_items += quantity
-
-    return jsonify({
-        'items': cart_items,
-        'total_items': total_items
-    })
+    # Hydrated in one query, then reused until the cart changes
+    return Response(cart_summary().body, mimetype='application/json')
 
 
 @shop_bp.route('/product/<int:product_id>')
 def product_detail(product_id):
     """Product detail page"""
-    import json
-
-    item = WardrobeItem.query.get_or_404(product_id)
-
-    # Check if item is available for rent
-    if not item.is_public_for_rent:
-        return render_template('404.html'), 404
-
-    # Parse image_paths
-    image_paths = []
-    if item.image_paths:
-        try:
-            image_paths = json.loads(item.image_paths)
-        except:
-            pass
-
-    # Get cart to check quantity
-    cart = session.get('cart', {})
-    quantity_in_cart = cart.get(str(item.id), 0)
-    available_stock = (item.stock or 0) - quantity_in_cart
-
-    # Get related products (same category, different product)
-    related_items = WardrobeItem.query.filter(
-        WardrobeItem.category == item.category,
-        WardrobeItem.id != item.id,
-        WardrobeItem.is_public_for_rent == True
-    ).limit(4).all()
-
-    related_products = []
-    for rel_item in related_items:
-        rel_images = []
-        if rel_item.image_paths:
-            try:
-                rel_images = json.loads(rel_item.image_paths)
-            except:
-                pass
-
-        related_products.append({
-            'id': rel_item.id,
-            'title': rel_item.title,
-            'size': rel_item.size,
-            'age_range': rel_item.age_range,
-            'color': rel_item.color,
-            'condition': rel_item.condition,
-            'stock': rel_item.stock,
-            'image_paths': rel_images
-        })
+    product = cached_payload(('product', product_id), lambda: json_payload(
+        catalog_product_detail(product_id)
+    )).data
+
+    # Missing or not available for rent
+    if product is None:
+        abort(404)
+
+    # Get cart and other shoppers' holds to check quantity
+    cart = load_cart()
+    quantity_in_cart = cart.get(str(product['id']), 0)
+    held = held_by_others([product['id']]).get(product['id'], 0)
+    available_stock = product['stock'] - quantity_in_cart - held
 
     return render_template('product_detail.html',
-                         item=item,
-                         image_paths=image_paths,
+                         item=product,
+                         image_paths=product['image_paths'],
                          available_stock=available_stock,
-                         related_products=related_products)
+                         related_products=product['related'])
 
 
 @shop_bp.route('/cart/clear', methods=['POST'])
 def clear_cart():
     """Clear entire cart"""
-    session['cart'] = {}
-    session.modified = True
+    save_cart({})
+    db.session.commit()
 
     return jsonify({
         'success': True,
@@ -284,37 +276,22 @@ def clear_cart():
 
 @shop_bp.route('/filters')
 def get_filters():
-    """Get available filter options based on actual data"""
-    # Get all public items
-    items = WardrobeItem.query.filter_by(is_public_for_rent=True).all()
-
-    # Collect unique values for each filter
-    categories = set()
-    destinations = set()
-    sizes = set()
-    age_ranges = set()
-    colors = set()
-    conditions = set()
-
-    for item in items:
-        if item.category:
-            categories.add(item.category)
-        if item.destination:
-            destinations.add(item.destination)
-        if item.size:
-            sizes.add(item.size)
-        if item.age_range:
-            age_ranges.add(item.age_range)
-        if item.color:
-            colors.add(item.color)
-        if item.condition:
-            conditions.add(item.condition)
-
-    return jsonify({
-        'categories': sorted(list(categories)),
-        'destinations': sorted(list(destinations)),
-        'sizes': sorted(list(sizes)),
-        'age_ranges': sorted(list(age_ranges)),
-        'colors': sorted(list(colors)),
-        'conditions': sorted(list(conditions))
-    })
+    """
+    Get available filter options with item counts
+
+    Accepts the same filters as /shop/products; each facet's counts are
+    conditioned on the other selected filters.
+    """
+    filters = parse_filters(request.args)
+
+    version, updated_at = filters_version(filters)
+    etag = make_etag('filters', version, request.query_string)
+    response = not_modified(etag, updated_at)
+    if response:
+        return response
+
+    payload = cached_payload(('filters', tuple(sorted(filters.items()))), lambda: json_payload(
+        facets_payload(filters)
+    ), period='period' in filters)
+    response = Response(payload.body, mimetype='application/json')
+    return add_cache_validators(response, etag, updated_at)
@@ -4,13 +4,17 @@ Handles user's private wardrobe operations
 """
 
 from flask import Blueprint, render_template, request, redirect, url_for, flash, session, jsonify
-from werkzeug.utils import secure_filename
 from datetime import datetime
-import os
-import json
 from app import db
-from app.models import User, WardrobeItem
-from app.utils import login_required, allowed_file
+from app.models import User, WardrobeItem, WardrobeImage
+from app.utils import login_required, add_cache_validators, make_etag, not_modified
+from app.images import save_uploaded_images
+from app.serializers import json_response, serialize_wardrobe, wardrobe_rows
+from app.search import unindex_user_items
+from app.cache import bump_catalog_version
+from app.related import mark_changed as mark_related_changed
+from app.users import activity_buffer, forget_user, record_activity
+from app.sessions import regenerate_session
 
 wardrobe_bp = Blueprint('wardrobe', __name__, url_prefix='/wardrobe')
 
@@ -19,38 +23,21 @@ wardrobe_bp = Blueprint('wardrobe', __name__, url_prefix='/wardrobe')
 @login_required
 def index():
     """View user's wardrobe (API endpoint for AJAX)"""
-    import json
     user_id = session.get('user_id')
-    items = WardrobeItem.query.filter_by(user_id=user_id).order_by(WardrobeItem.created_at.desc()).all()
-
-    items_data = []
-    for item in items:
-        # Parse image_paths JSON
-        image_paths_list = []
-        if item.image_paths:
-            try:
-                image_paths_list = json.loads(item.image_paths)
-            except:
-                pass
-
-        items_data.append({
-            'id': item.id,
-            'title': item.title,
-            'description': item.description,
-            'destination': item.destination,
-            'category': item.category,
-            'size': item.size,
-            'age_range': item.age_range,
-            'color': item.color,
-            'condition': item.condition,
-            'stock': item.stock,
-            'is_public_for_rent': item.is_public_for_rent,
-            'image_paths': image_paths_list,
-            'created_at': item.created_at.strftime('%Y-%m-%d %H:%M') if item.created_at else None,
-            'updated_at': item.updated_at.strftime('%Y-%m-%d %H:%M') if item.updated_at else None
-        })
-
-    return jsonify(items_data)
+
+    # Validators from the latest change and the item count (catches deletes)
+    last_updated, item_count = db.session.query(
+        db.func.max(WardrobeItem.updated_at),
+        db.func.count(WardrobeItem.id)
+    ).filter(WardrobeItem.user_id == user_id).one()
+
+    etag = make_etag('wardrobe', user_id, last_updated, item_count)
+    response = not_modified(etag, last_updated)
+    if response:
+        return response
+
+    items_data = serialize_wardrobe(wardrobe_rows(user_id))
+    return add_cache_validators(json_response(items_data), etag, last_updated)
 
 
 @wardrobe_bp.route('/add', methods=['POST'])
@@ -85,25 +72,6 @@ def add_item():
         errors.append('Valore quantità non valido.')
         stock = 1
 
-    # Handle multiple image uploads
-    import json
-    image_paths = []
-
-    # Get all uploaded files
-    uploaded_files = request.files.getlist('images')
-
-    for file in uploaded_files:
-        if file and file.filename and allowed_file(file.filename):
-            filename = secure_filename(file.filename)
-            # Add timestamp to avoid collisions
-            timestamp = datetime.utcnow().strftime('%Y%m%d_%H%M%S_%f')
-            filename = f"{timestamp}_{filename}"
-
-            from flask import current_app
-            filepath = os.path.join(current_app.config['UPLOAD_FOLDER'], filename)
-            file.save(filepath)
-            image_paths.append(f'uploads/{filename}')
-
     if errors:
         for error in errors:
             flash(error, 'danger')
@@ -121,18 +89,18 @@ def add_item():
         color=color,
         condition=condition,
         stock=stock,
-        image_paths=json.dumps(image_paths) if image_paths else None,
         is_public_for_rent=is_public
     )
 
+    # Handle multiple image uploads
+    item.images = save_uploaded_images(request.files.getlist('images'))
+
     try:
         db.session.add(item)
-
-        # Update user's last_item_insert_at
-        user = User.query.get(user_id)
-        user.last_item_insert_at = datetime.utcnow()
-
         db.session.commit()
+
+        # Buffered; written to last_item_insert_at by the next activity flush
+        record_activity(user_id, 'last_item_insert_at')
         flash('Articolo aggiunto al guardaroba con successo!', 'success')
 
     except Exception as e:
@@ -171,25 +139,13 @@ def edit_item(item_id):
     item.is_public_for_rent = request.form.get('is_public') == 'on'
     item.updated_at = datetime.utcnow()
 
-    # Handle multiple image uploads if provided
-    import json
+    # Handle multiple image uploads if provided (replaces existing images)
     uploaded_files = request.files.getlist('images')
 
     if uploaded_files and any(f.filename for f in uploaded_files):
-        image_paths = []
-        for file in uploaded_files:
-            if file and file.filename and allowed_file(file.filename):
-                filename = secure_filename(file.filename)
-                timestamp = datetime.utcnow().strftime('%Y%m%d_%H%M%S_%f')
-                filename = f"{timestamp}_{filename}"
-
-                from flask import current_app
-                filepath = os.path.join(current_app.config['UPLOAD_FOLDER'], filename)
-                file.save(filepath)
-                image_paths.append(f'uploads/{filename}')
-
-        if image_paths:
-            item.image_paths = json.dumps(image_paths)
+        images = save_uploaded_images(uploaded_files)
+        if images:
+            item.images = images
 
     try:
         db.session.commit()
@@ -230,13 +186,27 @@ def delete_wardrobe():
     user_id = session.get('user_id')
     
     try:
+        # Bulk delete bypasses ORM events and cascades, so drop images and
+        # search entries, queue related-list refreshes and invalidate the
+        # catalog cache explicitly
+        mark_related_changed(db.session.scalars(
+            db.select(WardrobeItem.id).where(WardrobeItem.user_id == user_id)
+        ).all())
+        unindex_user_items(user_id)
+        WardrobeImage.query.filter(WardrobeImage.item_id.in_(
+            db.select(WardrobeItem.id).where(WardrobeItem.user_id == user_id)
+        )).delete(synchronize_session=False)
         WardrobeItem.query.filter_by(user_id=user_id).delete()
+        bump_catalog_version()
         
-        # Reset last_item_insert_at
-        user = User.query.get(user_id)
-        user.last_item_insert_at = None
+        # Reset last_item_insert_at, including a not yet flushed value
+        activity_buffer.discard(user_id, 'last_item_insert_at')
+        db.session.execute(
+            db.update(User).where(User.id == user_id).values(last_item_insert_at=None)
+        )
         
         db.session.commit()
+        forget_user(user_id)
         flash('Tutti gli articoli del guardaroba sono stati eliminati con successo.', 'success')
     except Exception as e:
         db.session.rollback()
@@ -252,14 +222,16 @@ def delete_account():
     user_id = session.get('user_id')
     
     try:
-        user = User.query.get(user_id)
+        user = db.session.get(User, user_id)
         
         # SQLAlchemy cascade will handle deletion of wardrobe items and orders
         db.session.delete(user)
         db.session.commit()
+        activity_buffer.discard(user_id)
         
         # Clear session
         session.clear()
+        regenerate_session(session)
 
         flash('Il tuo account è stato eliminato con successo.', 'info')
         return redirect(url_for('main.index'))
@@ -0,0 +1,270 @@
+"""
+Full-text search for Stycly
+Indexes WardrobeItem title and description with FTS5 (SQLite) or a
+tsvector/GIN table (PostgreSQL), with Italian accent folding and stemming
+"""
+
+import re
+import unicodedata
+from flask import current_app
+from sqlalchemy import event, inspect, select, text, or_, literal, Integer, Float
+from app import db
+
+SEARCH_TABLE = 'wardrobe_search'
+
+# Title matches weigh more than description matches
+TITLE_WEIGHT = 10.0
+DESCRIPTION_WEIGHT = 1.0
+
+# Light Italian stemmer: strip one inflectional/derivational suffix
+# (longest first), keeping a stem of at least 3 characters
+_SUFFIXES = sorted([
+    'issimo', 'issima', 'issimi', 'issime',
+    'amento', 'amenti', 'imento', 'imenti',
+    'mente', 'zione', 'zioni',
+    'ista', 'iste', 'isti',
+    'etto', 'etta', 'etti', 'ette',
+    'ino', 'ina', 'ini', 'ine',
+    'a', 'e', 'i', 'o',
+], key=len, reverse=True)
+
+_WORD_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def fold(value):
+    """Lowercase and strip accents (e.g. 'Però' -> 'pero')"""
+    decomposed = unicodedata.normalize('NFKD', value or '')
+    return ''.join(c for c in decomposed if not unicodedata.combining(c)).lower()
+
+
+def stem(word):
+    """Reduce an Italian word to its light stem"""
+    if len(word) <= 3:
+        return word
+    for suffix in _SUFFIXES:
+        if word.endswith(suffix) and len(word) - len(suffix) >= 3:
+            return word[:-len(suffix)]
+    return word
+
+
+def tokenize(value):
+    """Folded, stemmed search terms of a text"""
+    return [stem(word) for word in _WORD_RE.findall(fold(value))]
+
+
+def normalize(value):
+    """Text as stored in the search index"""
+    return ' '.join(tokenize(value))
+
+
+def get_backend():
+    """Active search backend: 'fts5', 'postgresql' or 'like'"""
+    return current_app.extensions.get('search_backend', 'like')
+
+
+def init_search(app):
+    """Create the search index for the configured database and hook index sync"""
+    with app.app_context():
+        dialect = db.engine.dialect.name
+        backend = 'like'
+
+        try:
+            with db.engine.begin() as conn:
+                if dialect == 'sqlite':
+                    conn.execute(text(
+                        f"CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} "
+                        f"USING fts5(title, description, tokenize = 'unicode61 remove_diacritics 2')"
+                    ))
+                    backend = 'fts5'
+                elif dialect == 'postgresql':
+                    conn.execute(text(
+                        f"CREATE TABLE IF NOT EXISTS {SEARCH_TABLE} ("
+                        f"item_id INTEGER PRIMARY KEY REFERENCES wardrobe_items(id) ON DELETE CASCADE, "
+                        f"document TSVECTOR NOT NULL)"
+                    ))
+                    conn.execute(text(
+                        f"CREATE INDEX IF NOT EXISTS ix_{SEARCH_TABLE}_document "
+                        f"ON {SEARCH_TABLE} USING GIN (document)"
+                    ))
+                    backend = 'postgresql'
+        except Exception as e:
+            app.logger.warning(f'Full-text search unavailable, falling back to LIKE: {str(e)}')
+            backend = 'like'
+
+        app.extensions['search_backend'] = backend
+
+        # Populate the index the first time it is created on existing data
+        if backend != 'like':
+            try:
+                if _index_is_empty():
+                    rebuild_index()
+            except Exception as e:
+                db.session.rollback()
+                app.logger.warning(f'Could not build search index: {str(e)}')
+
+
+def _index_is_empty():
+    """True if there are items but nothing has been indexed yet"""
+    from app.models import WardrobeItem
+    indexed = db.session.execute(text(f'SELECT 1 FROM {SEARCH_TABLE} LIMIT 1')).first()
+    return indexed is None and WardrobeItem.query.first() is not None
+
+
+def index_items(conn, items):
+    """Add or replace the index entries of the given (id, title, description) rows"""
+    backend = get_backend()
+    rows = [
+        {'id': item_id, 'title': normalize(title), 'description': normalize(description)}
+        for item_id, title, description in items
+    ]
+    if not rows or backend == 'like':
+        return
+
+    unindex_items(conn, [row['id'] for row in rows])
+
+    if backend == 'fts5':
+        conn.execute(text(
+            f'INSERT INTO {SEARCH_TABLE} (rowid, title, description) '
+            f'VALUES (:id, :title, :description)'
+        ), rows)
+    else:
+        conn.execute(text(
+            f"INSERT INTO {SEARCH_TABLE} (item_id, document) VALUES (:id, "
+            f"setweight(to_tsvector('simple', :title), 'A') || "
+            f"setweight(to_tsvector('simple', :description), 'B'))"
+        ), rows)
+
+
+def unindex_items(conn, item_ids):
+    """Remove the index entries of the given item ids"""
+    backend = get_backend()
+    if not item_ids or backend == 'like':
+        return
+
+    key = 'rowid' if backend == 'fts5' else 'item_id'
+    conn.execute(
+        text(f'DELETE FROM {SEARCH_TABLE} WHERE {key} = :id'),
+        [{'id': item_id} for item_id in item_ids]
+    )
+
+
+def unindex_user_items(user_id):
+    """Remove index entries for all items of a user (before a bulk delete)"""
+    backend = get_backend()
+    if backend == 'like':
+        return
+
+    key = 'rowid' if backend == 'fts5' else 'item_id'
+    db.session.execute(
+        text(f'DELETE FROM {SEARCH_TABLE} WHERE {key} IN '
+             f'(SELECT id FROM wardrobe_items WHERE user_id = :user_id)'),
+        {'user_id': user_id}
+    )
+
+
+def rebuild_index(batch_size=1000):
+    """Re-index every wardrobe item. Returns the number of indexed items."""
+    from app.models import WardrobeItem
+    backend = get_backend()
+    if backend == 'like':
+        return 0
+
+    conn = db.session.connection()
+    conn.execute(text(f'DELETE FROM {SEARCH_TABLE}'))
+
+    count = 0
+    batch = []
+    rows = db.session.execute(
+        select(WardrobeItem.id, WardrobeItem.title, WardrobeItem.description)
+        .execution_options(yield_per=batch_size)
+    )
+    for row in rows:
+        batch.append(tuple(row))
+        if len(batch) >= batch_size:
+            index_items(conn, batch)
+            count += len(batch)
+            batch = []
+
+    if batch:
+        index_items(conn, batch)
+        count += len(batch)
+
+    db.session.commit()
+    return count
+
+
+def match_query(term):
+    """Translate a user search term into a backend query string (or None)"""
+    terms = tokenize(term)
+    if not terms:
+        return None
+
+    backend = get_backend()
+    if backend == 'fts5':
+        # Prefix match on each stem so partially typed words still match
+        return ' '.join(f'"{t}"*' for t in terms)
+    if backend == 'postgresql':
+        return ' & '.join(f'{t}:*' for t in terms)
+    return term
+
+
+def search_subquery(term):
+    """
+    Subquery of matching items with columns (item_id, rank)
+
+    A lower rank means a more relevant match on every backend.
+    """
+    from app.models import WardrobeItem
+    backend = get_backend()
+    query = match_query(term)
+
+    if backend == 'fts5' and query:
+        return text(
+            f'SELECT rowid AS item_id, '
+            f'bm25({SEARCH_TABLE}, {TITLE_WEIGHT}, {DESCRIPTION_WEIGHT}) AS rank '
+            f'FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH :search_query'
+        ).bindparams(search_query=query).columns(item_id=Integer, rank=Float).subquery('matches')
+
+    if backend == 'postgresql' and query:
+        return text(
+            f"SELECT item_id, -ts_rank_cd(document, q) AS rank "
+            f"FROM {SEARCH_TABLE}, to_tsquery('simple', :search_query) q "
+            f"WHERE document @@ q"
+        ).bindparams(search_query=query).columns(item_id=Integer, rank=Float).subquery('matches')
+
+    # No usable index: plain substring match, with the user's wildcards escaped
+    escaped = term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    pattern = f'%{escaped}%'
+    return select(
+        WardrobeItem.id.label('item_id'),
+        literal(0.0, Float).label('rank')
+    ).where(or_(
+        WardrobeItem.title.ilike(pattern, escape='\\'),
+        WardrobeItem.description.ilike(pattern, escape='\\')
+    )).subquery('matches')
+
+
+def _sync_index(session, flush_context):
+    """Keep the search index in step with flushed WardrobeItem changes"""
+    from app.models import WardrobeItem
+    if get_backend() == 'like':
+        return
+
+    changed = []
+    for obj in list(session.new) + list(session.dirty):
+        if not isinstance(obj, WardrobeItem):
+            continue
+        state = inspect(obj)
+        if obj in session.new or state.attrs.title.history.has_changes() \
+                or state.attrs.description.history.has_changes():
+            changed.append((obj.id, obj.title, obj.description))
+
+    deleted = [obj.id for obj in session.deleted if isinstance(obj, WardrobeItem)]
+
+    if changed or deleted:
+        conn = session.connection()
+        unindex_items(conn, deleted)
+        index_items(conn, changed)
+
+
+event.listen(db.session, 'after_flush', _sync_index)
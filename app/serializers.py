@@ -0,0 +1,236 @@
+"""
+JSON serialization for Stycly
+Column-projected queries over WardrobeItem and row-to-JSON encoding shared
+by the catalog, cart, product detail and wardrobe routes. Rows are plain
+tuples (no ORM hydration) and responses are encoded straight to bytes.
+"""
+
+import json
+from flask import Response, url_for
+from sqlalchemy import and_, select
+from app import db
+from app.models import WardrobeItem, WardrobeImage
+
+try:
+    import orjson
+except ImportError:  # Fall back to the standard library encoder
+    orjson = None
+
+# Columns of a public catalog product, in serialization order
+PRODUCT_COLUMNS = (
+    WardrobeItem.id,
+    WardrobeItem.title,
+    WardrobeItem.description,
+    WardrobeItem.destination,
+    WardrobeItem.category,
+    WardrobeItem.size,
+    WardrobeItem.age_range,
+    WardrobeItem.color,
+    WardrobeItem.condition,
+    WardrobeItem.stock,
+)
+
+RELATED_COLUMNS = (
+    WardrobeItem.id,
+    WardrobeItem.title,
+    WardrobeItem.size,
+    WardrobeItem.age_range,
+    WardrobeItem.color,
+    WardrobeItem.condition,
+    WardrobeItem.stock,
+)
+
+CART_COLUMNS = (
+    WardrobeItem.id,
+    WardrobeItem.title,
+    WardrobeItem.size,
+    WardrobeItem.age_range,
+    WardrobeItem.stock,
+)
+
+WARDROBE_COLUMNS = PRODUCT_COLUMNS + (
+    WardrobeItem.is_public_for_rent,
+    WardrobeItem.created_at,
+    WardrobeItem.updated_at,
+)
+
+
+def dumps(data):
+    """Encode data as compact UTF-8 JSON bytes"""
+    if orjson is not None:
+        return orjson.dumps(data)
+    return json.dumps(data, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+
+
+def json_response(data, status=200):
+    """JSON response from already-serializable data, without jsonify"""
+    return Response(dumps(data), status=status, mimetype='application/json')
+
+
+def format_timestamp(value):
+    """'YYYY-MM-DD HH:MM' without the cost of strftime"""
+    return value.isoformat(' ', 'minutes') if value else None
+
+
+def image_paths_by_item(item_ids, variant='original'):
+    """Ordered image paths per item id, in one query"""
+    paths = {}
+    if not item_ids:
+        return paths
+
+    rows = db.session.execute(
+        select(WardrobeImage.item_id, WardrobeImage.path)
+        .where(WardrobeImage.item_id.in_(item_ids), WardrobeImage.variant == variant)
+        .order_by(WardrobeImage.item_id, WardrobeImage.position)
+    )
+    for item_id, path in rows:
+        paths.setdefault(item_id, []).append(path)
+    return paths
+
+
+def serialize_products(rows):
+    """
+    Catalog products from rows starting with PRODUCT_COLUMNS
+
+    Extra trailing columns (sort keys, search rank) are ignored.
+    """
+    rows = list(rows)
+    images = image_paths_by_item([row[0] for row in rows])
+    return [
+        {
+            'id': item_id,
+            'title': title,
+            'description': description,
+            'destination': destination,
+            'category': category,
+            'size': size,
+            'age_range': age_range,
+            'color': color,
+            'condition': condition,
+            'image_paths': images.get(item_id, []),
+            'stock': stock or 0
+        }
+        for (item_id, title, description, destination, category, size,
+             age_range, color, condition, stock, *_extra) in rows
+    ]
+
+
+def product_row(item_id):
+    """PRODUCT_COLUMNS of a public item, or None"""
+    return db.session.execute(
+        select(*PRODUCT_COLUMNS)
+        .where(WardrobeItem.id == item_id, WardrobeItem.is_public_for_rent == True)
+    ).first()
+
+
+def serialize_related(rows):
+    """Related product cards from RELATED_COLUMNS rows"""
+    rows = list(rows)
+    images = image_paths_by_item([row[0] for row in rows])
+    return [
+        {
+            'id': item_id,
+            'title': title,
+            'size': size,
+            'age_range': age_range,
+            'color': color,
+            'condition': condition,
+            'stock': stock,
+            'image_paths': images.get(item_id, [])
+        }
+        for item_id, title, size, age_range, color, condition, stock in rows
+    ]
+
+
+def cart_rows(item_ids):
+    """
+    CART_COLUMNS rows of the given items with their cover images
+
+    One query: items are outer-joined to their position-0 images, so an
+    item can appear twice (original and thumbnail rendition).
+    """
+    if not item_ids:
+        return []
+    return db.session.execute(
+        select(*CART_COLUMNS, WardrobeImage.variant, WardrobeImage.path)
+        .outerjoin(WardrobeImage, and_(
+            WardrobeImage.item_id == WardrobeItem.id,
+            WardrobeImage.position == 0
+        ))
+        .where(WardrobeItem.id.in_(item_ids))
+    ).all()
+
+
+def serialize_cart(rows, cart):
+    """
+    Cart lines in cart order from cart_rows, thumbnail cover preferred
+
+    Returns:
+        dict: {'items': [...], 'total_items': int}
+    """
+    items = {}
+    covers = {}
+    for item_id, title, size, age_range, stock, variant, path in rows:
+        items[item_id] = (title, size, age_range, stock)
+        if path and (variant == 'thumb' or item_id not in covers):
+            covers[item_id] = path
+
+    cart_items = []
+    total_items = 0
+    for item_id_str, quantity in cart.items():
+        item_id = int(item_id_str)
+        if item_id not in items:
+            continue
+        title, size, age_range, stock = items[item_id]
+
+        # Convert relative path to full URL
+        image_path = 'https://via.placeholder.com/100x100?text=No+Image'
+        if item_id in covers:
+            image_path = url_for('static', filename=covers[item_id])
+
+        cart_items.append({
+            'id': item_id,
+            'title': title,
+            'size': size,
+            'age_range': age_range,
+            'image_path': image_path,
+            'quantity': quantity,
+            'stock': stock
+        })
+        total_items += quantity
+
+    return {'items': cart_items, 'total_items': total_items}
+
+
+def wardrobe_rows(user_id):
+    """WARDROBE_COLUMNS rows of a user's items, newest first"""
+    return db.session.execute(
+        select(*WARDROBE_COLUMNS)
+        .where(WardrobeItem.user_id == user_id)
+        .order_by(WardrobeItem.created_at.desc())
+    ).all()
+
+
+def serialize_wardrobe(rows):
+    """Wardrobe items from WARDROBE_COLUMNS rows"""
+    images = image_paths_by_item([row[0] for row in rows])
+    return [
+        {
+            'id': item_id,
+            'title': title,
+            'description': description,
+            'destination': destination,
+            'category': category,
+            'size': size,
+            'age_range': age_range,
+            'color': color,
+            'condition': condition,
+            'stock': stock,
+            'is_public_for_rent': is_public_for_rent,
+            'image_paths': images.get(item_id, []),
+            'created_at': format_timestamp(created_at),
+            'updated_at': format_timestamp(updated_at)
+        }
+        for (item_id, title, description, destination, category, size, age_range,
+             color, condition, stock, is_public_for_rent, created_at, updated_at) in rows
+    ]
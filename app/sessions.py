@@ -0,0 +1,298 @@
+"""
+Server-side sessions for Stycly
+The session cookie holds only an opaque random id; the session data is
+stored server-side, zlib-compressed, in a SQLite file shared by the host's
+workers or in the application database (SESSION_BACKEND). Data is only
+written when the session changed, and expired sessions are ignored when
+read and deleted by the worker.
+"""
+
+import hashlib
+import os
+import secrets
+import sqlite3
+import threading
+import zlib
+from datetime import datetime, timedelta
+from flask.json.tag import TaggedJSONSerializer
+from flask.sessions import SecureCookieSession, SecureCookieSessionInterface, SessionInterface
+from sqlalchemy import delete, insert, select, update
+from app import db
+from app.models import ServerSession
+
+# Payloads from this size on are compressed
+COMPRESS_MIN_BYTES = 128
+
+_RAW = b'j'
+_ZLIB = b'z'
+
+_serializer = TaggedJSONSerializer()
+
+
+def encode_session(data):
+    """Session dict -> bytes (tagged JSON, zlib-compressed when large)"""
+    raw = _serializer.dumps(dict(data)).encode('utf-8')
+    if len(raw) >= COMPRESS_MIN_BYTES:
+        compressed = zlib.compress(raw, 6)
+        if len(compressed) < len(raw):
+            return _ZLIB + compressed
+    return _RAW + raw
+
+
+def decode_session(payload):
+    """Bytes from encode_session -> session dict"""
+    payload = bytes(payload)
+    body = zlib.decompress(payload[1:]) if payload[:1] == _ZLIB else payload[1:]
+    return _serializer.loads(body.decode('utf-8'))
+
+
+def _store_key(sid):
+    """Stored key of a session id: a leaked store holds no usable cookies"""
+    return hashlib.sha256(sid.encode('utf-8')).hexdigest()
+
+
+class ServerSideSession(SecureCookieSession):
+    """Session dict with the id it is stored under"""
+
+    def __init__(self, initial=None, sid=None, expires_at=None):
+        super().__init__(initial)
+        self.sid = sid
+        self.expires_at = expires_at
+        self.rotate = False
+
+    def regenerate(self):
+        """Move the data to a new id on save (after login, against fixation)"""
+        self.rotate = True
+        self.modified = True
+
+
+class SQLiteSessionStore:
+    """Sessions in a SQLite file, one connection per thread and process"""
+
+    def __init__(self, path, timeout=5):
+        self.path = path
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS sessions '
+                '(id TEXT PRIMARY KEY, data BLOB NOT NULL, expires_at REAL NOT NULL)'
+            )
+            conn.execute('CREATE INDEX IF NOT EXISTS ix_sessions_expires ON sessions (expires_at)')
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    def load(self, key):
+        row = self._connection().execute(
+            'SELECT data, expires_at FROM sessions WHERE id = ?', (key,)
+        ).fetchone()
+        return (row[0], datetime.utcfromtimestamp(row[1])) if row else None
+
+    def save(self, key, data, expires_at):
+        self._connection().execute(
+            'INSERT INTO sessions (id, data, expires_at) VALUES (?, ?, ?) '
+            'ON CONFLICT (id) DO UPDATE SET data = excluded.data, expires_at = excluded.expires_at',
+            (key, data, _timestamp(expires_at))
+        )
+
+    def touch(self, key, expires_at):
+        self._connection().execute(
+            'UPDATE sessions SET expires_at = ? WHERE id = ?', (_timestamp(expires_at), key)
+        )
+
+    def delete(self, key):
+        self._connection().execute('DELETE FROM sessions WHERE id = ?', (key,))
+
+    def prune(self, now):
+        return self._connection().execute(
+            'DELETE FROM sessions WHERE expires_at < ?', (_timestamp(now),)
+        ).rowcount
+
+
+def _timestamp(value):
+    """Naive UTC datetime -> POSIX seconds"""
+    return (value - datetime(1970, 1, 1)).total_seconds()
+
+
+class DatabaseSessionStore:
+    """
+    Sessions in the server_sessions table
+
+    Loads run before the request's session takes a connection. Writes run
+    after the response is built, so the request's session is released
+    first: a request never holds two pool connections at once.
+    """
+
+    table = ServerSession.__table__
+
+    def load(self, key):
+        with db.engine.connect() as conn:
+            row = conn.execute(
+                select(self.table.c.data, self.table.c.expires_at).where(self.table.c.id == key)
+            ).first()
+        return (row.data, row.expires_at) if row else None
+
+    def save(self, key, data, expires_at):
+        db.session.remove()
+        with db.engine.begin() as conn:
+            result = conn.execute(
+                update(self.table).where(self.table.c.id == key).values(data=data, expires_at=expires_at)
+            )
+            if not result.rowcount:
+                conn.execute(insert(self.table).values(id=key, data=data, expires_at=expires_at))
+
+    def touch(self, key, expires_at):
+        db.session.remove()
+        with db.engine.begin() as conn:
+            conn.execute(update(self.table).where(self.table.c.id == key).values(expires_at=expires_at))
+
+    def delete(self, key):
+        db.session.remove()
+        with db.engine.begin() as conn:
+            conn.execute(delete(self.table).where(self.table.c.id == key))
+
+    def prune(self, now, batch_size=1000):
+        deleted = 0
+        while True:
+            with db.engine.begin() as conn:
+                ids = conn.execute(
+                    select(self.table.c.id).where(self.table.c.expires_at < now).limit(batch_size)
+                ).scalars().all()
+                if ids:
+                    conn.execute(delete(self.table).where(self.table.c.id.in_(ids)))
+            deleted += len(ids)
+            if len(ids) < batch_size:
+                return deleted
+
+
+class ServerSideSessionInterface(SessionInterface):
+    """
+    Flask session interface over a session store
+
+    Sessions slide: the expiry moves forward on use, but is only written
+    when it is more than SESSION_REFRESH_SECONDS behind.
+    """
+
+    session_class = ServerSideSession
+
+    def __init__(self, store):
+        self.store = store
+        # Sessions from before server-side storage are read from the old cookie once
+        self._legacy = SecureCookieSessionInterface()
+
+    def lifetime(self, app, session):
+        if session.permanent:
+            return app.permanent_session_lifetime
+        return timedelta(hours=app.config.get('SESSION_IDLE_HOURS', 24))
+
+    def open_session(self, app, request):
+        sid = request.cookies.get(self.get_cookie_name(app))
+        if sid:
+            try:
+                stored = self.store.load(_store_key(sid))
+            except Exception as e:
+                app.logger.error(f'Session store unavailable: {str(e)}')
+                return self.session_class()
+            if stored and stored[1] > datetime.utcnow():
+                return self.session_class(decode_session(stored[0]), sid=sid, expires_at=stored[1])
+
+            legacy = self._legacy.open_session(app, request)
+            if legacy:
+                session = self.session_class(dict(legacy))
+                session.modified = True
+                return session
+        return self.session_class()
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+
+        if not session:
+            # Emptied (e.g. logout) or never used: forget it
+            if session.sid and session.modified:
+                try:
+                    self.store.delete(_store_key(session.sid))
+                except Exception as e:
+                    app.logger.error(f'Session store unavailable: {str(e)}')
+            if session.sid or session.modified:
+                response.delete_cookie(name, domain=domain, path=path,
+                                       secure=self.get_cookie_secure(app),
+                                       httponly=self.get_cookie_httponly(app),
+                                       samesite=self.get_cookie_samesite(app))
+            return
+
+        if session.accessed:
+            response.vary.add('Cookie')
+
+        now = datetime.utcnow()
+        expires_at = now + self.lifetime(app, session)
+        refresh = timedelta(seconds=app.config.get('SESSION_REFRESH_SECONDS', 3600))
+
+        try:
+            if session.rotate and session.sid:
+                self.store.delete(_store_key(session.sid))
+                session.sid = None
+
+            if session.sid is None or session.modified:
+                sid = session.sid or secrets.token_urlsafe(32)
+                self.store.save(_store_key(sid), encode_session(session), expires_at)
+            elif expires_at - session.expires_at >= refresh:
+                sid = session.sid
+                self.store.touch(_store_key(sid), expires_at)
+            else:
+                # Unchanged and recently refreshed: no write, no cookie
+                return
+        except Exception as e:
+            # The response (e.g. a committed order) still goes out; the
+            # session change is lost and the cookie left as it was
+            app.logger.error(f'Session store unavailable: {str(e)}')
+            return
+
+        response.set_cookie(
+            name, sid,
+            expires=self.get_expiration_time(app, session),
+            httponly=self.get_cookie_httponly(app),
+            domain=domain,
+            path=path,
+            secure=self.get_cookie_secure(app),
+            samesite=self.get_cookie_samesite(app),
+        )
+
+
+def regenerate_session(session):
+    """Give the session a new id on save, if the backend supports it"""
+    if isinstance(session, ServerSideSession):
+        session.regenerate()
+
+
+def prune_sessions():
+    """Delete expired server-side sessions; run periodically by the worker"""
+    from flask import current_app
+
+    interface = current_app.session_interface
+    if not isinstance(interface, ServerSideSessionInterface):
+        return 0
+    return interface.store.prune(datetime.utcnow())
+
+
+def init_sessions(app):
+    """Install the session backend selected by SESSION_BACKEND"""
+    backend = app.config.get('SESSION_BACKEND', 'database')
+    if backend == 'cookie':
+        return
+    if backend == 'sqlite':
+        path = app.config.get('SESSION_SQLITE_PATH') or os.path.join(app.instance_path, 'sessions.db')
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        store = SQLiteSessionStore(path)
+    elif backend == 'database':
+        store = DatabaseSessionStore()
+    else:
+        raise ValueError(f'Unknown SESSION_BACKEND: {backend}')
+    app.session_interface = ServerSideSessionInterface(store)
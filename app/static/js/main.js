@@ -79,7 +79,7 @@ document.addEventListener('DOMContentLoaded', function() {
         });
         
         // Fetch last insert time
-        fetchLastInsertTime();
+        fromBootstrap('user', data => renderLastInsertTime(data.last_insert), fetchLastInsertTime);
     }
     
     // Cart functionality
@@ -88,7 +88,10 @@ document.addEventListener('DOMContentLoaded', function() {
     
     if (cartBtn) {
         cartBtn.addEventListener('click', openCartModal);
-        updateCartBadge();
+        fromBootstrap('cart', data => {
+            rememberCartQuantities(data);
+            renderCartBadge(data.total_items);
+        }, updateCartBadge);
     }
     
     // Search button - scroll to products and focus search
@@ -136,34 +139,100 @@ document.addEventListener('DOMContentLoaded', function() {
     }
 });
 
+// Homepage initial data: one request shared by every script on the page
+let bootstrapRequest = null;
+
+function isHomepage() {
+    return document.getElementById('productsGrid') !== null;
+}
+
+function fetchBootstrap() {
+    if (!bootstrapRequest) {
+        // Browsers may restore filter values on reload
+        const params = typeof buildProductsQuery === 'function' ? buildProductsQuery() : new URLSearchParams();
+        bootstrapRequest = fetch(`/api/bootstrap?${params.toString()}`)
+            .then(res => {
+                if (!res.ok) throw new Error(`Bootstrap failed: ${res.status}`);
+                return res.json();
+            });
+    }
+    return bootstrapRequest;
+}
+
+// Render one part of the bootstrap data on the homepage; elsewhere, or if
+// the part is missing, fall back to the part's own endpoint
+function fromBootstrap(part, render, fallback) {
+    if (!isHomepage()) {
+        fallback();
+        return;
+    }
+    fetchBootstrap()
+        .then(data => {
+            if (data[part] == null) throw new Error(`Bootstrap has no ${part}`);
+            render(data[part]);
+        })
+        .catch(err => {
+            console.error(`Error loading ${part} from bootstrap:`, err);
+            fallback();
+        });
+}
+
 // Fetch last item insert time for user dropdown
 function fetchLastInsertTime() {
     fetch('/api/user/last-insert')
         .then(res => res.json())
-        .then(data => {
-            const lastInsertInfo = document.getElementById('lastInsertInfo');
-            if (lastInsertInfo) {
-                if (data.last_insert) {
-                    lastInsertInfo.innerHTML = `<i class="fas fa-clock"></i><span>Ultimo articolo aggiunto: ${data.last_insert}</span>`;
-                } else {
-                    lastInsertInfo.innerHTML = '<i class="fas fa-clock"></i><span>Nessun articolo aggiunto ancora</span>';
-                }
-            }
-        })
+        .then(data => renderLastInsertTime(data.last_insert))
         .catch(err => console.error('Error fetching last insert time:', err));
 }
 
+function renderLastInsertTime(lastInsert) {
+    const lastInsertInfo = document.getElementById('lastInsertInfo');
+    if (lastInsertInfo) {
+        if (lastInsert) {
+            lastInsertInfo.innerHTML = `<i class="fas fa-clock"></i><span>Ultimo articolo aggiunto: ${lastInsert}</span>`;
+        } else {
+            lastInsertInfo.innerHTML = '<i class="fas fa-clock"></i><span>Nessun articolo aggiunto ancora</span>';
+        }
+    }
+}
+
 // Cart functions
+
+// Callers asking for the cart while a request is in flight share it
+let cartRequest = null;
+
+// Item id -> quantity in the cart as last confirmed by the server
+let cartQuantities = {};
+
+function rememberCartQuantities(cart) {
+    cartQuantities = {};
+    (cart.items || []).forEach(item => { cartQuantities[item.id] = item.quantity; });
+}
+
+function fetchCart() {
+    if (!cartRequest) {
+        cartRequest = fetch('/shop/cart/get')
+            .then(res => res.json())
+            .then(data => {
+                rememberCartQuantities(data);
+                return data;
+            })
+            .finally(() => { cartRequest = null; });
+    }
+    return cartRequest;
+}
+
+function renderCartBadge(totalItems) {
+    const badge = document.getElementById('cartBadge');
+    if (badge) {
+        badge.textContent = totalItems || 0;
+        badge.style.display = totalItems > 0 ? 'block' : 'none';
+    }
+}
+
 function updateCartBadge() {
-    fetch('/shop/cart/get')
-        .then(res => res.json())
-        .then(data => {
-            const badge = document.getElementById('cartBadge');
-            if (badge) {
-                badge.textContent = data.total_items || 0;
-                badge.style.display = data.total_items > 0 ? 'block' : 'none';
-            }
-        })
+    fetchCart()
+        .then(data => renderCartBadge(data.total_items))
         .catch(err => console.error('Error updating cart badge:', err));
 }
 
@@ -178,83 +247,156 @@ function closeCartModal() {
     modal.classList.remove('show');
 }
 
+// Last cart shown in the modal, updated optimistically on quantity changes
+let cartState = null;
+
+function renderCartItems(data) {
+    cartState = data;
+    const cartItems = document.getElementById('cartItems');
+    if (!cartItems) return;
+
+    if (data.items && data.items.length > 0) {
+        let html = '<div class="cart-items">';
+        data.items.forEach(item => {
+            // image_path is already a full URL from url_for
+            const imgSrc = item.image_path || 'https://via.placeholder.com/80x80?text=No+Image';
+
+            html += `
+                <div class="cart-item">
+                    <img src="${imgSrc}" alt="${item.title}" onerror="this.src='https://via.placeholder.com/80x80?text=No+Image'">
+                    <div class="cart-item-info">
+                        <h4>${item.title}</h4>
+                        <p>Taglia: ${item.size}</p>
+                        ${item.age_range ? `<p>Età: ${item.age_range}</p>` : ''}
+                    </div>
+                    <div class="cart-item-controls">
+                        <button onclick="updateCartQuantity(${item.id}, ${item.quantity - 1})">-</button>
+                        <span>${item.quantity}</span>
+                        <button onclick="updateCartQuantity(${item.id}, ${item.quantity + 1})">+</button>
+                    </div>
+                    <button class="cart-item-remove" onclick="removeFromCart(${item.id})">
+                        <i class="fas fa-trash"></i>
+                    </button>
+                </div>
+            `;
+        });
+        html += '</div>';
+        cartItems.innerHTML = html;
+    } else {
+        cartItems.innerHTML = '<p style="text-align: center; padding: 2rem;">Il tuo carrello è vuoto</p>';
+    }
+}
+
 function loadCartItems() {
-    fetch('/shop/cart/get')
-        .then(res => res.json())
-        .then(data => {
-            const cartItems = document.getElementById('cartItems');
-            if (data.items && data.items.length > 0) {
-                let html = '<div class="cart-items">';
-                data.items.forEach(item => {
-                    // image_path is already a full URL from url_for
-                    const imgSrc = item.image_path || 'https://via.placeholder.com/80x80?text=No+Image';
-
-                    html += `
-                        <div class="cart-item">
-                            <img src="${imgSrc}" alt="${item.title}" onerror="this.src='https://via.placeholder.com/80x80?text=No+Image'">
-                            <div class="cart-item-info">
-                                <h4>${item.title}</h4>
-                                <p>Taglia: ${item.size}</p>
-                                ${item.age_range ? `<p>Età: ${item.age_range}</p>` : ''}
-                            </div>
-                            <div class="cart-item-controls">
-                                <button onclick="updateCartQuantity(${item.id}, ${item.quantity - 1})">-</button>
-                                <span>${item.quantity}</span>
-                                <button onclick="updateCartQuantity(${item.id}, ${item.quantity + 1})">+</button>
-                            </div>
-                            <button class="cart-item-remove" onclick="removeFromCart(${item.id})">
-                                <i class="fas fa-trash"></i>
-                            </button>
-                        </div>
-                    `;
-                });
-                html += '</div>';
-                cartItems.innerHTML = html;
-            } else {
-                cartItems.innerHTML = '<p style="text-align: center; padding: 2rem;">Il tuo carrello è vuoto</p>';
-            }
-        })
+    fetchCart()
+        .then(renderCartItems)
         .catch(err => console.error('Error loading cart:', err));
 }
 
-function updateCartQuantity(itemId, quantity) {
-    fetch('/shop/cart/update', {
+// Cart changes made in quick succession are sent as one /shop/cart/batch
+// request. A batch is all or nothing, so when one fails its operations are
+// retried one by one and every caller gets the response for its own change.
+const CART_BATCH_DELAY = 300;
+let pendingCartOperations = [];
+let pendingCartCallbacks = [];
+let cartBatchTimer = null;
+
+function queueCartOperation(operation) {
+    return new Promise((resolve, reject) => {
+        pendingCartOperations.push(operation);
+        pendingCartCallbacks.push({resolve, reject});
+        clearTimeout(cartBatchTimer);
+        cartBatchTimer = setTimeout(sendCartBatch, CART_BATCH_DELAY);
+    });
+}
+
+function postCartBatch(operations) {
+    // Rental dates chosen in the catalog (products.js), if any
+    const period = typeof selectedRentalPeriod === 'function' ? selectedRentalPeriod() : {};
+
+    return fetch('/shop/cart/batch', {
         method: 'POST',
         headers: {'Content-Type': 'application/json'},
-        body: JSON.stringify({item_id: itemId, quantity: quantity})
+        body: JSON.stringify(Object.assign({operations: operations}, period))
     })
     .then(res => res.json())
     .then(data => {
-        if (data.success) {
-            loadCartItems();
-            updateCartBadge();
-            // Reload products to update available stock
-            if (typeof loadProducts === 'function') {
-                loadProducts();
+        if (data.success) applyCartResponse(data.cart);
+        return data;
+    });
+}
+
+function applyCartResponse(cart) {
+    // Available stock of loaded products moves by the change in cart quantity
+    const changes = {};
+    const quantities = {};
+    cart.items.forEach(item => { quantities[item.id] = item.quantity; });
+    new Set(Object.keys(cartQuantities).concat(Object.keys(quantities))).forEach(id => {
+        const delta = (quantities[id] || 0) - (cartQuantities[id] || 0);
+        if (delta) changes[id] = delta;
+    });
+    cartQuantities = quantities;
+
+    renderCartItems(cart);
+    renderCartBadge(cart.total_items);
+    if (typeof adjustProductStock === 'function') {
+        adjustProductStock(changes);
+    }
+}
+
+function sendCartBatch() {
+    const operations = pendingCartOperations;
+    const callbacks = pendingCartCallbacks;
+    pendingCartOperations = [];
+    pendingCartCallbacks = [];
+    cartBatchTimer = null;
+
+    postCartBatch(operations)
+        .then(data => {
+            if (data.success || operations.length === 1) {
+                if (!data.success) {
+                    // Nothing was applied: show the cart as the server has it
+                    loadCartItems();
+                    updateCartBadge();
+                }
+                callbacks.forEach(callback => callback.resolve(data));
+                return;
             }
-        }
-    })
-    .catch(err => console.error('Error updating cart:', err));
+
+            // One operation spoiled the batch: apply the others on their own, in order
+            return operations.reduce((previous, operation, index) => previous
+                .then(() => postCartBatch([operation]))
+                .then(result => callbacks[index].resolve(result))
+                .catch(err => callbacks[index].reject(err)),
+                Promise.resolve()
+            ).then(() => {
+                loadCartItems();
+                updateCartBadge();
+            });
+        })
+        .catch(err => callbacks.forEach(callback => callback.reject(err)));
 }
 
-function removeFromCart(itemId) {
-    fetch('/shop/cart/remove', {
-        method: 'POST',
-        headers: {'Content-Type': 'application/json'},
-        body: JSON.stringify({item_id: itemId})
-    })
-    .then(res => res.json())
-    .then(data => {
-        if (data.success) {
-            loadCartItems();
-            updateCartBadge();
-            // Reload products to update available stock
-            if (typeof loadProducts === 'function') {
-                loadProducts();
+function updateCartQuantity(itemId, quantity) {
+    // Show the new quantity at once; the server response replaces it
+    if (cartState && cartState.items) {
+        const items = cartState.items
+            .map(item => item.id === itemId ? Object.assign({}, item, {quantity: quantity}) : item)
+            .filter(item => item.quantity > 0);
+        renderCartItems(Object.assign({}, cartState, {items: items}));
+    }
+
+    queueCartOperation({op: 'update', item_id: itemId, quantity: Math.max(quantity, 0)})
+        .then(data => {
+            if (!data.success && typeof showNotification === 'function') {
+                showNotification(data.message || 'Impossibile aggiornare il carrello', 'error');
             }
-        }
-    })
-    .catch(err => console.error('Error removing from cart:', err));
+        })
+        .catch(err => console.error('Error updating cart:', err));
+}
+
+function removeFromCart(itemId) {
+    updateCartQuantity(itemId, 0);
 }
 
 function proceedToRental() {
@@ -276,8 +418,7 @@ function proceedToRental() {
 }
 
 function populateOrderSummary() {
-    fetch('/shop/cart/get')
-        .then(res => res.json())
+    fetchCart()
         .then(data => {
             console.log('Cart data received:', data);
 
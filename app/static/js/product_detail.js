@@ -97,14 +97,13 @@ async function addToCartDetail(productId) {
     const quantity = parseInt(quantityInput.value) || 1;
 
     try {
-        const response = await fetch('/shop/cart/add', {
+        const response = await fetch('/shop/cart/batch', {
             method: 'POST',
             headers: {
                 'Content-Type': 'application/json',
             },
             body: JSON.stringify({
-                product_id: productId,
-                quantity: quantity
+                operations: [{op: 'add', item_id: productId, quantity: quantity}]
             })
         });
 
@@ -139,14 +138,13 @@ async function addToCartDetail(productId) {
 // Quick Add from Related Products
 async function quickAdd(productId) {
     try {
-        const response = await fetch('/shop/cart/add', {
+        const response = await fetch('/shop/cart/batch', {
             method: 'POST',
             headers: {
                 'Content-Type': 'application/json',
             },
             body: JSON.stringify({
-                product_id: productId,
-                quantity: 1
+                operations: [{op: 'add', item_id: productId, quantity: 1}]
             })
         });
 
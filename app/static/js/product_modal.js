@@ -509,15 +509,14 @@ async function addToCartFromModal() {
     btnText.textContent = 'Aggiungendo...';
 
     try {
-        const response = await fetch('/shop/cart/add', {
+        const response = await fetch('/shop/cart/batch', {
             method: 'POST',
             headers: {
                 'Content-Type': 'application/json',
             },
-            body: JSON.stringify({
-                product_id: product.id,
-                quantity: modalState.quantity
-            })
+            body: JSON.stringify(Object.assign({
+                operations: [{op: 'add', item_id: product.id, quantity: modalState.quantity}]
+            }, typeof selectedRentalPeriod === 'function' ? selectedRentalPeriod() : {}))
         });
 
         const data = await response.json();
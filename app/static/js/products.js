@@ -1,10 +1,31 @@
 // Products catalog functionality
 let allProducts = [];
 let productsData = [];
+let nextProductsCursor = null;
+let productsRequestId = 0;
+let searchDebounceTimer = null;
+
+// Query string name -> filter element id
+const PRODUCT_FILTERS = {
+    q: 'searchInput',
+    category: 'categoryFilter',
+    destination: 'destinationFilter',
+    size: 'sizeFilter',
+    age_range: 'ageRangeFilter',
+    color: 'colorFilter',
+    condition: 'conditionFilter',
+    start_date: 'startDateFilter',
+    end_date: 'endDateFilter',
+    sort: 'sortFilter'
+};
 
 document.addEventListener('DOMContentLoaded', function() {
-    loadFilters();
-    loadProducts();
+    // Filters and the first page come with the homepage bootstrap data
+    fromBootstrap('filters', renderFilters, loadFilters);
+    const requestId = ++productsRequestId;
+    fromBootstrap('products', page => {
+        if (requestId === productsRequestId) showProductsPage(page, false);
+    }, () => loadProducts());
 
     // Set up filters
     const searchInput = document.getElementById('searchInput');
@@ -14,96 +35,104 @@ document.addEventListener('DOMContentLoaded', function() {
     const ageRangeFilter = document.getElementById('ageRangeFilter');
     const colorFilter = document.getElementById('colorFilter');
     const conditionFilter = document.getElementById('conditionFilter');
-
-    if (searchInput) searchInput.addEventListener('input', filterProducts);
+    const startDateFilter = document.getElementById('startDateFilter');
+    const endDateFilter = document.getElementById('endDateFilter');
+    const sortFilter = document.getElementById('sortFilter');
+    const loadMoreBtn = document.getElementById('loadMoreBtn');
+
+    if (searchInput) searchInput.addEventListener('input', () => {
+        // Wait for the user to stop typing before querying the server
+        clearTimeout(searchDebounceTimer);
+        searchDebounceTimer = setTimeout(filterProducts, 300);
+    });
     if (categoryFilter) categoryFilter.addEventListener('change', filterProducts);
     if (destinationFilter) destinationFilter.addEventListener('change', filterProducts);
     if (sizeFilter) sizeFilter.addEventListener('change', filterProducts);
     if (ageRangeFilter) ageRangeFilter.addEventListener('change', filterProducts);
     if (colorFilter) colorFilter.addEventListener('change', filterProducts);
     if (conditionFilter) conditionFilter.addEventListener('change', filterProducts);
+    if (startDateFilter) startDateFilter.addEventListener('change', filterProducts);
+    if (endDateFilter) endDateFilter.addEventListener('change', filterProducts);
+    if (sortFilter) sortFilter.addEventListener('change', filterProducts);
+    if (loadMoreBtn) loadMoreBtn.addEventListener('click', () => loadProducts(true));
 });
 
+// Response key -> [filter name, select element id]
+const FACET_SELECTS = {
+    categories: ['category', 'categoryFilter'],
+    destinations: ['destination', 'destinationFilter'],
+    sizes: ['size', 'sizeFilter'],
+    age_ranges: ['age_range', 'ageRangeFilter'],
+    colors: ['color', 'colorFilter'],
+    conditions: ['condition', 'conditionFilter']
+};
+
 function loadFilters() {
-    fetch('/shop/filters')
+    // Counts are conditioned on the currently selected filters
+    const params = buildProductsQuery();
+    params.delete('sort');
+
+    fetch(`/shop/filters?${params.toString()}`, {cache: 'no-cache'})
         .then(res => res.json())
-        .then(filters => {
-            // Populate category filter
-            const categoryFilter = document.getElementById('categoryFilter');
-            if (categoryFilter && filters.categories) {
-                filters.categories.forEach(cat => {
-                    const option = document.createElement('option');
-                    option.value = cat;
-                    option.textContent = cat;
-                    categoryFilter.appendChild(option);
-                });
-            }
+        .then(renderFilters)
+        .catch(err => console.error('Error loading filters:', err));
+}
 
-            // Populate destination filter
-            const destinationFilter = document.getElementById('destinationFilter');
-            if (destinationFilter && filters.destinations) {
-                filters.destinations.forEach(dest => {
-                    const option = document.createElement('option');
-                    option.value = dest;
-                    option.textContent = dest;
-                    destinationFilter.appendChild(option);
-                });
-            }
+function renderFilters(filters) {
+    Object.entries(FACET_SELECTS).forEach(([key, [name, elementId]]) => {
+        const select = document.getElementById(elementId);
+        if (!select || !filters[key]) return;
 
-            // Populate size filter
-            const sizeFilter = document.getElementById('sizeFilter');
-            if (sizeFilter && filters.sizes) {
-                filters.sizes.forEach(size => {
-                    const option = document.createElement('option');
-                    option.value = size;
-                    option.textContent = size;
-                    sizeFilter.appendChild(option);
-                });
-            }
+        const counts = (filters.counts && filters.counts[name]) || {};
+        const selected = select.value;
+        const values = filters[key].slice();
 
-            // Populate age range filter
-            const ageRangeFilter = document.getElementById('ageRangeFilter');
-            if (ageRangeFilter && filters.age_ranges) {
-                filters.age_ranges.forEach(age => {
-                    const option = document.createElement('option');
-                    option.value = age;
-                    option.textContent = age;
-                    ageRangeFilter.appendChild(option);
-                });
-            }
+        // Keep the current selection even if it has no matches left
+        if (selected && !values.includes(selected)) {
+            values.push(selected);
+        }
 
-            // Populate color filter
-            const colorFilter = document.getElementById('colorFilter');
-            if (colorFilter && filters.colors) {
-                filters.colors.forEach(color => {
-                    const option = document.createElement('option');
-                    option.value = color;
-                    option.textContent = color;
-                    colorFilter.appendChild(option);
-                });
-            }
+        // Keep the "all" placeholder option, rebuild the rest
+        while (select.options.length > 1) {
+            select.remove(1);
+        }
 
-            // Populate condition filter
-            const conditionFilter = document.getElementById('conditionFilter');
-            if (conditionFilter && filters.conditions) {
-                filters.conditions.forEach(condition => {
-                    const option = document.createElement('option');
-                    option.value = condition;
-                    option.textContent = condition;
-                    conditionFilter.appendChild(option);
-                });
-            }
-        })
-        .catch(err => console.error('Error loading filters:', err));
+        values.forEach(value => {
+            const option = document.createElement('option');
+            option.value = value;
+            option.textContent = `${value} (${counts[value] || 0})`;
+            select.appendChild(option);
+        });
+        select.value = selected;
+    });
 }
 
-function loadProducts() {
-    fetch('/shop/products')
+function buildProductsQuery() {
+    const params = new URLSearchParams();
+    Object.entries(PRODUCT_FILTERS).forEach(([name, elementId]) => {
+        const element = document.getElementById(elementId);
+        const value = element ? element.value.trim() : '';
+        if (value) params.set(name, value);
+    });
+    return params;
+}
+
+function loadProducts(append = false) {
+    const params = buildProductsQuery();
+    if (append && nextProductsCursor) {
+        params.set('cursor', nextProductsCursor);
+    }
+
+    // Ignore responses to requests superseded by a newer one
+    const requestId = ++productsRequestId;
+
+    // 'no-cache' revalidates with ETag/Last-Modified instead of redownloading
+
+    fetch(`/shop/products?${params.toString()}`, {cache: 'no-cache'})
         .then(res => res.json())
-        .then(products => {
-            allProducts = products;
-            productsData = products;
-            displayProducts(products);
+        .then(page => {
+            if (requestId !== productsRequestId) return;
+            showProductsPage(page, append);
         })
         .catch(err => {
             console.error('Error loading products:', err);
@@ -112,6 +141,21 @@ function loadProducts() {
         });
 }
 
+function showProductsPage(page, append) {
+    productsData = append ? productsData.concat(page.items) : page.items;
+    allProducts = productsData;
+    nextProductsCursor = page.next_cursor;
+    displayProducts(productsData);
+    updateLoadMoreButton();
+}
+
+function updateLoadMoreButton() {
+    const loadMoreBtn = document.getElementById('loadMoreBtn');
+    if (loadMoreBtn) {
+        loadMoreBtn.style.display = nextProductsCursor ? 'inline-block' : 'none';
+    }
+}
+
 function displayProducts(products) {
     const grid = document.getElementById('productsGrid');
     
@@ -156,47 +200,42 @@ function displayProducts(products) {
     grid.innerHTML = html;
 }
 
-function filterProducts() {
-    const searchTerm = document.getElementById('searchInput').value.toLowerCase();
-    const category = document.getElementById('categoryFilter').value;
-    const destination = document.getElementById('destinationFilter').value;
-    const size = document.getElementById('sizeFilter').value;
-    const ageRange = document.getElementById('ageRangeFilter').value;
-    const color = document.getElementById('colorFilter').value;
-    const condition = document.getElementById('conditionFilter').value;
-
-    const filtered = allProducts.filter(product => {
-        const matchesSearch = !searchTerm ||
-            product.title.toLowerCase().includes(searchTerm) ||
-            (product.description && product.description.toLowerCase().includes(searchTerm));
-
-        const matchesCategory = !category || product.category === category;
-        const matchesDestination = !destination || product.destination === destination;
-        const matchesSize = !size || product.size === size;
-        const matchesAgeRange = !ageRange || product.age_range === ageRange;
-        const matchesColor = !color || product.color === color;
-        const matchesCondition = !condition || product.condition === condition;
-
-        return matchesSearch && matchesCategory && matchesDestination &&
-               matchesSize && matchesAgeRange && matchesColor && matchesCondition;
+// Lower (or raise) the shown stock of loaded products after cart changes,
+// keeping every page loaded so far
+function adjustProductStock(changes) {
+    let changed = false;
+    productsData.forEach(product => {
+        const delta = changes[product.id];
+        if (delta) {
+            product.stock = Math.max(product.stock - delta, 0);
+            changed = true;
+        }
     });
+    if (changed) displayProducts(productsData);
+}
+
+function filterProducts() {
+    // Filtering happens server-side: restart from the first page
+    nextProductsCursor = null;
+    loadProducts();
+    loadFilters();
+}
 
-    displayProducts(filtered);
+// Rental dates chosen in the catalog, checked against bookings on add
+function selectedRentalPeriod() {
+    const start = document.getElementById('startDateFilter');
+    const end = document.getElementById('endDateFilter');
+    if (!start || !end || !start.value || !end.value) return {};
+    return {start_date: start.value, end_date: end.value};
 }
 
 function addToCart(itemId) {
-    fetch('/shop/cart/add', {
-        method: 'POST',
-        headers: {'Content-Type': 'application/json'},
-        body: JSON.stringify({item_id: itemId})
-    })
-    .then(res => res.json())
+    // Batched with other quick cart changes (main.js); the batch response
+    // refreshes the badge and the stock of the loaded products
+    queueCartOperation({op: 'add', item_id: itemId})
     .then(data => {
         if (data.success) {
-            updateCartBadge();
             showNotification('Articolo aggiunto al carrello!', 'success');
-            // Reload products to update available stock
-            loadProducts();
         } else {
             showNotification(data.message || 'Impossibile aggiungere l\'articolo al carrello', 'error');
         }
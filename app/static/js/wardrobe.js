@@ -1,11 +1,12 @@
 // Wardrobe management functionality
 
 document.addEventListener('DOMContentLoaded', function() {
-    loadWardrobeItems();
+    fromBootstrap('wardrobe', displayWardrobeItems, loadWardrobeItems);
 });
 
 function loadWardrobeItems() {
-    fetch('/wardrobe/')
+    // Revalidate with ETag/Last-Modified instead of redownloading
+    fetch('/wardrobe/', {cache: 'no-cache'})
         .then(res => res.json())
         .then(items => {
             displayWardrobeItems(items);
@@ -142,7 +143,7 @@ function escapeHtml(text) {
 
 function showEditModal(itemId) {
     // Fetch item data
-    fetch('/wardrobe/')
+    fetch('/wardrobe/', {cache: 'no-cache'})
         .then(res => res.json())
         .then(items => {
             const item = items.find(i => i.id === itemId);
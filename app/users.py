@@ -0,0 +1,213 @@
+"""
+Current user for Stycly
+The logged-in user is loaded at most once per request into g.current_user,
+optionally from a short per-process TTL cache. Activity timestamps (last
+login, last item insert) are buffered in memory and written to the users
+table in batches by the worker instead of once per request.
+"""
+
+import atexit
+import threading
+import time
+from collections import namedtuple
+from datetime import datetime
+from flask import current_app, g, session
+from sqlalchemy import bindparam, event, or_, select, update
+from app import db
+from app.models import User
+from app.cache import TTLCache
+
+# Read-only snapshot of the logged-in user (safe to share across requests)
+CurrentUser = namedtuple('CurrentUser', [
+    'id', 'name', 'email', 'is_active', 'is_admin', 'last_login_at', 'last_item_insert_at'
+])
+
+# User columns that take buffered activity timestamps
+ACTIVITY_FIELDS = ('last_login_at', 'last_item_insert_at')
+
+user_cache = TTLCache()
+
+
+class ActivityBuffer:
+    """Latest pending activity timestamp per (user id, field), in this process"""
+
+    def __init__(self):
+        self._pending = {}
+        self._lock = threading.Lock()
+        self.last_flush = time.monotonic()
+
+    def touch(self, user_id, field, when):
+        with self._lock:
+            key = (user_id, field)
+            if key not in self._pending or self._pending[key] < when:
+                self._pending[key] = when
+
+    def pending(self, user_id, field):
+        """Timestamp not written yet, or None"""
+        with self._lock:
+            return self._pending.get((user_id, field))
+
+    def discard(self, user_id, field=None):
+        """Drop pending timestamps of a user (one field, or all)"""
+        with self._lock:
+            for key in [key for key in self._pending if key[0] == user_id and field in (None, key[1])]:
+                del self._pending[key]
+
+    def take(self):
+        """Remove and return everything pending"""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self.last_flush = time.monotonic()
+        return pending
+
+    def restore(self, pending):
+        """Put back timestamps whose write failed"""
+        for (user_id, field), when in pending.items():
+            self.touch(user_id, field, when)
+
+
+activity_buffer = ActivityBuffer()
+
+
+def _snapshot(user_id):
+    row = db.session.execute(
+        select(User.id, User.name, User.email, User.is_active, User.is_admin,
+               User.last_login_at, User.last_item_insert_at)
+        .where(User.id == user_id)
+    ).first()
+    return CurrentUser(*row) if row else None
+
+
+def current_user():
+    """
+    Logged-in user as a CurrentUser, or None
+
+    Loaded once per request into g.current_user; with USER_CACHE_TTL > 0
+    also reused across requests of this process for that many seconds.
+    Activity timestamps include values not flushed yet.
+    """
+    if 'current_user' in g:
+        return g.current_user
+
+    user_id = session.get('user_id')
+    user = None
+    if user_id is not None:
+        ttl = current_app.config.get('USER_CACHE_TTL', 0)
+        user = user_cache.get(user_id) if ttl else None
+        if user is None:
+            user = _snapshot(user_id)
+            if user is not None and ttl:
+                user_cache.set(user_id, user, ttl)
+
+    if user is not None:
+        updates = {}
+        for field in ACTIVITY_FIELDS:
+            pending = activity_buffer.pending(user.id, field)
+            if pending and (getattr(user, field) is None or getattr(user, field) < pending):
+                updates[field] = pending
+        if updates:
+            user = user._replace(**updates)
+
+    g.current_user = user
+    return user
+
+
+def forget_user(user_id):
+    """Drop a user from the cache after a change made without the ORM"""
+    user_cache.pop(user_id)
+    g.pop('current_user', None)
+
+
+def record_activity(user_id, field, when=None):
+    """Buffer an activity timestamp (written by the next flush)"""
+    activity_buffer.touch(user_id, field, when or datetime.utcnow())
+    g.pop('current_user', None)
+
+
+def flush_activity():
+    """
+    Write buffered activity timestamps, one executemany per field
+
+    Uses its own connection, so it never commits a request's session.
+    Timestamps never move backwards.
+
+    Returns:
+        int: number of written timestamps
+    """
+    pending = activity_buffer.take()
+    if not pending:
+        return 0
+
+    by_field = {}
+    for (user_id, field), when in pending.items():
+        by_field.setdefault(field, []).append({'uid': user_id, 'ts': when})
+
+    users = User.__table__
+    try:
+        with db.engine.begin() as conn:
+            for field, params in by_field.items():
+                column = users.c[field]
+                conn.execute(
+                    update(users)
+                    .where(users.c.id == bindparam('uid'), or_(column.is_(None), column < bindparam('ts')))
+                    .values({field: bindparam('ts')}),
+                    params
+                )
+    except Exception:
+        activity_buffer.restore(pending)
+        raise
+
+    for user_id in {user_id for user_id, _ in pending}:
+        user_cache.pop(user_id)
+    return len(pending)
+
+
+def init_users(app):
+    """Flush buffered timestamps periodically and at process exit"""
+    def flush_at_exit():
+        with app.app_context():
+            try:
+                flush_activity()
+            except Exception as e:
+                app.logger.error(f'Activity flush at exit failed: {str(e)}')
+
+    atexit.register(flush_at_exit)
+
+    if app.config.get('OUTBOX_WORKER_THREAD'):
+        # The in-process worker flushes every ACTIVITY_FLUSH_INTERVAL
+        return
+
+    @app.after_request
+    def _flush_due_activity(response):
+        # Without the worker thread, the first request after each interval flushes
+        if time.monotonic() - activity_buffer.last_flush >= app.config.get('ACTIVITY_FLUSH_INTERVAL', 30):
+            try:
+                flush_activity()
+            except Exception as e:
+                app.logger.error(f'Activity flush failed: {str(e)}')
+        return response
+
+
+def _collect_changed_users(session, flush_context):
+    changed = {obj.id for obj in list(session.new) + list(session.dirty) + list(session.deleted)
+               if isinstance(obj, User)}
+    if changed:
+        session.info.setdefault('changed_users', set()).update(changed)
+
+
+def _forget_changed_users(session):
+    """Committed user changes invalidate the cached snapshots"""
+    changed = session.info.pop('changed_users', ())
+    for user_id in changed:
+        user_cache.pop(user_id)
+    if changed:
+        g.pop('current_user', None)
+
+
+def _discard_changed_users(session):
+    session.info.pop('changed_users', None)
+
+
+event.listen(db.session, 'after_flush', _collect_changed_users)
+event.listen(db.session, 'after_commit', _forget_changed_users)
+event.listen(db.session, 'after_rollback', _discard_changed_users)
@@ -2,12 +2,10 @@
 Utility functions for Stycly
 """
 
-import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
+import hashlib
 from functools import wraps
-from flask import session, redirect, url_for, flash, current_app
-from datetime import datetime
+from flask import session, redirect, url_for, flash, current_app, request, Response, jsonify
+from datetime import datetime, timezone
 
 def login_required(f):
     """Decorator to require login for routes"""
@@ -20,66 +18,90 @@ def login_required(f):
     return decorated_function
 
 
-def send_email(to_email, subject, html_body, plain_body=None):
+def admin_required(f):
+    """Decorator to require an admin account for JSON API routes"""
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        from app.users import current_user
+
+        if session.get('user_id') is None:
+            return jsonify({'success': False, 'message': 'Login required'}), 401
+        user = current_user()
+        if user is None or not user.is_admin:
+            return jsonify({'success': False, 'message': 'Admin access required'}), 403
+        return f(*args, **kwargs)
+    return decorated_function
+
+
+def make_etag(*parts):
+    """Build a strong ETag value from the parts that determine a response"""
+    return hashlib.sha1('|'.join(str(part) for part in parts).encode('utf-8')).hexdigest()
+
+
+def _http_date(value):
+    """Naive UTC datetime -> aware datetime truncated to HTTP date precision"""
+    return value.replace(tzinfo=timezone.utc, microsecond=0)
+
+
+def not_modified(etag, last_modified=None):
     """
-    Send email using SMTP
-    
+    Answer a conditional GET without building the response body
+
+    Args:
+        etag: current strong ETag of the resource
+        last_modified: naive UTC datetime of the last change (optional)
+
+    Returns:
+        Response: a 304 response if the client's copy is current, else None
+    """
+    if request.if_none_match:
+        # If-None-Match takes precedence over If-Modified-Since
+        fresh = request.if_none_match.contains(etag)
+    elif last_modified and request.if_modified_since:
+        fresh = _http_date(last_modified) <= request.if_modified_since
+    else:
+        fresh = False
+
+    if not fresh:
+        return None
+
+    return add_cache_validators(Response(status=304), etag, last_modified)
+
+
+def add_cache_validators(response, etag, last_modified=None):
+    """Set ETag/Last-Modified and make clients revalidate before reuse"""
+    response.set_etag(etag)
+    if last_modified:
+        response.last_modified = _http_date(last_modified)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+def send_email(to_email, subject, html_body, plain_body=None, kind='generic'):
+    """
+    Queue an email in the outbox
+
+    It is added to the current transaction and delivered by the background
+    worker once the caller commits (see app.outbox).
+
     Args:
         to_email: recipient email address
         subject: email subject
         html_body: HTML content of email
-        plain_body: plain text version (optional, will use html_body if not provided)
-    
+        plain_body: plain text version (optional)
+        kind: short label of the email type, kept for monitoring
+
     Returns:
-        bool: True if email sent successfully, False otherwise
+        EmailOutbox: the queued entry
     """
-    try:
-        # Get email configuration from Flask app config
-        mail_server = current_app.config.get('MAIL_SERVER')
-        mail_port = current_app.config.get('MAIL_PORT')
-        mail_use_tls = current_app.config.get('MAIL_USE_TLS')
-        mail_username = current_app.config.get('MAIL_USERNAME')
-        mail_password = current_app.config.get('MAIL_PASSWORD')
-        mail_sender = current_app.config.get('MAIL_DEFAULT_SENDER')
-        
-        # Check if email is configured
-        if not all([mail_server, mail_username, mail_password]):
-            current_app.logger.warning('Email not configured. Email would be sent to: ' + to_email)
-            current_app.logger.info(f'Subject: {subject}')
-            current_app.logger.info(f'Body: {html_body}')
-            return True  # Return True in development even if not configured
-        
-        # Create message
-        msg = MIMEMultipart('alternative')
-        msg['Subject'] = subject
-        msg['From'] = mail_sender
-        msg['To'] = to_email
-        
-        # Attach plain text and HTML versions
-        if plain_body:
-            part1 = MIMEText(plain_body, 'plain')
-            msg.attach(part1)
-        
-        part2 = MIMEText(html_body, 'html')
-        msg.attach(part2)
-        
-        # Send email
-        with smtplib.SMTP(mail_server, mail_port) as server:
-            if mail_use_tls:
-                server.starttls()
-            server.login(mail_username, mail_password)
-            server.send_message(msg)
-        
-        return True
-    
-    except Exception as e:
-        current_app.logger.error(f'Error sending email: {str(e)}')
-        return False
+    from app.outbox import queue_email
+    return queue_email(kind, to_email, subject, html_body, plain_body)
 
 
 def send_order_confirmation_email(order):
-    """Send order confirmation email to customer"""
+    """Send order confirmation email to customer (order loaded with Order.get_with_items)"""
     subject = f'Stycly - Rental Request Confirmation #{order.id}'
+    total_days = order.get_total_days()
     
     html_body = f"""
     <!DOCTYPE html>
@@ -108,14 +130,12 @@ def send_order_confirmation_email(order):
                 
                 <h3>Order Details:</h3>
                 <p><strong>Order ID:</strong> #{order.id}</p>
-                <p><strong>Rental Period:</strong> {order.start_date.strftime('%B %d, %Y')} - {order.end_date.strftime('%B %d, %Y')} ({order.get_total_days()} days)</p>
+                <p><strong>Rental Period:</strong> {order.start_date.strftime('%B %d, %Y')} - {order.end_date.strftime('%B %d, %Y')} ({total_days} days)</p>
                 <p><strong>Email:</strong> {order.email}</p>
                 <p><strong>Phone:</strong> {order.phone or 'Not provided'}</p>
                 
                 <h3>Items Requested:</h3>
-                {''.join([f'<div class="item"><strong>{item.item.title}</strong><br>Quantity: {item.quantity} | Daily Price: €{item.daily_price:.2f}</div>' for item in order.items])}
-                
-                <p><strong>Estimated Total:</strong> €{order.get_total_price():.2f}</p>
+                {''.join([f'<div class="item"><strong>{item.item.title}</strong><br>Quantity: {item.quantity}</div>' for item in order.items])}
                 
                 {f'<p><strong>Notes:</strong> {order.notes}</p>' if order.notes else ''}
                 
@@ -130,12 +150,13 @@ def send_order_confirmation_email(order):
     </html>
     """
     
-    return send_email(order.email, subject, html_body)
+    return send_email(order.email, subject, html_body, kind='order_confirmation')
 
 
 def send_order_notification_email(order):
-    """Send order notification to internal orders email"""
+    """Send order notification to internal orders email (order loaded with Order.get_with_items)"""
     subject = f'New Rental Request #{order.id} - {order.name}'
+    total_days = order.get_total_days()
     
     html_body = f"""
     <!DOCTYPE html>
@@ -172,16 +193,11 @@ def send_order_notification_email(order):
                 <table>
                     <tr><td><strong>Start Date:</strong></td><td>{order.start_date.strftime('%B %d, %Y')}</td></tr>
                     <tr><td><strong>End Date:</strong></td><td>{order.end_date.strftime('%B %d, %Y')}</td></tr>
-                    <tr><td><strong>Total Days:</strong></td><td>{order.get_total_days()} days</td></tr>
+                    <tr><td><strong>Total Days:</strong></td><td>{total_days} days</td></tr>
                 </table>
                 
                 <h3>Items Requested:</h3>
-                {''.join([f'<div class="item"><strong>{item.item.title}</strong> (ID: {item.wardrobe_item_id})<br>Size: {item.item.size} | Age: {item.item.age_range}<br>Quantity: {item.quantity} | Daily Price: €{item.daily_price:.2f} | Subtotal: €{item.daily_price * item.quantity * order.get_total_days():.2f}</div>' for item in order.items])}
-                
-                <h3>Pricing Summary:</h3>
-                <table>
-                    <tr><td><strong>Estimated Total:</strong></td><td><strong>€{order.get_total_price():.2f}</strong></td></tr>
-                </table>
+                {''.join([f'<div class="item"><strong>{item.item.title}</strong> (ID: {item.wardrobe_item_id})<br>Size: {item.item.size} | Age: {item.item.age_range}<br>Quantity: {item.quantity}</div>' for item in order.items])}
                 
                 {f'<h3>Customer Notes:</h3><p>{order.notes}</p>' if order.notes else ''}
                 
@@ -193,12 +209,80 @@ def send_order_notification_email(order):
     """
     
     orders_email = current_app.config.get('ORDERS_EMAIL')
-    return send_email(orders_email, subject, html_body)
+    return send_email(orders_email, subject, html_body, kind='order_notification')
+
+
+def send_order_digest_email(orders):
+    """
+    Send one summary of several new orders to the internal orders email
+
+    Args:
+        orders: list of dicts with the order fields and an 'items' list
+            of dicts (wardrobe_item_id, title, size, age_range, quantity),
+            as built by app.notifications.pending_notifications
+    """
+    subject = f'New Rental Requests Digest - {len(orders)} order(s), #{orders[0]["id"]} to #{orders[-1]["id"]}'
+
+    rows = []
+    for order in orders:
+        days = (order['end_date'] - order['start_date']).days + 1
+        items = '<br>'.join(
+            f'{item["title"]} (ID: {item["wardrobe_item_id"]}) - Size: {item["size"]} | Qty: {item["quantity"]}'
+            for item in order['items']
+        )
+        rows.append(f"""
+                    <tr>
+                        <td>#{order['id']}<br><small>{order['created_at'].strftime('%d/%m %H:%M')}</small></td>
+                        <td>{order['name']}<br><small>{order['email']} · {order['phone'] or 'Not provided'}</small></td>
+                        <td>{order['start_date'].strftime('%B %d, %Y')} - {order['end_date'].strftime('%B %d, %Y')}<br><small>{days} days</small></td>
+                        <td>{items}{f"<br><em>{order['notes']}</em>" if order['notes'] else ''}</td>
+                    </tr>""")
+
+    html_body = f"""
+    <!DOCTYPE html>
+    <html>
+    <head>
+        <style>
+            body {{ font-family: 'Poppins', Arial, sans-serif; line-height: 1.6; color: #3A4C69; }}
+            .container {{ max-width: 900px; margin: 0 auto; padding: 20px; }}
+            .header {{ background: #7DB2E0; color: white; padding: 20px; border-radius: 8px 8px 0 0; }}
+            .content {{ background: #F2F4F7; padding: 30px; }}
+            table {{ width: 100%; border-collapse: collapse; margin: 20px 0; background: white; }}
+            th, td {{ padding: 12px; text-align: left; border-bottom: 1px solid #ddd; vertical-align: top; }}
+            th {{ background: #3A4C69; color: white; }}
+        </style>
+    </head>
+    <body>
+        <div class="container">
+            <div class="header">
+                <h1>🎉 {len(orders)} New Rental Requests</h1>
+            </div>
+            <div class="content">
+                <table>
+                    <tr><th>Order</th><th>Customer</th><th>Rental Period</th><th>Items</th></tr>
+                    {''.join(rows)}
+                </table>
+
+                <p><em>Please review these requests and contact the customers within 24 hours.</em></p>
+            </div>
+        </div>
+    </body>
+    </html>
+    """
+
+    orders_email = current_app.config.get('ORDERS_EMAIL')
+    return send_email(orders_email, subject, html_body, kind='order_digest')
 
 
 def send_password_reset_email(user, reset_url):
     """Send password reset email"""
     subject = 'Stycly - Password Reset Request'
+    minutes = current_app.config.get('PASSWORD_RESET_TTL_MINUTES', 60)
+    if minutes % 60 == 0:
+        hours = minutes // 60
+        lifetime = f'{hours} hour' if hours == 1 else f'{hours} hours'
+    else:
+        lifetime = f'{minutes} minute' if minutes == 1 else f'{minutes} minutes'
     
     html_body = f"""
     <!DOCTYPE html>
@@ -226,7 +310,7 @@ def send_password_reset_email(user, reset_url):
                 
                 <a href="{reset_url}" class="button">Reset Password</a>
                 
-                <p>This link will expire in 1 hour.</p>
+                <p>This link will expire in {lifetime}.</p>
                 
                 <p>If you didn't request a password reset, you can safely ignore this email.</p>
                 
@@ -239,7 +323,7 @@ def send_password_reset_email(user, reset_url):
     </html>
     """
     
-    return send_email(user.email, subject, html_body)
+    return send_email(user.email, subject, html_body, kind='password_reset')
 
 
 def allowed_file(filename):
@@ -0,0 +1,120 @@
+"""
+Background worker for Stycly
+Runs periodic maintenance tasks (order digest, email outbox delivery,
+related-list refreshes, user activity timestamps, cleanup of abandoned carts, expired sessions,
+rate limit buckets and reset tokens), either as a dedicated `flask worker` process or
+as a daemon thread inside each web process
+"""
+
+import os
+import threading
+import time
+
+# Set when new emails are committed, so the outbox is drained right away
+_wakeup = threading.Event()
+
+_thread_lock = threading.Lock()
+_thread_pid = None
+
+
+class PeriodicTask:
+    """A function run every `interval` seconds inside an app context"""
+
+    def __init__(self, name, interval, func, run_on_wake=False):
+        self.name = name
+        self.interval = interval
+        self.func = func
+        self.run_on_wake = run_on_wake
+        self.next_run = 0.0
+
+
+def build_tasks(app):
+    """Tasks run by the worker"""
+    from app.outbox import drain_outbox
+    from app.cart import sweep_carts
+    from app.notifications import send_order_digest
+    from app.related import refresh_queued
+    from app.ratelimit import prune_buckets
+    from app.reset_tokens import prune_reset_tokens_task
+    from app.users import flush_activity
+    from app.sessions import prune_sessions
+
+    return [
+        # The digest runs first so a due digest goes out in the same pass
+        PeriodicTask('order-digest', 60, send_order_digest, run_on_wake=True),
+        PeriodicTask('email-outbox', app.config.get('EMAIL_OUTBOX_INTERVAL', 10), drain_outbox, run_on_wake=True),
+        PeriodicTask('related-refresh', app.config.get('RELATED_REFRESH_INTERVAL', 10), refresh_queued,
+                     run_on_wake=True),
+        PeriodicTask('activity-flush', app.config.get('ACTIVITY_FLUSH_INTERVAL', 30), flush_activity),
+        PeriodicTask('cart-sweep', 3600, sweep_carts),
+        PeriodicTask('session-prune', 3600, prune_sessions),
+        PeriodicTask('rate-limit-prune', 3600, prune_buckets),
+        PeriodicTask('reset-token-prune', 3600, prune_reset_tokens_task),
+    ]
+
+
+def wake():
+    """Ask the worker to run its on-wake tasks (digest, outbox, related lists) now"""
+    _wakeup.set()
+
+
+def run_tasks(app, tasks, now=None):
+    """Run every task that is due and schedule its next run"""
+    now = time.monotonic() if now is None else now
+    for task in tasks:
+        if task.next_run > now:
+            continue
+        with app.app_context():
+            try:
+                task.func()
+            except Exception as e:
+                app.logger.error(f'Worker task {task.name} failed: {str(e)}')
+        task.next_run = time.monotonic() + task.interval
+
+
+def run_worker(app, stop=None):
+    """
+    Run the periodic tasks until `stop` is set
+
+    Args:
+        app: Flask application
+        stop: threading.Event that ends the loop (runs forever if None)
+    """
+    stop = stop or threading.Event()
+    tasks = build_tasks(app)
+
+    while not stop.is_set():
+        run_tasks(app, tasks)
+
+        timeout = max(min(task.next_run for task in tasks) - time.monotonic(), 0)
+        if _wakeup.wait(timeout):
+            _wakeup.clear()
+            for task in tasks:
+                if task.run_on_wake:
+                    task.next_run = 0.0
+
+
+def start_worker_thread(app):
+    """Start the worker as a daemon thread, once per process"""
+    global _thread_pid
+
+    # Checked against the pid so that forked web workers start their own
+    if _thread_pid == os.getpid():
+        return
+    with _thread_lock:
+        if _thread_pid == os.getpid():
+            return
+        _thread_pid = os.getpid()
+
+    thread = threading.Thread(target=run_worker, args=(app,), name='stycly-worker', daemon=True)
+    thread.start()
+
+
+def init_worker(app):
+    """Start the in-process worker with the first request, if enabled"""
+    if not app.config.get('OUTBOX_WORKER_THREAD'):
+        return
+
+    @app.before_request
+    def _ensure_worker():
+        start_worker_thread(app)
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Export Memory Benchmark
+Seeds a throwaway SQLite database with two wardrobe sizes and compares the
+peak Python memory of the streaming export (app/export.py) with loading
+every row before writing, as the legacy pandas export did. The streaming
+peak should stay flat as the table grows.
+
+Usage:
+    python benchmark_export.py [item_count]
+"""
+
+import os
+import sys
+import tempfile
+import tracemalloc
+from datetime import datetime, timedelta
+
+DEFAULT_ITEM_COUNT = 100_000
+
+
+def seed(db, first_id, count):
+    """Insert count items starting at first_id"""
+    from app.models import WardrobeItem
+
+    now = datetime.utcnow()
+    for start in range(first_id, first_id + count, 10_000):
+        db.session.execute(db.insert(WardrobeItem), [
+            {
+                'id': i,
+                'user_id': 1,
+                'title': f'Capo {i}',
+                'description': 'Descrizione di prova con qualche parola in più',
+                'destination': 'Bambina',
+                'category': 'Vestiti',
+                'size': 'M (4-5A)',
+                'color': 'Rosa',
+                'condition': 'Like New',
+                'stock': 1,
+                'is_public_for_rent': True,
+                'created_at': now - timedelta(minutes=i),
+                'updated_at': now - timedelta(minutes=i),
+            }
+            for i in range(start, min(start + 10_000, first_id + count))
+        ])
+    db.session.commit()
+
+
+def peak_memory(run):
+    """Peak traced allocation of run() in MB, with the bytes it produced"""
+    tracemalloc.start()
+    size = run()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak / 1024 / 1024, size
+
+
+def streaming(fmt):
+    from app.export import stream_export
+    return lambda: sum(len(chunk) for chunk in stream_export('wardrobe-items', fmt))
+
+
+def load_all(fmt):
+    """Fetch every row, then encode (the shape of the legacy export)"""
+    from app import db
+    from app.export import export_statement, _csv_chunk, _ndjson_chunk, EXPORTS
+
+    def run():
+        rows = db.session.execute(export_statement('wardrobe-items')).all()
+        keys = [column.key for column in EXPORTS['wardrobe-items']]
+        body = _csv_chunk([keys]) + _csv_chunk(rows) if fmt == 'csv' else _ndjson_chunk(keys, rows)
+        return len(body)
+    return run
+
+
+def main():
+    item_count = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_ITEM_COUNT
+
+    tmpdir = tempfile.mkdtemp()
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(tmpdir, 'benchmark.db')}"
+    os.environ['OUTBOX_WORKER_THREAD'] = 'False'
+
+    from app import create_app, db
+    from app.models import User
+
+    app = create_app()
+    with app.app_context():
+        db.session.add(User(id=1, name='Benchmark', email='benchmark@example.com', password_hash='x'))
+        db.session.commit()
+
+        seeded = 0
+        for total in (item_count // 10, item_count):
+            seed(db, seeded + 1, total - seeded)
+            seeded = total
+            print(f'\n{total} items')
+            for fmt in ('csv', 'ndjson'):
+                for label, run in (('streaming', streaming(fmt)), ('load all', load_all(fmt))):
+                    peak, size = peak_memory(run)
+                    db.session.remove()
+                    print(f'  {fmt:<7} {label:<10} {size / 1024 / 1024:8.1f} MB written, peak {peak:7.1f} MB')
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+Password Hashing Benchmark
+Measures logins/second (password verifications) for each hash method and
+cost setting in app/passwords.py, with every client thread hashing on its
+own (unbounded) and through the bounded hashing pool. A light request
+thread runs alongside and reports its p95 latency, showing how much the
+hashing load slows down everything else in the process.
+
+Usage:
+    python benchmark_passwords.py [seconds_per_run] [client_threads]
+"""
+
+import sys
+import threading
+import time
+
+DEFAULT_SECONDS = 3
+DEFAULT_CLIENTS = 8
+POOL_WORKERS = 2
+
+METHODS = [
+    'pbkdf2:sha256:260000',
+    'pbkdf2:sha256:600000',
+    'scrypt:16384:8:1',
+    'scrypt:32768:8:1',
+    'argon2:2:19456:1',
+    'argon2:3:65536:4',
+]
+
+
+def light_request_latency(stop, samples):
+    """Simulate a cheap request every 10 ms and record how long it took"""
+    while not stop.is_set():
+        start = time.perf_counter()
+        sum(i * i for i in range(2000))
+        samples.append(time.perf_counter() - start)
+        time.sleep(0.01)
+
+
+def run(hasher, password_hash, seconds, clients):
+    """Logins per second and p95 light request latency (ms) under load"""
+    stop = threading.Event()
+    counts = [0] * clients
+    samples = []
+
+    def client(index):
+        while not stop.is_set():
+            assert hasher.verify(password_hash, 'correct horse battery staple')
+            counts[index] += 1
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(clients)]
+    threads.append(threading.Thread(target=light_request_latency, args=(stop, samples)))
+    for thread in threads:
+        thread.start()
+    time.sleep(seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+
+    samples.sort()
+    p95 = samples[int(len(samples) * 0.95)] * 1000 if samples else float('nan')
+    return sum(counts) / seconds, p95
+
+
+def main():
+    from app.passwords import PasswordHasher
+
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_SECONDS
+    clients = int(sys.argv[2]) if len(sys.argv) > 2 else DEFAULT_CLIENTS
+
+    print(f'{clients} client threads, {POOL_WORKERS} pool workers, {seconds:g}s per run\n')
+    print(f'{"method":<24} {"hash ms":>8} {"unbounded/s":>12} {"p95 ms":>8} {"pool/s":>8} {"p95 ms":>8}')
+
+    for method in METHODS:
+        try:
+            inline = PasswordHasher(method, workers=0)
+        except ValueError as e:
+            print(f'{method:<24} skipped: {e}')
+            continue
+
+        start = time.perf_counter()
+        password_hash = inline.hash('correct horse battery staple')
+        hash_ms = (time.perf_counter() - start) * 1000
+
+        pooled = PasswordHasher(method, workers=POOL_WORKERS, queue_size=clients)
+        unbounded_rate, unbounded_p95 = run(inline, password_hash, seconds, clients)
+        pool_rate, pool_p95 = run(pooled, password_hash, seconds, clients)
+        print(f'{method:<24} {hash_ms:8.1f} {unbounded_rate:12.1f} {unbounded_p95:8.2f} '
+              f'{pool_rate:8.1f} {pool_p95:8.2f}')
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+Serialization Benchmark
+Seeds a throwaway SQLite database with a large wardrobe and compares the
+rows/second of the ORM serialization path (WardrobeItem objects, per-item
+image lists, strftime, jsonify) with the column-projected serializers in
+app/serializers.py.
+
+Usage:
+    python benchmark_serializers.py [item_count]
+"""
+
+import os
+import sys
+import time
+import tempfile
+from datetime import datetime, timedelta
+
+DEFAULT_ITEM_COUNT = 20_000
+ROUNDS = 5
+
+
+def seed(db, item_count):
+    """Insert one user with item_count items and two images per item"""
+    from app.models import User, WardrobeItem, WardrobeImage
+
+    now = datetime.utcnow()
+    db.session.execute(db.insert(User), [
+        {'id': 1, 'name': 'Benchmark', 'email': 'benchmark@example.com', 'password_hash': 'x'}
+    ])
+    db.session.execute(db.insert(WardrobeItem), [
+        {
+            'id': i,
+            'user_id': 1,
+            'title': f'Capo {i}',
+            'description': 'Descrizione di prova con qualche parola in più',
+            'destination': 'Bambina',
+            'category': 'Vestiti',
+            'size': 'M (4-5A)',
+            'age_range': '4-5 anni',
+            'color': 'Rosa',
+            'condition': 'Like New',
+            'stock': 1,
+            'is_public_for_rent': True,
+            'created_at': now - timedelta(minutes=i),
+            'updated_at': now - timedelta(minutes=i),
+        }
+        for i in range(1, item_count + 1)
+    ])
+    db.session.execute(db.insert(WardrobeImage), [
+        {'item_id': i, 'position': position, 'variant': 'original', 'path': f'uploads/{i}_{position}.jpg'}
+        for i in range(1, item_count + 1)
+        for position in range(2)
+    ])
+    db.session.commit()
+
+
+def orm_path(db):
+    """Previous wardrobe.index serialization: ORM objects and jsonify"""
+    from flask import jsonify
+    from sqlalchemy.orm import selectinload
+    from app.models import WardrobeItem
+
+    items = WardrobeItem.query.filter_by(user_id=1).options(
+        selectinload(WardrobeItem.images)
+    ).order_by(WardrobeItem.created_at.desc()).all()
+
+    items_data = [{
+        'id': item.id,
+        'title': item.title,
+        'description': item.description,
+        'destination': item.destination,
+        'category': item.category,
+        'size': item.size,
+        'age_range': item.age_range,
+        'color': item.color,
+        'condition': item.condition,
+        'stock': item.stock,
+        'is_public_for_rent': item.is_public_for_rent,
+        'image_paths': item.get_image_paths(),
+        'created_at': item.created_at.strftime('%Y-%m-%d %H:%M') if item.created_at else None,
+        'updated_at': item.updated_at.strftime('%Y-%m-%d %H:%M') if item.updated_at else None
+    } for item in items]
+
+    body = jsonify(items_data).get_data()
+    db.session.expunge_all()
+    return len(items_data), len(body)
+
+
+def projected_path(db):
+    """Current wardrobe.index serialization: projected rows and dumps"""
+    from app.serializers import json_response, serialize_wardrobe, wardrobe_rows
+
+    items_data = serialize_wardrobe(wardrobe_rows(1))
+    body = json_response(items_data).get_data()
+    return len(items_data), len(body)
+
+
+def measure(app, db, name, run):
+    """Best-of-ROUNDS timing of one serialization path"""
+    best = None
+    with app.test_request_context():
+        for _ in range(ROUNDS):
+            start = time.perf_counter()
+            rows, size = run(db)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+
+    print(f'{name:<12} {rows:>8} rows  {size / 1024:>9.0f} KiB  '
+          f'{best * 1000:>8.1f} ms  {rows / best:>10.0f} rows/s')
+    return best
+
+
+def main():
+    item_count = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_ITEM_COUNT
+
+    tmpdir = tempfile.mkdtemp()
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(tmpdir, 'benchmark.db')}"
+
+    from app import create_app, db
+    from app.serializers import orjson
+
+    app = create_app()
+    with app.app_context():
+        print(f'Seeding {item_count} items...')
+        seed(db, item_count)
+
+        print(f"JSON encoder: {'orjson' if orjson else 'json (orjson not installed)'}")
+        orm = measure(app, db, 'ORM', orm_path)
+        projected = measure(app, db, 'projected', projected_path)
+
+    print()
+    print(f'Speedup: {orm / projected:.1f}x')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
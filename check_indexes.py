@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+"""
+Index Usage Check
+Seeds a throwaway database with 100k wardrobe items, runs the hot catalog,
+wardrobe, order and admin order queries through the real routes and asserts with EXPLAIN
+that none of them falls back to a full table scan.
+
+Usage:
+    python check_indexes.py                      # temporary SQLite database
+    DATABASE_URL=postgresql://... python check_indexes.py --postgres
+"""
+
+import os
+import re
+import sys
+import random
+import tempfile
+from datetime import datetime, timedelta, date
+
+ITEM_COUNT = 100_000
+USER_COUNT = 1_000
+ORDER_COUNT = 20_000
+
+CHECKED_TABLES = ('wardrobe_items', 'order_items', 'wardrobe_images', 'item_occupancy', 'orders')
+
+# Plan lines that mean a full scan of a checked table
+SQLITE_FULL_SCAN = re.compile(r'\bSCAN (%s)\b(?! USING)' % '|'.join(CHECKED_TABLES))
+POSTGRES_FULL_SCAN = re.compile(r'Seq Scan on (%s)\b' % '|'.join(CHECKED_TABLES))
+
+
+def seed(db):
+    """Insert users, items, images and orders with bulk executemany"""
+    from app.models import User, WardrobeItem, WardrobeImage, Order, OrderItem
+
+    random.seed(42)
+    now = datetime.utcnow()
+
+    db.session.execute(db.insert(User), [
+        {'id': i, 'name': f'User {i}', 'email': f'user{i}@example.com', 'password_hash': 'x', 'is_admin': i == 1}
+        for i in range(1, USER_COUNT + 1)
+    ])
+
+    categories = ['Camicie', 'Vestiti', 'Pantaloni', 'Giacche', 'Props', 'Accessori']
+    destinations = ['Bambino', 'Bambina', 'Stycly props', 'Stycly accessories', 'Stycly Vintage']
+    db.session.execute(db.insert(WardrobeItem), [
+        {
+            'id': i,
+            'user_id': random.randint(1, USER_COUNT),
+            'title': f'Capo {i}',
+            'description': 'Descrizione di prova',
+            'destination': random.choice(destinations),
+            'category': random.choice(categories),
+            'size': random.choice(['XS (0-1A)', 'S (2-3A)', 'M (4-5A)', 'L (6-7A)']),
+            'color': random.choice(['Rosa', 'Blu', 'Bianco', 'Beige']),
+            'condition': random.choice(['New', 'Like New', 'Good']),
+            'stock': random.randint(0, 3),
+            'is_public_for_rent': random.random() < 0.8,
+            'created_at': now - timedelta(minutes=i),
+            'updated_at': now - timedelta(minutes=i),
+        }
+        for i in range(1, ITEM_COUNT + 1)
+    ])
+
+    db.session.execute(db.insert(WardrobeImage), [
+        {'item_id': i, 'position': 0, 'variant': 'original', 'path': f'uploads/{i}.jpg'}
+        for i in range(1, ITEM_COUNT + 1)
+    ])
+
+    db.session.execute(db.insert(Order), [
+        {
+            'id': i, 'name': f'Cliente {i}', 'email': f'cliente{i}@example.com',
+            'start_date': date(2025, 1, 1), 'end_date': date(2025, 1, 5),
+            'status': random.choice(['pending', 'pending', 'confirmed', 'cancelled']),
+            'created_at': now - timedelta(minutes=i)
+        }
+        for i in range(1, ORDER_COUNT + 1)
+    ])
+    db.session.execute(db.insert(OrderItem), [
+        {'order_id': (i % ORDER_COUNT) + 1, 'wardrobe_item_id': random.randint(1, ITEM_COUNT), 'quantity': 1}
+        for i in range(ORDER_COUNT * 2)
+    ])
+
+    db.session.commit()
+    db.session.execute(db.text('ANALYZE'))
+    db.session.commit()
+
+
+def explain(db, statement, parameters, postgres):
+    """Return the query plan of a captured statement as text lines"""
+    prefix = 'EXPLAIN ' if postgres else 'EXPLAIN QUERY PLAN '
+    with db.engine.connect() as conn:
+        rows = conn.exec_driver_sql(prefix + statement, parameters).fetchall()
+    if postgres:
+        return [row[0] for row in rows]
+    return [row[-1] for row in rows]
+
+
+def main():
+    postgres = '--postgres' in sys.argv
+    if not postgres:
+        tmpdir = tempfile.mkdtemp()
+        os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(tmpdir, 'check_indexes.db')}"
+
+    from sqlalchemy import event
+    from app import create_app, db
+    from app.models import Order, OrderItem
+
+    app = create_app()
+
+    with app.app_context():
+        if postgres and db.session.execute(db.text('SELECT 1 FROM wardrobe_items LIMIT 1')).first():
+            print('Refusing to seed a non-empty PostgreSQL database.')
+            return 1
+
+        print(f'Seeding {ITEM_COUNT} items, {ORDER_COUNT} orders...')
+        seed(db)
+
+        captured = []
+
+        def capture(conn, cursor, statement, parameters, context, executemany):
+            if not executemany and any(table in statement for table in CHECKED_TABLES):
+                captured.append((statement, parameters))
+
+        event.listen(db.engine, 'before_cursor_execute', capture)
+
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['user_id'] = 1
+
+    checks = {
+        'shop.products (newest)': lambda: client.get('/shop/products'),
+        'shop.products (category)': lambda: client.get('/shop/products?category=Vestiti'),
+        'shop.products (title)': lambda: client.get('/shop/products?sort=title'),
+        'shop.products (rental dates)': lambda: client.get(
+            '/shop/products?start_date=2025-01-02&end_date=2025-01-04'
+        ),
+        'wardrobe.index': lambda: client.get('/wardrobe/'),
+        'admin.orders (newest)': lambda: client.get('/api/admin/orders'),
+        'admin.orders (status, dates)': lambda: client.get(
+            f'/api/admin/orders?status=confirmed&from={date.today() - timedelta(days=3)}'
+        ),
+    }
+
+    def order_queries():
+        # The query orders.confirmation runs to load an order with its
+        # items, plus the per-item lookup of rentals
+        with app.app_context():
+            Order.get_with_items(ORDER_COUNT // 2)
+            OrderItem.query.filter_by(wardrobe_item_id=ITEM_COUNT // 2).all()
+
+    checks['orders (items by order / by item)'] = order_queries
+
+    failures = 0
+    with app.app_context():
+        for name, run in checks.items():
+            captured.clear()
+            run()
+            statements = list(captured)
+
+            for statement, parameters in statements:
+                plan = explain(db, statement, parameters, postgres)
+                pattern = POSTGRES_FULL_SCAN if postgres else SQLITE_FULL_SCAN
+                full_scans = [line for line in plan if pattern.search(line)]
+                status = 'FAIL' if full_scans else 'ok'
+                if full_scans:
+                    failures += 1
+
+                print(f'[{status}] {name}')
+                print('       ' + ' '.join(statement.split())[:160])
+                for line in plan:
+                    print(f'         {line}')
+
+        event.remove(db.engine, 'before_cursor_execute', capture)
+
+    print()
+    if failures:
+        print(f'❌ {failures} statement(s) use a full table scan')
+        return 1
+    print('✅ All checked statements use indexes')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
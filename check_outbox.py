@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+Email Outbox Check
+Queues a batch of emails, delivers them to a local SMTP server and checks
+that every message arrived over a few reused connections, then that a
+failed delivery is retried with backoff once the server is back.
+
+Requires aiosmtpd (pip install aiosmtpd).
+
+Usage:
+    python check_outbox.py [emails]
+"""
+
+import os
+import socket
+import sys
+import tempfile
+from datetime import datetime
+
+DEFAULT_EMAILS = 40
+
+
+class CountingHandler:
+    """aiosmtpd handler counting messages and the connections they used"""
+
+    def __init__(self):
+        self.messages = 0
+        self.sessions = set()
+
+    async def handle_DATA(self, server, session, envelope):
+        self.messages += 1
+        self.sessions.add(id(session))
+        return '250 OK'
+
+
+def free_port():
+    """A TCP port nobody is listening on"""
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def main():
+    try:
+        from aiosmtpd.controller import Controller
+    except ImportError:
+        print('aiosmtpd is not installed: pip install aiosmtpd')
+        return 1
+
+    args = [arg for arg in sys.argv[1:] if not arg.startswith('--')]
+    count = int(args[0]) if args else DEFAULT_EMAILS
+
+    tmpdir = tempfile.mkdtemp()
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(tmpdir, 'outbox.db')}"
+    os.environ['OUTBOX_WORKER_THREAD'] = 'False'
+
+    from app import create_app, db
+    from app.models import EmailOutbox
+    from app.outbox import queue_email, drain_outbox, smtp_pool
+    from app.utils import send_email
+
+    handler = CountingHandler()
+    controller = Controller(handler, hostname='127.0.0.1', port=free_port())
+    controller.start()
+
+    app = create_app()
+    app.config.update(
+        MAIL_SERVER='127.0.0.1',
+        MAIL_PORT=controller.port,
+        MAIL_USE_TLS=False,
+        MAIL_USE_AUTH=False,
+        MAIL_DEFAULT_SENDER='noreply@stycly.test'
+    )
+    failures = 0
+
+    with app.app_context():
+        # A rolled back transaction must not leave emails behind
+        send_email('rollback@example.com', 'Never sent', '<p>-</p>')
+        db.session.rollback()
+
+        for i in range(count):
+            queue_email('check', f'user{i}@example.com', f'Messaggio {i}', f'<p>Messaggio {i}</p>')
+        db.session.commit()
+
+        sent, failed = drain_outbox(batch_size=count)
+        pending = EmailOutbox.query.filter_by(status='pending').count()
+        ok = sent == count and handler.messages == count and pending == 0
+        failures += not ok
+        print(f"[{'ok' if ok else 'FAIL'}] delivered {handler.messages}/{count} emails "
+              f"over {len(handler.sessions)} SMTP connection(s)")
+
+        ok = len(handler.sessions) <= app.config['MAIL_POOL_SIZE']
+        failures += not ok
+        print(f"[{'ok' if ok else 'FAIL'}] connections reused (pool size {app.config['MAIL_POOL_SIZE']})")
+
+        # Server down: the email stays pending with a later retry time
+        controller.stop()
+        smtp_pool.close_all()
+        entry = queue_email('check', 'retry@example.com', 'Riprova', '<p>Riprova</p>')
+        db.session.commit()
+        drain_outbox()
+        db.session.refresh(entry)
+        ok = entry.status == 'pending' and entry.attempts == 1 and entry.next_attempt_at > datetime.utcnow()
+        failures += not ok
+        print(f"[{'ok' if ok else 'FAIL'}] failed delivery scheduled for retry "
+              f"(attempts {entry.attempts}, last error: {entry.last_error})")
+
+        # Server back and retry due: delivered
+        controller = Controller(handler, hostname='127.0.0.1', port=app.config['MAIL_PORT'])
+        controller.start()
+        entry.next_attempt_at = datetime.utcnow()
+        db.session.commit()
+        drain_outbox()
+        db.session.refresh(entry)
+        ok = entry.status == 'sent' and handler.messages == count + 1
+        failures += not ok
+        print(f"[{'ok' if ok else 'FAIL'}] retried email delivered (attempts {entry.attempts})")
+
+        smtp_pool.close_all()
+        controller.stop()
+
+    if failures:
+        print(f'❌ {failures} check(s) failed')
+        return 1
+    print('✅ Outbox delivers, reuses connections and retries')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+Order Reservation Stress Test
+Many threads submit rental requests for the same few items at the same
+moment through /orders/submit, then the script checks that no item was
+booked beyond its stock on any day.
+
+Usage:
+    python stress_orders.py [threads]                  # temporary SQLite database (WAL)
+    DATABASE_URL=postgresql://... python stress_orders.py [threads] --postgres
+"""
+
+import os
+import sys
+import random
+import tempfile
+import threading
+from collections import Counter
+from datetime import date, timedelta
+
+DEFAULT_THREADS = 32
+ITEM_COUNT = 5
+ITEM_STOCK = 3
+
+
+def seed(db):
+    """Insert one user and a few popular items"""
+    from app.models import User, WardrobeItem
+
+    user = User(name='Stress', email='stress@example.com')
+    user.set_password('stress-test')
+    db.session.add(user)
+    db.session.flush()
+
+    items = [
+        WardrobeItem(user_id=user.id, title=f'Capo conteso {i}', category='Vestiti',
+                     destination='Bambina', stock=ITEM_STOCK, is_public_for_rent=True)
+        for i in range(ITEM_COUNT)
+    ]
+    db.session.add_all(items)
+    db.session.commit()
+    return [item.id for item in items]
+
+
+def shopper(app, item_ids, start, end, barrier, results):
+    """Fill a cart with the contended items (random order) and submit it"""
+    client = app.test_client()
+    wanted = random.sample(item_ids, k=random.randint(1, len(item_ids)))
+    for item_id in wanted:
+        client.post('/shop/cart/add', json={'item_id': item_id})
+
+    barrier.wait()
+    response = client.post('/orders/submit', data={
+        'name': 'Cliente',
+        'email': 'cliente@example.com',
+        'start_date': start.isoformat(),
+        'end_date': end.isoformat(),
+        'privacy': 'on'
+    })
+    location = response.headers.get('Location', '')
+    results.append('confirmed' if '/orders/confirmation/' in location else 'refused')
+
+
+def main():
+    args = [arg for arg in sys.argv[1:] if not arg.startswith('--')]
+    threads = int(args[0]) if args else DEFAULT_THREADS
+    postgres = '--postgres' in sys.argv
+
+    if not postgres:
+        tmpdir = tempfile.mkdtemp()
+        os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(tmpdir, 'stress.db')}"
+
+    from sqlalchemy import func
+    from app import create_app, db
+    from app.models import WardrobeItem, Order, OrderItem, ItemOccupancy
+
+    app = create_app()
+    app.config['MAIL_SUPPRESS_SEND'] = True
+    # Holds would stop shoppers at the cart stage; this tests the order stage
+    app.config['CART_HOLD_MINUTES'] = 0
+
+    with app.app_context():
+        if postgres and db.session.execute(db.text('SELECT 1 FROM orders LIMIT 1')).first():
+            print('Refusing to run against a non-empty PostgreSQL database.')
+            return 1
+        item_ids = seed(db)
+
+    start = date.today() + timedelta(days=7)
+    end = start + timedelta(days=4)
+
+    print(f'{threads} shoppers competing for {ITEM_COUNT} items x {ITEM_STOCK} units '
+          f'({app.config["SQLALCHEMY_DATABASE_URI"].split(":")[0]})...')
+
+    barrier = threading.Barrier(threads)
+    results = []
+    workers = [
+        threading.Thread(target=shopper, args=(app, item_ids, start, end, barrier, results))
+        for _ in range(threads)
+    ]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+    failures = 0
+    with app.app_context():
+        booked = dict(db.session.execute(
+            db.select(OrderItem.wardrobe_item_id, func.sum(OrderItem.quantity))
+            .join(Order, Order.id == OrderItem.order_id)
+            .group_by(OrderItem.wardrobe_item_id)
+        ).all())
+        peak = dict(db.session.execute(
+            db.select(ItemOccupancy.item_id, func.max(ItemOccupancy.quantity))
+            .group_by(ItemOccupancy.item_id)
+        ).all())
+
+        for item_id in item_ids:
+            stock = db.session.get(WardrobeItem, item_id).stock
+            units = booked.get(item_id, 0)
+            status = 'ok'
+            if units > stock or peak.get(item_id, 0) != units:
+                status = 'FAIL'
+                failures += 1
+            print(f'[{status}] item {item_id}: {units}/{stock} units booked, '
+                  f'peak daily occupancy {peak.get(item_id, 0)}')
+
+    counts = Counter(results)
+    print(f"\n{counts['confirmed']} orders confirmed, {counts['refused']} refused")
+    if failures:
+        print(f'❌ {failures} item(s) overbooked or with inconsistent occupancy')
+        return 1
+    print('✅ No item was booked beyond its stock')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())